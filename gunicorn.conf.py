@@ -0,0 +1,22 @@
+# Gunicorn loads this file from the working directory on startup
+import os
+import shutil
+import tempfile
+
+
+# Aggregate Prometheus metrics across workers. Workers inherit this from the master process
+prometheus_multiproc_dir = os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "flint-prometheus")
+)
+
+
+def on_starting(server):
+    # Clear metrics left behind by previous runs
+    shutil.rmtree(prometheus_multiproc_dir, ignore_errors=True)
+    os.makedirs(prometheus_multiproc_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
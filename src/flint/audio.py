@@ -0,0 +1,126 @@
+# Standard Packages
+from dataclasses import dataclass
+import struct
+from typing import Iterator, Optional
+
+
+# Capture pattern, version, header type, granule position, serial number, page sequence number, CRC, segment count
+OGG_PAGE_HEADER = struct.Struct("<4sBBqIIIB")
+# Largest possible Ogg page: header, 255 segment lengths and 255 segments of 255 bytes
+OGG_MAX_PAGE_SIZE = OGG_PAGE_HEADER.size + 255 + 255 * 255
+# Opus granule positions always count samples at 48kHz, whatever the input sample rate
+OPUS_GRANULE_RATE = 48000
+
+
+class AudioTooLongError(ValueError):
+    "Audio is longer than we are willing to transcribe"
+
+
+@dataclass
+class OggPage:
+    start: int
+    end: int
+    granule_position: int
+    body: bytes
+
+
+@dataclass
+class OggInfo:
+    "Timing of the audio stream in an Ogg container. Sample positions convert to seconds at granule_rate"
+
+    granule_rate: int
+    pre_skip: int
+    duration: float
+
+    def position_to_seconds(self, granule_position: int) -> float:
+        return max(0, granule_position - self.pre_skip) / self.granule_rate
+
+
+def parse_page(data: bytes, offset: int) -> Optional[OggPage]:
+    "Parse the Ogg page at offset. Returns None if there is no complete page there"
+    if offset + OGG_PAGE_HEADER.size > len(data):
+        return None
+    capture, _, _, granule_position, _, _, _, segment_count = OGG_PAGE_HEADER.unpack_from(data, offset)
+    if capture != b"OggS":
+        return None
+    body_start = offset + OGG_PAGE_HEADER.size + segment_count
+    body_end = body_start + sum(data[offset + OGG_PAGE_HEADER.size : body_start])
+    if body_end > len(data):
+        return None
+    return OggPage(offset, body_end, granule_position, data[body_start:body_end])
+
+
+def iter_pages(data: bytes) -> Iterator[OggPage]:
+    offset = 0
+    while page := parse_page(data, offset):
+        yield page
+        offset = page.end
+
+
+def probe_ogg(data: bytes) -> Optional[OggInfo]:
+    """
+    Get the duration of Ogg Opus or Vorbis audio from its container headers, without decoding it.
+    The duration is the granule position of the last page, less the Opus pre-skip, at the codec's granule rate.
+    Returns None when the data is not Ogg audio we understand
+    """
+    first_page = parse_page(data, 0)
+    if first_page is None:
+        return None
+    if first_page.body.startswith(b"OpusHead") and len(first_page.body) >= 12:
+        granule_rate = OPUS_GRANULE_RATE
+        pre_skip = struct.unpack_from("<H", first_page.body, 10)[0]
+    elif first_page.body.startswith(b"\x01vorbis") and len(first_page.body) >= 16:
+        granule_rate = struct.unpack_from("<I", first_page.body, 12)[0]
+        pre_skip = 0
+    else:
+        return None
+    if granule_rate == 0:
+        return None
+
+    # Find the last complete page with a granule position, scanning back from the end of the data
+    search_end = len(data)
+    search_start = max(0, len(data) - OGG_MAX_PAGE_SIZE)
+    last_granule_position = None
+    while last_granule_position is None:
+        offset = data.rfind(b"OggS", search_start, search_end)
+        if offset == -1:
+            if search_start == 0:
+                return None
+            search_end = search_start + 4
+            search_start = max(0, search_start - OGG_MAX_PAGE_SIZE)
+            continue
+        page = parse_page(data, offset)
+        if page and page.granule_position != -1:
+            last_granule_position = page.granule_position
+        search_end = offset
+
+    info = OggInfo(granule_rate, pre_skip, duration=0.0)
+    info.duration = info.position_to_seconds(last_granule_position)
+    return info
+
+
+def trim_ogg(data: bytes, info: OggInfo, max_duration: float) -> bytes:
+    """
+    Cut Ogg audio at the last page boundary within max_duration seconds.
+    Whole pages are kept, so the trimmed audio stays a valid stream without re-encoding
+    """
+    end = 0
+    for page in iter_pages(data):
+        if page.granule_position != -1 and info.position_to_seconds(page.granule_position) > max_duration:
+            break
+        end = page.end
+    return data[:end]
+
+
+def limit_audio_duration(data: bytes, max_duration: float, trim: bool) -> bytes:
+    """
+    Check voice note duration before paying to upload and transcribe it.
+    Over-long audio is trimmed to max_duration, or rejected with AudioTooLongError.
+    Audio of unknown format or duration is passed through as is
+    """
+    info = probe_ogg(data)
+    if info is None or info.duration <= max_duration:
+        return data
+    if not trim:
+        raise AudioTooLongError(f"Audio is {info.duration:.0f} seconds long, over the {max_duration:.0f} second limit")
+    return trim_ogg(data, info, max_duration)
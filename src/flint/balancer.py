@@ -0,0 +1,144 @@
+# Standard Packages
+import asyncio
+from contextlib import asynccontextmanager
+import logging
+import time
+from typing import AsyncIterator, Callable
+import zlib
+
+# External Packages
+import httpx
+
+# Internal Packages
+from flint.resilience import CircuitOpenError, GuardedBackend, RequestOutcome
+
+
+logger = logging.getLogger(__name__)
+
+
+class Replica:
+    "A backend replica, its health and its recent latency"
+
+    def __init__(self, url: str, guard: GuardedBackend, initial_latency: float = 1.0, latency_decay: float = 0.2):
+        self.url = url
+        self.guard = guard
+        self.healthy = True
+        self.failed_probes = 0
+        self.latency = initial_latency
+        self.latency_decay = latency_decay
+
+    @property
+    def available(self) -> bool:
+        "Whether the replica's circuit breaker lets requests through"
+        return self.guard.breaker.accepting_requests
+
+    @property
+    def load(self) -> float:
+        "Expected wait for a new request: requests in flight, plus this one, at the replica's typical latency"
+        return (self.guard.limiter.in_flight + 1) * self.latency
+
+    def observe_latency(self, latency: float):
+        # Exponentially weighted moving average, so the replica's latency tracks recent requests
+        self.latency += self.latency_decay * (latency - self.latency)
+
+    def stats(self) -> dict:
+        return {"healthy": self.healthy, "latency": round(self.latency, 3), **self.guard.stats()}
+
+
+class BackendPool:
+    """
+    Spread requests over backend replicas.
+
+    Requests go to the replica with the least expected wait, from its requests in flight and latency.
+    With sticky routing, requests with the same key go to the same replica while it is up, to keep its caches warm.
+    Replicas are ejected while they fail health checks, or while their circuit breaker is open
+    """
+
+    def __init__(
+        self,
+        name: str,
+        replicas: list[Replica],
+        sticky: bool = False,
+        health_check_path: str = "/api/health",
+        health_check_interval: float = 10.0,
+        health_check_timeout: float = 5.0,
+        unhealthy_threshold: int = 2,
+        get_client: Callable[[], httpx.AsyncClient] = None,
+    ):
+        self.name = name
+        self.replicas = replicas
+        self.sticky = sticky
+        self.health_check_path = health_check_path
+        self.health_check_interval = health_check_interval
+        self.health_check_timeout = health_check_timeout
+        self.unhealthy_threshold = unhealthy_threshold
+        self.get_client = get_client
+        self._health_checks: asyncio.Task = None
+
+    def pick(self, key: str = None) -> Replica:
+        "Choose the replica to send a request to. Raises CircuitOpenError when no replica can take requests"
+        candidates = [replica for replica in self.replicas if replica.available]
+        # Ignore failing health checks when every replica fails them, rather than refusing all requests
+        candidates = [replica for replica in candidates if replica.healthy] or candidates
+        if not candidates:
+            raise CircuitOpenError(f"No {self.name} backend is available")
+        if self.sticky and key:
+            # Rendezvous hashing only moves the keys of a replica that goes down
+            return max(candidates, key=lambda replica: zlib.crc32(f"{key}|{replica.url}".encode()))
+        return min(candidates, key=lambda replica: replica.load)
+
+    @asynccontextmanager
+    async def request(self, key: str = None) -> AsyncIterator[tuple[Replica, RequestOutcome]]:
+        "Guard a request to the chosen replica. Raises BackendBusyError when no replica should be called"
+        replica = self.pick(key)
+        start_time = time.monotonic()
+        try:
+            async with replica.guard.request() as outcome:
+                yield replica, outcome
+        finally:
+            # Slow failures, like timeouts, count too, to steer requests away from struggling replicas
+            replica.observe_latency(time.monotonic() - start_time)
+
+    def start_health_checks(self):
+        # Without other replicas to fail over to, an unhealthy replica still gets every request
+        if len(self.replicas) < 2:
+            return
+        self._health_checks = asyncio.create_task(self._check_health())
+
+    async def stop_health_checks(self):
+        if self._health_checks:
+            self._health_checks.cancel()
+            await asyncio.gather(self._health_checks, return_exceptions=True)
+            self._health_checks = None
+
+    async def _check_health(self):
+        while True:
+            await asyncio.gather(*[self._probe(replica) for replica in self.replicas])
+            await asyncio.sleep(self.health_check_interval)
+
+    async def _probe(self, replica: Replica):
+        try:
+            response = await self.get_client().get(
+                f"{replica.url}{self.health_check_path}", timeout=self.health_check_timeout
+            )
+            ok = response.is_success
+        except httpx.HTTPError:
+            ok = False
+
+        if ok:
+            if not replica.healthy:
+                logger.info("%s backend %s is healthy again", self.name, replica.url)
+            replica.healthy = True
+            replica.failed_probes = 0
+            return
+
+        replica.failed_probes += 1
+        if replica.healthy and replica.failed_probes >= self.unhealthy_threshold:
+            logger.warning(
+                "%s backend %s failed %d health checks. Ejecting it", self.name, replica.url, replica.failed_probes
+            )
+            replica.healthy = False
+
+    def stats(self) -> list[dict]:
+        "Stats of each replica, identified by its position in the pool rather than by its internal URL"
+        return [{"replica": index, **replica.stats()} for index, replica in enumerate(self.replicas)]
@@ -0,0 +1,204 @@
+"""
+Load test Flint against local stand-ins for the Graph, Khoj and OpenAI APIs.
+
+Start Flint pointed at the stand-ins, then replay recorded or synthetic webhooks at it:
+    WHATSAPP_API_URL=http://localhost:9000 KHOJ_API_URL=http://localhost:9000 \\
+    OPENAI_BASE_URL=http://localhost:9000/v1 flint
+    python -m flint.bench replay --synthetic 500 --rate 20 --mock-port 9000
+
+Record real webhook bodies by running Flint with WEBHOOK_RECORD_PATH set, and replay them with --recording.
+
+Guard worker startup time and memory:
+    python -m flint.bench startup --max-seconds 1.5 --max-rss-mb 120
+
+Evaluate Khoj chat latency and errors on a JSONL file of prompts, against the configured Khoj or a stand-in:
+    python -m flint.bench evaluate --prompts prompts.jsonl --parallelism 8 --max-p95 30
+"""
+# Standard Packages
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+
+# Internal Packages
+from flint.bench.evaluate import check_evaluation, evaluate, load_prompts
+from flint.bench.mocks import MockState, create_mock_app, parse_profiles, start_mock_server
+from flint.bench.replay import load_recording, make_synthetic_bodies, replay
+from flint.bench.startup import check_startup, measure_startup
+
+
+logger = logging.getLogger(__name__)
+
+
+def add_mock_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--mock-host", default="127.0.0.1", help="Host to serve the stand-in APIs on")
+    parser.add_argument("--mock-port", type=int, default=9000, help="Port to serve the stand-in APIs on")
+    parser.add_argument(
+        "--latency",
+        action="append",
+        metavar="NAME=MEDIAN[,SIGMA]",
+        help="Log-normal latency of a stand-in endpoint, in seconds. E.g khoj_chat=3,0.5",
+    )
+    parser.add_argument(
+        "--error-rate",
+        action="append",
+        metavar="NAME=RATE",
+        help="Fraction of requests to a stand-in endpoint that fail. E.g graph_messages=0.01",
+    )
+    parser.add_argument("--media-size", type=int, default=64 * 1024, help="Size of media served, in bytes")
+    parser.add_argument("--media-mime-type", default="audio/ogg", help="Mime type of media served")
+    parser.add_argument("--response-chars", type=int, default=600, help="Length of Khoj chat responses")
+
+
+def make_mock_state(args: argparse.Namespace) -> MockState:
+    return MockState(
+        media_size=args.media_size,
+        media_mime_type=args.media_mime_type,
+        response_chars=args.response_chars,
+    )
+
+
+async def serve_mocks(args: argparse.Namespace):
+    state = make_mock_state(args)
+    app = create_mock_app(parse_profiles(args.latency, args.error_rate), state)
+    server = await start_mock_server(app, args.mock_host, args.mock_port)
+    while not server.should_exit:
+        await asyncio.sleep(1)
+
+
+async def run_replay(args: argparse.Namespace):
+    if args.recording:
+        bodies = load_recording(args.recording)
+    else:
+        bodies = make_synthetic_bodies(args.synthetic)
+    if not bodies:
+        logger.error("No webhook bodies to replay")
+        return
+
+    state = make_mock_state(args)
+    app = create_mock_app(parse_profiles(args.latency, args.error_rate), state)
+    server = await start_mock_server(app, args.mock_host, args.mock_port)
+    try:
+        logger.info("Replaying %d webhooks to %s at %s/s", len(bodies), args.target, args.rate)
+        report = await replay(
+            bodies,
+            args.target,
+            args.rate,
+            state,
+            reply_timeout=args.reply_timeout,
+            app_secret=args.app_secret,
+        )
+    finally:
+        server.should_exit = True
+    print(json.dumps(report, indent=2))
+
+
+async def run_evaluate(args: argparse.Namespace) -> int:
+    prompts = load_prompts(args.prompts)
+    if not prompts:
+        logger.error("No prompts to evaluate")
+        return 1
+
+    server = None
+    if args.mock:
+        app = create_mock_app(parse_profiles(args.latency, args.error_rate), make_mock_state(args))
+        server = await start_mock_server(app, args.mock_host, args.mock_port)
+        # Point Flint at the stand-in before its Khoj backends are configured, on import
+        os.environ["KHOJ_API_URLS"] = f"http://{args.mock_host}:{args.mock_port}"
+    from flint.clients import close_clients
+    from flint.helpers import send_message_to_khoj_chat
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    try:
+        logger.info("Evaluating %d prompts, %d at a time", len(prompts), args.parallelism)
+        report = await evaluate(prompts, send_message_to_khoj_chat, args.parallelism, args.phone_number)
+    finally:
+        await close_clients()
+        if server:
+            server.should_exit = True
+    print(json.dumps(report, indent=2))
+
+    failures = check_evaluation(report, args.max_p95, args.max_error_rate)
+    for failure in failures:
+        logger.error(failure)
+    return 1 if failures else 0
+
+
+def run_startup(args: argparse.Namespace) -> int:
+    report = measure_startup(args.runs)
+    print(json.dumps(report, indent=2))
+    failures = check_startup(report, args.max_seconds, args.max_rss_mb)
+    for failure in failures:
+        logger.error(failure)
+    return 1 if failures else 0
+
+
+def cli(args=None):
+    parser = argparse.ArgumentParser(prog="python -m flint.bench", description="Load test and evaluate Flint")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    mock_parser = subparsers.add_parser("mock", help="Serve stand-ins for the Graph, Khoj and OpenAI APIs")
+    add_mock_arguments(mock_parser)
+
+    replay_parser = subparsers.add_parser("replay", help="Replay webhooks at Flint and report latency, throughput")
+    add_mock_arguments(replay_parser)
+    source = replay_parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--recording", help="JSONL file of webhook bodies recorded via WEBHOOK_RECORD_PATH")
+    source.add_argument("--synthetic", type=int, help="Number of synthetic text message webhooks to replay")
+    replay_parser.add_argument("--target", default="http://127.0.0.1:8488", help="Base URL of Flint")
+    replay_parser.add_argument("--rate", type=float, default=10.0, help="Webhooks to send per second")
+    replay_parser.add_argument(
+        "--reply-timeout", type=float, default=120.0, help="Seconds to wait for a reply to each message"
+    )
+
+    replay_parser.add_argument(
+        "--app-secret",
+        default=os.getenv("WHATSAPP_APP_SECRET"),
+        help="Sign webhooks with this Meta app secret. Defaults to WHATSAPP_APP_SECRET",
+    )
+
+    startup_parser = subparsers.add_parser("startup", help="Measure worker import time and memory against budgets")
+    startup_parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters to import the app in")
+    startup_parser.add_argument("--max-seconds", type=float, help="Fail if the median import time is over this")
+    startup_parser.add_argument("--max-rss-mb", type=float, help="Fail if peak memory after import is over this")
+
+    evaluate_parser = subparsers.add_parser(
+        "evaluate", help="Send prompts to Khoj concurrently and report latency, errors and response size per command"
+    )
+    add_mock_arguments(evaluate_parser)
+    evaluate_parser.add_argument(
+        "--prompts", required=True, help='JSONL file of prompts, like {"prompt": "...", "command": "/online"}'
+    )
+    evaluate_parser.add_argument("--parallelism", type=int, default=8, help="Prompts to send at once")
+    evaluate_parser.add_argument(
+        "--phone-number", default="10000000000", help="Phone number of the Khoj user to chat as"
+    )
+    evaluate_parser.add_argument(
+        "--mock", action="store_true", help="Evaluate against a local stand-in for Khoj, instead of KHOJ_API_URLS"
+    )
+    evaluate_parser.add_argument("--max-p95", type=float, help="Fail if the p95 latency of any command is over this")
+    evaluate_parser.add_argument(
+        "--max-error-rate", type=float, help="Fail if the error rate of any command is over this"
+    )
+
+    return parser.parse_args(args)
+
+
+def run():
+    args = cli()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    if args.command == "mock":
+        asyncio.run(serve_mocks(args))
+    elif args.command == "replay":
+        asyncio.run(run_replay(args))
+    elif args.command == "evaluate":
+        sys.exit(asyncio.run(run_evaluate(args)))
+    else:
+        sys.exit(run_startup(args))
+
+
+if __name__ == "__main__":
+    run()
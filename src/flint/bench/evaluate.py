@@ -0,0 +1,139 @@
+# Standard Packages
+import asyncio
+from collections import defaultdict
+from dataclasses import dataclass
+import json
+import logging
+import statistics
+import time
+from typing import Awaitable, Callable, Optional
+
+# Internal Packages
+from flint.bench.replay import _round, percentile
+
+
+logger = logging.getLogger(__name__)
+
+# Commands reported on their own. Prompts without one of these are reported under the default command
+EVAL_COMMANDS = ("/online", "/dream", "/notes", "/general")
+
+ChatFunction = Callable[[str, str], Awaitable[dict]]
+
+
+@dataclass
+class EvalResult:
+    "Outcome of a prompt sent to Khoj: how long it took, how large the response was and why it failed, if it did"
+
+    command: str
+    latency: float
+    response_chars: int
+    error: Optional[str] = None
+
+
+def parse_prompts(lines: list[str]) -> list[str]:
+    """
+    Parse JSONL prompts, like {"prompt": "What is the weather in Paris?", "command": "/online"}.
+    The command is optional, and can also be given at the start of the prompt
+    """
+    prompts = []
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            entry = json.loads(line)
+            prompt = entry["prompt"]
+        except (ValueError, KeyError, TypeError) as e:
+            raise ValueError(f"Invalid prompt on line {number}: {e!r}") from e
+        command = entry.get("command")
+        prompts.append(f"{command} {prompt}" if command and not prompt.startswith(command) else prompt)
+    return prompts
+
+
+def load_prompts(path: str) -> list[str]:
+    with open(path) as f:
+        return parse_prompts(f.readlines())
+
+
+def get_command(prompt: str) -> str:
+    return next((command for command in EVAL_COMMANDS if prompt.startswith(command)), "/default")
+
+
+async def evaluate_prompt(prompt: str, user_number: str, chat: ChatFunction) -> EvalResult:
+    start_time = time.perf_counter()
+    try:
+        chat_response = await chat(prompt, user_number)
+    except Exception as e:
+        logger.warning("Failed to evaluate prompt %r: %r", prompt[:50], e)
+        return EvalResult(get_command(prompt), time.perf_counter() - start_time, 0, error=type(e).__name__)
+    latency = time.perf_counter() - start_time
+
+    # Text responses are strings. Image responses hold the image, or its URL, in a dictionary
+    response = chat_response.get("response") or chat_response.get("detail") or ""
+    if isinstance(response, dict):
+        response = response.get("image") or ""
+    error = chat_response.get("error") or (None if response else "empty_response")
+    return EvalResult(get_command(prompt), latency, len(response), error=error)
+
+
+async def evaluate(
+    prompts: list[str], chat: ChatFunction, parallelism: int = 8, user_number: str = "10000000000"
+) -> dict:
+    "Send the prompts to Khoj, at most parallelism at a time, and report on latency, errors and response size"
+    slots = asyncio.Semaphore(parallelism)
+
+    async def run(prompt: str) -> EvalResult:
+        async with slots:
+            return await evaluate_prompt(prompt, user_number, chat)
+
+    start_time = time.perf_counter()
+    results = await asyncio.gather(*[run(prompt) for prompt in prompts])
+    return summarize_results(results, time.perf_counter() - start_time, parallelism)
+
+
+def summarize_results(results: list[EvalResult], duration: float, parallelism: int) -> dict:
+    by_command: dict[str, list[EvalResult]] = defaultdict(list)
+    for result in results:
+        by_command[result.command].append(result)
+    return {
+        "prompts": len(results),
+        "parallelism": parallelism,
+        "duration_seconds": round(duration, 2),
+        **summarize_command(results),
+        "commands": {command: summarize_command(by_command[command]) for command in sorted(by_command)},
+    }
+
+
+def summarize_command(results: list[EvalResult]) -> dict:
+    errors = [result for result in results if result.error]
+    error_counts: dict[str, int] = defaultdict(int)
+    for result in errors:
+        error_counts[result.error] += 1
+
+    # Latency of failed prompts, like fast rejections, would skew the latency of real responses
+    latencies = [result.latency for result in results if not result.error]
+    response_chars = [result.response_chars for result in results if not result.error]
+    return {
+        "count": len(results),
+        "error_rate": round(len(errors) / len(results), 3) if results else 0.0,
+        "errors": dict(error_counts),
+        "latency_seconds": {
+            "mean": _round(statistics.fmean(latencies)) if latencies else None,
+            **{f"p{p}": _round(percentile(latencies, p)) for p in (50, 95, 99)},
+        },
+        "response_chars": {
+            "p50": percentile(response_chars, 50),
+            "max": max(response_chars, default=None),
+        },
+    }
+
+
+def check_evaluation(report: dict, max_p95: Optional[float], max_error_rate: Optional[float]) -> list[str]:
+    "Get the latency and error budgets the report exceeds, across all prompts and per command"
+    failures = []
+    for name, summary in [("all commands", report), *report["commands"].items()]:
+        p95 = summary["latency_seconds"]["p95"]
+        if max_p95 is not None and p95 is not None and p95 > max_p95:
+            failures.append(f"p95 latency of {name} is {p95}s, over {max_p95}s")
+        if max_error_rate is not None and summary["error_rate"] > max_error_rate:
+            failures.append(f"Error rate of {name} is {summary['error_rate']}, over {max_error_rate}")
+    return failures
@@ -0,0 +1,237 @@
+# Standard Packages
+import asyncio
+from dataclasses import dataclass, field
+from io import BytesIO
+import itertools
+import logging
+import math
+import random
+import time
+
+# External Packages
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+import uvicorn
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class EndpointProfile:
+    "Latency and error distribution of a stand-in endpoint. Latency is log-normal around the median, in seconds"
+
+    median: float = 0.0
+    sigma: float = 0.0
+    error_rate: float = 0.0
+
+    def sample_latency(self) -> float:
+        if self.median <= 0:
+            return 0.0
+        return self.median * math.exp(self.sigma * random.gauss(0, 1))
+
+    async def simulate(self) -> bool:
+        "Wait for a sampled latency. Returns whether the request should fail"
+        await asyncio.sleep(self.sample_latency())
+        return random.random() < self.error_rate
+
+
+# Defaults roughly matching what the real services take
+DEFAULT_PROFILES = {
+    "graph_media_url": EndpointProfile(median=0.1, sigma=0.3),
+    "graph_media_download": EndpointProfile(median=0.2, sigma=0.4),
+    "graph_messages": EndpointProfile(median=0.15, sigma=0.3),
+    "graph_media_upload": EndpointProfile(median=0.3, sigma=0.4),
+    "khoj_chat": EndpointProfile(median=3.0, sigma=0.5),
+    "khoj_index": EndpointProfile(median=1.0, sigma=0.5),
+    "whisper": EndpointProfile(median=1.5, sigma=0.4),
+}
+
+
+@dataclass
+class Reply:
+    received_at: float
+    phone_number_id: str
+    payload: dict
+
+
+@dataclass
+class MockState:
+    "Replies sent by Flint to the stand-in Graph API, and waiters for replies to a recipient"
+
+    media_size: int = 64 * 1024
+    media_mime_type: str = "audio/ogg"
+    response_chars: int = 600
+    replies: list[Reply] = field(default_factory=list)
+    waiters: dict[str, list[asyncio.Future]] = field(default_factory=dict)
+
+    def add_reply(self, reply: Reply):
+        self.replies.append(reply)
+        recipient = reply.payload.get("to")
+        for waiter in self.waiters.pop(recipient, []):
+            if not waiter.done():
+                waiter.set_result(reply)
+
+    def wait_for_reply(self, recipient: str) -> asyncio.Future:
+        "Future resolved with the next reply sent to recipient"
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.setdefault(recipient, []).append(waiter)
+        return waiter
+
+
+def make_response_text(chars: int) -> str:
+    words = itertools.cycle("the quick brown fox jumps over a lazy dog while khoj thinks about it".split())
+    paragraphs: list[str] = []
+    paragraph: list[str] = []
+    while sum(len(p) + 2 for p in paragraphs) + sum(len(w) + 1 for w in paragraph) < chars:
+        paragraph.append(next(words))
+        if len(paragraph) == 40:
+            paragraphs.append(" ".join(paragraph) + ".")
+            paragraph = []
+    if paragraph:
+        paragraphs.append(" ".join(paragraph) + ".")
+    return "\n\n".join(paragraphs)
+
+
+def make_image(size: int = 512) -> bytes:
+    from PIL import Image
+
+    output = BytesIO()
+    Image.effect_noise((size, size), 64).convert("RGB").save(output, "WEBP")
+    return output.getvalue()
+
+
+def create_mock_app(profiles: dict[str, EndpointProfile] = None, state: MockState = None) -> FastAPI:
+    """
+    Stand-ins for the Graph API media, message and upload endpoints,
+    the Khoj chat and index endpoints, and the OpenAI Whisper endpoint
+    """
+    profiles = {**DEFAULT_PROFILES, **(profiles or {})}
+    state = state or MockState()
+    app = FastAPI()
+    app.state.mock = state
+    message_ids = itertools.count()
+    images: dict[str, bytes] = {}
+
+    def error_response():
+        return JSONResponse({"error": {"message": "Simulated failure", "code": 2}}, status_code=503)
+
+    # Khoj API
+    @app.get("/api/health")
+    async def khoj_health():
+        return Response(status_code=200)
+
+    @app.post("/api/chat")
+    async def khoj_chat(request: Request):
+        body = await request.json()
+        query = body.get("q", "")
+        profile = profiles["khoj_chat"]
+
+        if query.startswith("/image"):
+            if await profile.simulate():
+                return error_response()
+            return {"response": {"image": f"{str(request.base_url).rstrip('/')}/images/generated.webp"}}
+
+        text = make_response_text(state.response_chars)
+        if not body.get("stream"):
+            if await profile.simulate():
+                return error_response()
+            return {"response": text}
+
+        # Stream the response word by word over the sampled generation time
+        latency = profile.sample_latency()
+        if random.random() < profile.error_rate:
+            await asyncio.sleep(latency)
+            return error_response()
+        words = text.split(" ")
+
+        async def generate():
+            for word in words:
+                await asyncio.sleep(latency / len(words))
+                yield word + " "
+            yield "### compiled references:\n\n[]"
+
+        return StreamingResponse(generate(), media_type="text/plain")
+
+    @app.post("/api/v1/index/update")
+    async def khoj_index(request: Request):
+        await request.body()
+        if await profiles["khoj_index"].simulate():
+            return error_response()
+        return Response(status_code=200)
+
+    # OpenAI API
+    @app.post("/v1/audio/translations")
+    async def whisper(request: Request):
+        await request.body()
+        if await profiles["whisper"].simulate():
+            return error_response()
+        return {"text": make_response_text(80)}
+
+    # Generated images linked to from Khoj chat responses
+    @app.get("/images/{name}")
+    async def image(name: str):
+        if name not in images:
+            images[name] = await asyncio.to_thread(make_image)
+        return Response(images[name], media_type="image/webp")
+
+    # WhatsApp Cloud (Graph) API
+    @app.get("/media/{media_id}")
+    async def media_download(media_id: str):
+        if await profiles["graph_media_download"].simulate():
+            return error_response()
+        return Response(b"\0" * state.media_size, media_type=state.media_mime_type)
+
+    @app.post("/{version}/{phone_number_id}/messages")
+    async def messages(phone_number_id: str, request: Request):
+        payload = await request.json()
+        if await profiles["graph_messages"].simulate():
+            return error_response()
+        state.add_reply(Reply(time.time(), phone_number_id, payload))
+        return {"messaging_product": "whatsapp", "messages": [{"id": f"wamid.mock{next(message_ids)}"}]}
+
+    @app.post("/{version}/{phone_number_id}/media")
+    async def media_upload(request: Request):
+        await request.body()
+        if await profiles["graph_media_upload"].simulate():
+            return error_response()
+        return {"id": f"media.mock{next(message_ids)}"}
+
+    @app.get("/{version}/{media_id}/")
+    async def media_url(media_id: str, request: Request):
+        if await profiles["graph_media_url"].simulate():
+            return error_response()
+        return {
+            "url": f"{str(request.base_url).rstrip('/')}/media/{media_id}",
+            "mime_type": state.media_mime_type,
+            "file_size": state.media_size,
+            "id": media_id,
+            "messaging_product": "whatsapp",
+        }
+
+    return app
+
+
+def parse_profiles(latencies: list[str], error_rates: list[str]) -> dict[str, EndpointProfile]:
+    "Parse NAME=MEDIAN[,SIGMA] latencies and NAME=RATE error rates into endpoint profiles"
+    profiles = {name: EndpointProfile(p.median, p.sigma, p.error_rate) for name, p in DEFAULT_PROFILES.items()}
+    for latency in latencies or []:
+        name, value = latency.split("=")
+        median, _, sigma = value.partition(",")
+        profiles[name].median = float(median)
+        if sigma:
+            profiles[name].sigma = float(sigma)
+    for error_rate in error_rates or []:
+        name, value = error_rate.split("=")
+        profiles[name].error_rate = float(value)
+    return profiles
+
+
+async def start_mock_server(app: FastAPI, host: str, port: int) -> uvicorn.Server:
+    "Serve the stand-ins in the running event loop"
+    server = uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="warning"))
+    asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+    logger.info("Stand-in Graph, Khoj and OpenAI APIs listening on http://%s:%d", host, port)
+    return server
@@ -0,0 +1,184 @@
+# Standard Packages
+import asyncio
+import copy
+from dataclasses import dataclass
+import hashlib
+import hmac
+import itertools
+import json
+import logging
+import time
+from typing import Iterator, Optional, Sequence
+
+# External Packages
+import httpx
+
+# Internal Packages
+from flint.bench.mocks import MockState
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Delivery:
+    "A webhook delivery fired at Flint, and the timings of its acknowledgement and first reply"
+
+    sent_at: float
+    recipients: list[str]
+    acked_at: Optional[float] = None
+    status_code: Optional[int] = None
+    replied_at: Optional[float] = None
+
+
+def load_recording(path: str) -> list[dict]:
+    "Load webhook bodies recorded by the WebhookRecorder"
+    with open(path) as f:
+        return [json.loads(line)["body"] for line in f if line.strip()]
+
+
+def make_synthetic_bodies(count: int, phone_number_id: str = "100000000000000") -> list[dict]:
+    "Make text message webhook bodies, for runs without a recording"
+    return [
+        {
+            "object": "whatsapp_business_account",
+            "entry": [
+                {
+                    "id": "0",
+                    "changes": [
+                        {
+                            "field": "messages",
+                            "value": {
+                                "messaging_product": "whatsapp",
+                                "metadata": {"phone_number_id": phone_number_id},
+                                "messages": [
+                                    {
+                                        "from": "1",
+                                        "id": "wamid.synthetic",
+                                        "timestamp": "0",
+                                        "type": "text",
+                                        "text": {"body": f"What is the answer to question {i}?"},
+                                    }
+                                ],
+                            },
+                        }
+                    ],
+                }
+            ],
+        }
+        for i in range(count)
+    ]
+
+
+def iter_body_messages(body: dict) -> Iterator[dict]:
+    for entry in body.get("entry") or []:
+        for change in entry.get("changes") or []:
+            yield from (change.get("value") or {}).get("messages") or []
+
+
+def prepare_body(body: dict, sequence: int) -> tuple[dict, list[str]]:
+    """
+    Give every message in the body a unique id, a unique sender and a fresh timestamp.
+    So replays are not dropped as duplicates, and replies can be matched to the message they answer
+    """
+    body = copy.deepcopy(body)
+    recipients = []
+    for index, message in enumerate(iter_body_messages(body)):
+        sender = f"1555{sequence:07d}{index:02d}"
+        message["from"] = sender
+        message["id"] = f"wamid.replay.{time.time_ns()}.{sequence}.{index}"
+        message["timestamp"] = str(int(time.time()))
+        if message.get("type") != "reaction":
+            recipients.append(sender)
+    return body, recipients
+
+
+def percentile(values: Sequence[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = min(len(ordered) - 1, max(0, round(p / 100 * (len(ordered) - 1))))
+    return ordered[rank]
+
+
+async def replay(
+    bodies: list[dict],
+    target: str,
+    rate: float,
+    state: MockState,
+    reply_timeout: float = 120.0,
+    concurrency: int = 256,
+    app_secret: str = None,
+) -> dict:
+    "Fire webhook bodies at Flint at the target rate, and measure time until their first reply"
+    deliveries: list[Delivery] = []
+    limits = httpx.Limits(max_connections=concurrency)
+    slots = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(base_url=target, limits=limits, timeout=30.0) as client:
+
+        async def fire(body: dict, sequence: int):
+            body, recipients = prepare_body(body, sequence)
+            waiters = [state.wait_for_reply(recipient) for recipient in recipients]
+            delivery = Delivery(sent_at=time.time(), recipients=recipients)
+            deliveries.append(delivery)
+            async with slots:
+                try:
+                    content = json.dumps(body).encode()
+                    headers = {"Content-Type": "application/json"}
+                    if app_secret:
+                        # Sign the body like Meta does, for Flint instances that verify webhook signatures
+                        signature = hmac.new(app_secret.encode(), content, hashlib.sha256).hexdigest()
+                        headers["X-Hub-Signature-256"] = f"sha256={signature}"
+                    response = await client.post("/api/whatsapp_chat", content=content, headers=headers)
+                    delivery.status_code = response.status_code
+                except httpx.HTTPError as e:
+                    logger.warning("Failed to deliver webhook %d: %r", sequence, e)
+                    return
+                delivery.acked_at = time.time()
+            if not waiters:
+                return
+            try:
+                replies = await asyncio.wait_for(asyncio.gather(*waiters), timeout=reply_timeout)
+                delivery.replied_at = max(reply.received_at for reply in replies)
+            except asyncio.TimeoutError:
+                pass
+
+        start_time = time.time()
+        tasks = []
+        for sequence, body in zip(itertools.count(), bodies):
+            # Pace deliveries to the target rate
+            delay = start_time + sequence / rate - time.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(fire(body, sequence)))
+        await asyncio.gather(*tasks)
+        end_time = time.time()
+
+    return summarize(deliveries, start_time, end_time)
+
+
+def summarize(deliveries: list[Delivery], start_time: float, end_time: float) -> dict:
+    acked = [d for d in deliveries if d.status_code == 200]
+    replied = [d for d in deliveries if d.replied_at]
+    expecting_reply = [d for d in acked if d.recipients]
+    ack_latencies = [d.acked_at - d.sent_at for d in acked]
+    reply_latencies = [d.replied_at - d.sent_at for d in replied]
+    duration = end_time - start_time
+    last_reply = max((d.replied_at for d in replied), default=end_time)
+
+    return {
+        "deliveries": len(deliveries),
+        "acked": len(acked),
+        "replied": len(replied),
+        "timed_out": len(expecting_reply) - len(replied),
+        "duration_seconds": round(duration, 2),
+        "deliveries_per_second": round(len(deliveries) / duration, 2) if duration else None,
+        "messages_per_second": round(len(replied) / (last_reply - start_time), 2) if replied else 0.0,
+        "ack_latency_seconds": {f"p{p}": _round(percentile(ack_latencies, p)) for p in (50, 95, 99)},
+        "end_to_end_latency_seconds": {f"p{p}": _round(percentile(reply_latencies, p)) for p in (50, 95, 99)},
+    }
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 3) if value is not None else None
@@ -0,0 +1,70 @@
+# Standard Packages
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from typing import Optional
+
+
+# Modules only needed for some messages, or for benchmarks, which should not be imported when a worker starts
+LAZY_MODULES = ("openai", "PIL.Image", "flint.bench")
+
+# Import the app like a gunicorn worker does, then report import time, peak memory and lazy modules loaded
+_PROBE = """
+import json, resource, sys, time
+start_time = time.perf_counter()
+import flint.main
+import_seconds = time.perf_counter() - start_time
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+if sys.platform == "darwin":
+    rss_kb //= 1024
+print(json.dumps({
+    "import_seconds": import_seconds,
+    "max_rss_mb": rss_kb / 1024,
+    "lazy_modules_loaded": [name for name in %r if name in sys.modules],
+}))
+"""
+
+
+def measure_startup(runs: int = 5) -> dict:
+    "Import the app in fresh interpreters, and summarize the import time and peak memory of a worker"
+    samples = []
+    with tempfile.TemporaryDirectory() as data_dir:
+        # Keep the app's queue and caches out of the real data directory
+        env = {**os.environ, "FLINT_DATA_DIR": data_dir, "LOG_LEVEL": "WARNING"}
+        env.pop("DEBUG", None)
+        for _ in range(runs):
+            result = subprocess.run(
+                [sys.executable, "-c", _PROBE % (LAZY_MODULES,)],
+                env=env,
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+            samples.append(json.loads(result.stdout.strip().splitlines()[-1]))
+
+    import_seconds = [sample["import_seconds"] for sample in samples]
+    return {
+        "runs": runs,
+        "import_seconds": {
+            "min": round(min(import_seconds), 3),
+            "median": round(statistics.median(import_seconds), 3),
+            "max": round(max(import_seconds), 3),
+        },
+        "max_rss_mb": round(max(sample["max_rss_mb"] for sample in samples), 1),
+        "lazy_modules_loaded": sorted({name for sample in samples for name in sample["lazy_modules_loaded"]}),
+    }
+
+
+def check_startup(report: dict, max_seconds: Optional[float], max_rss_mb: Optional[float]) -> list[str]:
+    "Get the startup budgets the report exceeds"
+    failures = []
+    if max_seconds is not None and report["import_seconds"]["median"] > max_seconds:
+        failures.append(f"Median import time {report['import_seconds']['median']}s is over {max_seconds}s")
+    if max_rss_mb is not None and report["max_rss_mb"] > max_rss_mb:
+        failures.append(f"Peak memory {report['max_rss_mb']}MB is over {max_rss_mb}MB")
+    if report["lazy_modules_loaded"]:
+        failures.append(f"Modules that should load lazily were imported: {', '.join(report['lazy_modules_loaded'])}")
+    return failures
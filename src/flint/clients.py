@@ -0,0 +1,118 @@
+# Standard Packages
+import importlib.util
+import logging
+import os
+from typing import TYPE_CHECKING
+
+# External Packages
+import httpx
+
+if TYPE_CHECKING:
+    import openai
+
+# Internal Packages
+from flint.constants import (
+    KHOJ_API_CLIENT_ID,
+    KHOJ_API_CLIENT_SECRET,
+    KHOJ_CONNECT_TIMEOUT,
+    KHOJ_CHAT_READ_TIMEOUT,
+    HTTP_MAX_CONNECTIONS,
+    HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    HTTP_KEEPALIVE_EXPIRY,
+    WHATSAPP_API_TIMEOUT,
+    WHATSAPP_SEND_RATE,
+    WHATSAPP_SEND_BURST,
+    TENANTS_PATH,
+)
+from flint.tenants import Tenant, TenantRegistry
+
+
+logger = logging.getLogger(__name__)
+
+WHATSAPP_TOKEN = os.getenv("WHATSAPP_TOKEN")
+
+# Business numbers served by this deployment. Numbers without a tenant of their own use the credentials from the env
+tenants = TenantRegistry.load(
+    TENANTS_PATH,
+    default=Tenant(
+        phone_number_id="default",
+        whatsapp_token=WHATSAPP_TOKEN,
+        khoj_client_id=KHOJ_API_CLIENT_ID,
+        khoj_client_secret=KHOJ_API_CLIENT_SECRET,
+        send_rate=WHATSAPP_SEND_RATE,
+        send_burst=WHATSAPP_SEND_BURST,
+    ),
+)
+
+# Use HTTP/2 when the optional h2 package is installed
+HTTP2_ENABLED = importlib.util.find_spec("h2") is not None
+
+# Shared clients, created lazily on first use within the worker's event loop. Each tenant gets its own clients
+_http_clients: dict[str, httpx.AsyncClient] = {}
+_openai_client: "openai.AsyncOpenAI" = None
+
+
+def _make_http_client(timeout: httpx.Timeout, headers: dict = None) -> httpx.AsyncClient:
+    "Create an async HTTP client backed by a bounded, keep-alive connection pool"
+    limits = httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+    return httpx.AsyncClient(limits=limits, http2=HTTP2_ENABLED, timeout=timeout, headers=headers)
+
+
+def whatsapp_client(phone_number_id: str = None) -> httpx.AsyncClient:
+    "Client for the WhatsApp Cloud (Graph) API and its media downloads, with the credentials of the business number"
+    tenant = tenants.get(phone_number_id)
+    key = f"whatsapp:{tenant.phone_number_id}"
+    if key not in _http_clients:
+        _http_clients[key] = _make_http_client(
+            timeout=httpx.Timeout(WHATSAPP_API_TIMEOUT),
+            headers={"Authorization": f"Bearer {tenant.whatsapp_token}"},
+        )
+    return _http_clients[key]
+
+
+def khoj_client(phone_number_id: str = None) -> httpx.AsyncClient:
+    """
+    Client for the Khoj API, with the credentials of the business number.
+    Chat responses can take a while, so reads get a longer timeout
+    """
+    tenant = tenants.get(phone_number_id)
+    key = f"khoj:{tenant.phone_number_id}"
+    if key not in _http_clients:
+        _http_clients[key] = _make_http_client(
+            timeout=httpx.Timeout(KHOJ_CHAT_READ_TIMEOUT, connect=KHOJ_CONNECT_TIMEOUT),
+            headers={"Authorization": f"Bearer {tenant.khoj_client_secret}"},
+        )
+    return _http_clients[key]
+
+
+def http_client() -> httpx.AsyncClient:
+    "Unauthenticated client for fetching public URLs, like generated images"
+    if "http" not in _http_clients:
+        _http_clients["http"] = _make_http_client(timeout=httpx.Timeout(WHATSAPP_API_TIMEOUT))
+    return _http_clients["http"]
+
+
+def openai_client() -> "openai.AsyncOpenAI":
+    "OpenAI client sharing the same pooled transport settings. The openai package is only imported on first use"
+    global _openai_client
+    if _openai_client is None:
+        import openai
+
+        _openai_client = openai.AsyncOpenAI(http_client=_make_http_client(timeout=httpx.Timeout(600.0)))
+    return _openai_client
+
+
+async def close_clients():
+    "Close all shared clients and their connection pools"
+    global _openai_client
+    for client in _http_clients.values():
+        await client.aclose()
+    _http_clients.clear()
+    if _openai_client is not None:
+        await _openai_client.close()
+        _openai_client = None
+    logger.info("Closed shared HTTP clients")
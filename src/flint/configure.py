@@ -1,21 +1,64 @@
 # Standard Packages
+import atexit
 import os
 import logging
+from logging.handlers import QueueListener
+import queue
 
 # External Packages
 from fastapi import FastAPI
 
+# Internal Packages
+from flint.constants import LOG_LEVEL, LOG_SAMPLE_RATES
+from flint.logs import JsonFormatter, LazyQueueHandler, SamplingFilter, parse_sample_rates
+
 
 DEBUG = os.getenv("DEBUG", False)
 logger = logging.getLogger(__name__)
 
 
+def configure_logging():
+    """
+    Configure logging. Use Rich for readable logs when debugging.
+    Otherwise write compact JSON logs from a background thread, sampling high volume log lines
+    """
+    root_logger = logging.getLogger()
+    if DEBUG:
+        from rich.logging import RichHandler
+
+        rich_handler = RichHandler(rich_tracebacks=True)
+        rich_handler.setFormatter(fmt=logging.Formatter(fmt="%(message)s", datefmt="[%X]"))
+        logging.basicConfig(handlers=[rich_handler], level=logging.DEBUG)
+        return
+
+    # Format and write log records in a listener thread, so logging never blocks the event loop on I/O
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(JsonFormatter())
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, stream_handler)
+    listener.start()
+    atexit.register(listener.stop)
+
+    queue_handler = LazyQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(parse_sample_rates(LOG_SAMPLE_RATES)))
+    root_logger.handlers = [queue_handler]
+    root_logger.setLevel(LOG_LEVEL)
+
+    # Send server logs through the same handler, at the same level
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access", "gunicorn.error", "gunicorn.access"):
+        logging.getLogger(name).handlers = []
+        logging.getLogger(name).propagate = True
+        logging.getLogger(name).setLevel(LOG_LEVEL)
+
+
 def configure_routes(app: FastAPI):
     "Configure the API Routes"
     logger.info("Including routes")
     from flint.routers.api import api
+
     app.include_router(api, prefix="/api")
 
     if DEBUG:
         from flint.routers.dev import dev
+
         app.include_router(dev, prefix="/dev")
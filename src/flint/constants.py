@@ -27,6 +27,154 @@ KHOJ_MEDIA_NOT_IMPLEMENTED_MESSAGE = f"""
 Sorry, I'm not yet able to process this type of media. Could you please try sending a different type of media? If you'd like to help me improve, email my creators at team@khoj.dev.
 """.strip()
 
-KHOJ_API_URL = os.getenv("KHOJ_API_URL", "https://app.khoj.dev")
+KHOJ_UNIMPLEMENTED_COMMAND_MESSAGE = f"""
+Sorry, that command is not yet implemented. Try another one! Let us know if you want this sooner by emailing team@khoj.dev
+""".strip()
+
+KHOJ_BUSY_MESSAGE = f"""
+Sorry, I'm a little overwhelmed right now 😅. Could you please try again in a few minutes?
+""".strip()
+
+KHOJ_INTERRUPTED_MESSAGE = f"""
+Sorry, I lost my train of thought and couldn't finish my answer 😅. Could you please ask again if you need the rest?
+""".strip()
+
+KHOJ_EXPIRED_MESSAGE = f"""
+Sorry, I was too busy to get to your message in time 😅. Could you please send it again?
+""".strip()
+
+KHOJ_API_URL = os.getenv("KHOJ_API_URL", "https://app.khoj.dev").rstrip("/")
+# Comma separated Khoj replicas to spread requests over. Defaults to KHOJ_API_URL
+KHOJ_API_URLS = [url.strip().rstrip("/") for url in os.getenv("KHOJ_API_URLS", KHOJ_API_URL).split(",") if url.strip()]
+# Send each user's requests to the same Khoj replica while it is up, to keep its caches warm
+KHOJ_STICKY_ROUTING = os.getenv("KHOJ_STICKY_ROUTING", "false").lower() == "true"
+# Eject Khoj replicas that fail this many health checks in a row, until they pass one again
+KHOJ_HEALTH_CHECK_INTERVAL = float(os.getenv("KHOJ_HEALTH_CHECK_INTERVAL", 10))
+KHOJ_HEALTH_CHECK_TIMEOUT = float(os.getenv("KHOJ_HEALTH_CHECK_TIMEOUT", 5))
+KHOJ_UNHEALTHY_THRESHOLD = int(os.getenv("KHOJ_UNHEALTHY_THRESHOLD", 2))
 KHOJ_API_CLIENT_ID = os.getenv("KHOJ_API_CLIENT_ID")
 KHOJ_API_CLIENT_SECRET = os.getenv("KHOJ_API_CLIENT_SECRET")
+
+# Timeouts for requests to Khoj, in seconds
+KHOJ_CONNECT_TIMEOUT = float(os.getenv("KHOJ_CONNECT_TIMEOUT", 10))
+KHOJ_CHAT_READ_TIMEOUT = float(os.getenv("KHOJ_CHAT_READ_TIMEOUT", 120))
+KHOJ_INDEX_READ_TIMEOUT = float(os.getenv("KHOJ_INDEX_READ_TIMEOUT", 300))
+
+# Adaptive concurrency limit for requests to Khoj, per worker
+KHOJ_CONCURRENCY_INITIAL = int(os.getenv("KHOJ_CONCURRENCY_INITIAL", 16))
+KHOJ_CONCURRENCY_MIN = int(os.getenv("KHOJ_CONCURRENCY_MIN", 2))
+KHOJ_CONCURRENCY_MAX = int(os.getenv("KHOJ_CONCURRENCY_MAX", 128))
+KHOJ_CONCURRENCY_WAIT = float(os.getenv("KHOJ_CONCURRENCY_WAIT", 30))
+# Shed concurrency when recent Khoj requests take this many times longer than usual to start responding
+KHOJ_LATENCY_TOLERANCE = float(os.getenv("KHOJ_LATENCY_TOLERANCE", 2))
+
+# Stop calling Khoj for a cooldown once this share of recent requests failed
+KHOJ_BREAKER_ERROR_RATE = float(os.getenv("KHOJ_BREAKER_ERROR_RATE", 0.5))
+KHOJ_BREAKER_MIN_REQUESTS = int(os.getenv("KHOJ_BREAKER_MIN_REQUESTS", 10))
+KHOJ_BREAKER_WINDOW = float(os.getenv("KHOJ_BREAKER_WINDOW", 60))
+KHOJ_BREAKER_COOLDOWN = float(os.getenv("KHOJ_BREAKER_COOLDOWN", 30))
+
+# JSON file of tenants: the business phone numbers served, by phone number id, with their credentials and send rates
+TENANTS_PATH = os.getenv("TENANTS_PATH")
+
+# Base URL of the WhatsApp Cloud (Graph) API. Point it to a local stand-in for load tests
+WHATSAPP_API_URL = os.getenv("WHATSAPP_API_URL", "https://graph.facebook.com").rstrip("/")
+
+# Append every webhook body received to this JSONL file, to replay them later in load tests
+WEBHOOK_RECORD_PATH = os.getenv("WEBHOOK_RECORD_PATH")
+
+# Shared HTTP connection pool limits, per gunicorn worker
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", 200))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", 50))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", 120))
+WHATSAPP_API_TIMEOUT = float(os.getenv("WHATSAPP_API_TIMEOUT", 30))
+
+# Outbound WhatsApp message pacing, per worker. Rates are in messages per second
+WHATSAPP_SEND_RATE = float(os.getenv("WHATSAPP_SEND_RATE", 25))
+WHATSAPP_SEND_BURST = float(os.getenv("WHATSAPP_SEND_BURST", 50))
+WHATSAPP_RECIPIENT_SEND_RATE = float(os.getenv("WHATSAPP_RECIPIENT_SEND_RATE", 1))
+WHATSAPP_RECIPIENT_SEND_BURST = float(os.getenv("WHATSAPP_RECIPIENT_SEND_BURST", 10))
+WHATSAPP_SEND_MAX_ATTEMPTS = int(os.getenv("WHATSAPP_SEND_MAX_ATTEMPTS", 5))
+WHATSAPP_SEND_RETRY_BACKOFF = float(os.getenv("WHATSAPP_SEND_RETRY_BACKOFF", 1))
+
+# WhatsApp rejects text messages longer than this
+WHATSAPP_MAX_MESSAGE_LENGTH = 4096
+
+# Media larger than this is rejected, even mid-download. Media up to the spool size is never written to disk
+MEDIA_MAX_BYTES = int(os.getenv("MEDIA_MAX_BYTES", 10 * 1024 * 1024))
+MEDIA_SPOOL_MAX_MEMORY = int(os.getenv("MEDIA_SPOOL_MAX_MEMORY", 10 * 1024 * 1024))
+
+# Media metadata looked up from Graph is cached, per worker, until shortly before its signed download URL expires
+MEDIA_METADATA_CACHE_SIZE = int(os.getenv("MEDIA_METADATA_CACHE_SIZE", 10000))
+MEDIA_METADATA_TTL = float(os.getenv("MEDIA_METADATA_TTL", 4 * 60))
+MEDIA_URL_EXPIRY_MARGIN = 30
+
+# Stream Khoj chat responses, sending each paragraph to the user as soon as it is generated
+KHOJ_STREAM_RESPONSES = os.getenv("KHOJ_STREAM_RESPONSES", "false").lower() == "true"
+
+# Merge consecutive text and voice messages a user sends within this window into one query. Disabled when 0
+COALESCE_WINDOW_SECONDS = float(os.getenv("COALESCE_WINDOW_SECONDS", 0))
+COALESCE_MAX_MESSAGES = int(os.getenv("COALESCE_MAX_MESSAGES", 10))
+
+# Durable message queue, shared by all workers on the host
+FLINT_DATA_DIR = os.getenv("FLINT_DATA_DIR", os.path.expanduser("~/.flint"))
+QUEUE_PATH = os.getenv("QUEUE_PATH", os.path.join(FLINT_DATA_DIR, "queue.db"))
+QUEUE_CONSUMERS = int(os.getenv("QUEUE_CONSUMERS", 16))
+QUEUE_POLL_INTERVAL = float(os.getenv("QUEUE_POLL_INTERVAL", 0.5))
+QUEUE_VISIBILITY_TIMEOUT = float(os.getenv("QUEUE_VISIBILITY_TIMEOUT", 60))
+QUEUE_MAX_ATTEMPTS = int(os.getenv("QUEUE_MAX_ATTEMPTS", 5))
+QUEUE_RETRY_BACKOFF = float(os.getenv("QUEUE_RETRY_BACKOFF", 2))
+# Messages processed at once across all workers on the host. Unlimited when 0
+QUEUE_MAX_IN_FLIGHT = int(os.getenv("QUEUE_MAX_IN_FLIGHT", 64))
+
+# Classes of queued work, from the most to the least urgent. Budgets cap the jobs of a class in flight across all
+# workers, unlimited when 0. Work is shed once it is the deadline, in seconds, past when the user sent the message
+WORK_CLASS_PRIORITIES = ["text", "audio", "image", "document"]
+WORK_CLASS_DEADLINES = os.getenv("WORK_CLASS_DEADLINES", "text=300,audio=300,image=300,document=900")
+WORK_CLASS_BUDGETS = os.getenv("WORK_CLASS_BUDGETS", "text=0,audio=16,image=8,document=8")
+
+# Per worker caps on concurrent Khoj chats and uploads. Waiting limits are raised to at least QUEUE_CONSUMERS.
+# Queued work beyond the waiting limit goes back to the queue, other requests are turned away as busy
+CHAT_CONCURRENCY = int(os.getenv("CHAT_CONCURRENCY", 12))
+CHAT_MAX_WAITING = int(os.getenv("CHAT_MAX_WAITING", 32))
+UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", 4))
+UPLOAD_MAX_WAITING = int(os.getenv("UPLOAD_MAX_WAITING", 8))
+
+# Webhook deduplication, shared by all workers on the host. Meta retries failed deliveries for up to 7 days
+DEDUP_PATH = os.getenv("DEDUP_PATH", os.path.join(FLINT_DATA_DIR, "dedup.db"))
+DEDUP_TTL = float(os.getenv("DEDUP_TTL", 7 * 24 * 60 * 60))
+
+# Generated images are re-encoded as JPEG to fit this many bytes. WhatsApp only accepts JPEG and PNG images
+IMAGE_SIZE_BUDGET = int(os.getenv("IMAGE_SIZE_BUDGET", 1024 * 1024))
+IMAGE_CONVERT_WORKERS = int(os.getenv("IMAGE_CONVERT_WORKERS", min(4, os.cpu_count() or 1)))
+
+# Cache of media uploaded to WhatsApp, shared by all workers on the host. Uploaded media expires after 30 days
+MEDIA_CACHE_PATH = os.getenv("MEDIA_CACHE_PATH", os.path.join(FLINT_DATA_DIR, "media_cache.db"))
+MEDIA_ID_TTL = float(os.getenv("MEDIA_ID_TTL", 29 * 24 * 60 * 60))
+
+# Voice note transcription, per worker. Work beyond the waiting limit is put back in the queue, like for chats
+TRANSCRIPTION_CONCURRENCY = int(os.getenv("TRANSCRIPTION_CONCURRENCY", 8))
+TRANSCRIPTION_MAX_WAITING = int(os.getenv("TRANSCRIPTION_MAX_WAITING", 32))
+TRANSCRIPT_TTL = float(os.getenv("TRANSCRIPT_TTL", 7 * 24 * 60 * 60))
+
+# Voice notes longer than this, in seconds, are trimmed to it. Or rejected, if trimming is disabled
+AUDIO_MAX_DURATION = float(os.getenv("AUDIO_MAX_DURATION", 600))
+AUDIO_TRIM_OVERLONG = os.getenv("AUDIO_TRIM_OVERLONG", "true").lower() == "true"
+
+# Logging. Share of log lines to keep in high volume categories, as comma separated CATEGORY=RATE pairs
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "request_body=0.01,status=0.01,uvicorn.access=0.1")
+
+# Measure event loop lag every interval seconds. Log the stack of the event loop thread when it stalls this long
+EVENT_LOOP_LAG_INTERVAL = float(os.getenv("EVENT_LOOP_LAG_INTERVAL", 0.5))
+EVENT_LOOP_STALL_THRESHOLD = float(os.getenv("EVENT_LOOP_STALL_THRESHOLD", 1))
+
+# Token to access the sampling profiler of a live worker with. The profiler is disabled when unset
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", 60))
+
+# Index documents a user sends within this window in a single request to Khoj. Disabled when 0.
+# Each document then waits up to the window before it is uploaded
+DOCUMENT_BATCH_WINDOW_SECONDS = float(os.getenv("DOCUMENT_BATCH_WINDOW_SECONDS", 0))
+DOCUMENT_BATCH_MAX_COUNT = int(os.getenv("DOCUMENT_BATCH_MAX_COUNT", 10))
+DOCUMENT_BATCH_MAX_BYTES = int(os.getenv("DOCUMENT_BATCH_MAX_BYTES", 50 * 1024 * 1024))
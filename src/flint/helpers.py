@@ -1,29 +1,117 @@
 # Standard Packages
+import asyncio
+from contextlib import ExitStack
 from datetime import datetime
 import logging
 from logging import Logger
-import os
+import re
+import tempfile
 import time
+from typing import IO, Awaitable, Callable, Optional
 import urllib.parse
 
 # External Packages
-import openai
-from requests import Session
+import httpx
 
 # Internal Packages
-from flint.constants import KHOJ_API_URL, KHOJ_API_CLIENT_SECRET, KHOJ_API_CLIENT_ID
-
-whatsapp_cloud_api_session = Session()
-WHATSAPP_TOKEN = os.getenv("WHATSAPP_TOKEN")
-whatsapp_cloud_api_session.headers.update({"Authorization": f"Bearer {WHATSAPP_TOKEN}"})
+from flint.audio import limit_audio_duration
+from flint.balancer import BackendPool, Replica
+from flint.clients import khoj_client, openai_client, tenants, whatsapp_client
+from flint.constants import (
+    AUDIO_MAX_DURATION,
+    AUDIO_TRIM_OVERLONG,
+    CHAT_CONCURRENCY,
+    CHAT_MAX_WAITING,
+    KHOJ_API_URLS,
+    KHOJ_BUSY_MESSAGE,
+    KHOJ_CONNECT_TIMEOUT,
+    KHOJ_HEALTH_CHECK_INTERVAL,
+    KHOJ_HEALTH_CHECK_TIMEOUT,
+    KHOJ_CHAT_READ_TIMEOUT,
+    KHOJ_INDEX_READ_TIMEOUT,
+    KHOJ_INTERRUPTED_MESSAGE,
+    KHOJ_CONCURRENCY_INITIAL,
+    KHOJ_CONCURRENCY_MIN,
+    KHOJ_CONCURRENCY_MAX,
+    KHOJ_CONCURRENCY_WAIT,
+    KHOJ_LATENCY_TOLERANCE,
+    KHOJ_BREAKER_ERROR_RATE,
+    KHOJ_BREAKER_MIN_REQUESTS,
+    KHOJ_BREAKER_WINDOW,
+    KHOJ_BREAKER_COOLDOWN,
+    KHOJ_STICKY_ROUTING,
+    KHOJ_UNHEALTHY_THRESHOLD,
+    KHOJ_UNIMPLEMENTED_COMMAND_MESSAGE,
+    MEDIA_MAX_BYTES,
+    MEDIA_SPOOL_MAX_MEMORY,
+    QUEUE_CONSUMERS,
+    TRANSCRIPTION_CONCURRENCY,
+    TRANSCRIPTION_MAX_WAITING,
+    UPLOAD_CONCURRENCY,
+    UPLOAD_MAX_WAITING,
+    WHATSAPP_MAX_MESSAGE_LENGTH,
+    WHATSAPP_API_URL,
+)
+from flint.metrics import REPLY_DELIVERIES, STAGE_LATENCY, observe_stage
+from flint.outbound import whatsapp_outbound
+from flint.resilience import (
+    AdaptiveLimiter,
+    BackendBusyError,
+    Bulkhead,
+    BulkheadFullError,
+    CircuitBreaker,
+    GuardedBackend,
+)
 
 logger = logging.getLogger(__name__)
 
-KHOJ_CHAT_API_ENDPOINT = f"{KHOJ_API_URL}/api/chat?client_id={KHOJ_API_CLIENT_ID}&client=whatsapp"
-KHOJ_INDEX_API_ENDPOINT = f"{KHOJ_API_URL}/api/v1/index/update?client_id={KHOJ_API_CLIENT_ID}&client=whatsapp"
+KHOJ_CHAT_API_PATH = "/api/chat"
+KHOJ_INDEX_API_PATH = "/api/v1/index/update"
+
+KHOJ_CHAT_TIMEOUT = httpx.Timeout(KHOJ_CHAT_READ_TIMEOUT, connect=KHOJ_CONNECT_TIMEOUT)
+KHOJ_INDEX_TIMEOUT = httpx.Timeout(KHOJ_INDEX_READ_TIMEOUT, connect=KHOJ_CONNECT_TIMEOUT)
+
+
+def make_khoj_replica(url: str) -> Replica:
+    "Shed load from a Khoj replica when it slows down, and fail fast when it is failing"
+    return Replica(
+        url,
+        GuardedBackend(
+            url,
+            limiter=AdaptiveLimiter(
+                initial_limit=KHOJ_CONCURRENCY_INITIAL,
+                min_limit=KHOJ_CONCURRENCY_MIN,
+                max_limit=KHOJ_CONCURRENCY_MAX,
+                latency_tolerance=KHOJ_LATENCY_TOLERANCE,
+                acquire_timeout=KHOJ_CONCURRENCY_WAIT,
+            ),
+            breaker=CircuitBreaker(
+                error_threshold=KHOJ_BREAKER_ERROR_RATE,
+                min_requests=KHOJ_BREAKER_MIN_REQUESTS,
+                window=KHOJ_BREAKER_WINDOW,
+                cooldown=KHOJ_BREAKER_COOLDOWN,
+            ),
+        ),
+    )
+
 
-KHOJ_CLOUD_API_SESSION = Session()
-KHOJ_CLOUD_API_SESSION.headers.update({"Authorization": f"Bearer {KHOJ_API_CLIENT_SECRET}"})
+khoj_backends = BackendPool(
+    "khoj",
+    [make_khoj_replica(url) for url in KHOJ_API_URLS],
+    sticky=KHOJ_STICKY_ROUTING,
+    health_check_interval=KHOJ_HEALTH_CHECK_INTERVAL,
+    health_check_timeout=KHOJ_HEALTH_CHECK_TIMEOUT,
+    unhealthy_threshold=KHOJ_UNHEALTHY_THRESHOLD,
+    get_client=khoj_client,
+)
+
+# Cap each stage of work, so one heavy stage, or user, cannot starve the others.
+# Every queue consumer of the worker can wait on a stage, so full stages hold jobs back rather than reject them
+chat_bulkhead = Bulkhead("chat", limit=CHAT_CONCURRENCY, max_waiting=max(CHAT_MAX_WAITING, QUEUE_CONSUMERS))
+transcription_bulkhead = Bulkhead(
+    "transcription", limit=TRANSCRIPTION_CONCURRENCY, max_waiting=max(TRANSCRIPTION_MAX_WAITING, QUEUE_CONSUMERS)
+)
+upload_bulkhead = Bulkhead("upload", limit=UPLOAD_CONCURRENCY, max_waiting=max(UPLOAD_MAX_WAITING, QUEUE_CONSUMERS))
 
 COMMANDS = {
     "/online": "/online",
@@ -36,6 +124,9 @@ UNIMPLEMENTED_COMMANDS = {
     "/speak": "/speak",
 }
 
+# Khoj appends the references used to generate a streamed chat response after this marker
+KHOJ_REFERENCES_MARKER = "### compiled references:"
+
 
 def get_date():
     return datetime.utcnow().strftime("%Y-%m-%d %A")
@@ -54,115 +145,209 @@ def make_whatsapp_image_payload(media_id, to):
     return {"type": "image", "image": {"id": media_id}, "to": to, "messaging_product": "whatsapp"}
 
 
-def download_media(url, filepath):
-    response = whatsapp_cloud_api_session.get(url)
+def make_whatsapp_typing_payload(message_id):
+    "Mark the message as read and show a typing indicator until the reply is sent"
+    return {
+        "messaging_product": "whatsapp",
+        "status": "read",
+        "message_id": message_id,
+        "typing_indicator": {"type": "text"},
+    }
 
-    # Download the voice message OGG file
-    with open(filepath, "wb") as f:
-        f.write(response.content)
 
-    # Return file path to audio message
-    return os.path.join(os.getcwd(), filepath)
+async def send_whatsapp_payload(payload: dict, phone_number_id: str) -> httpx.Response:
+    "Send a message payload to WhatsApp through the paced, retrying outbound scheduler"
+    return await whatsapp_outbound.send(payload, phone_number_id)
 
 
-def upload_document_to_khoj(document_url, random_id, phone_id, mime_type):
-    file_ending = mime_type.split("/")[1]
-    document_filepath = download_media(
-        document_url, f"/tmp/{random_id}_document_{int(time.time() * 1000)}.{file_ending}"
-    )
+class PartialDeliveryError(Exception):
+    "A reply could not be fully sent. Holds the chunks left to send, to resend them without regenerating the reply"
 
-    encoded_phone_number = urllib.parse.quote(phone_id)
+    def __init__(self, pending: list[str], delivered: int, to: str, phone_number_id: str):
+        super().__init__(f"Sent {delivered} of {delivered + len(pending)} chunks of the reply")
+        self.pending = pending
+        self.delivered = delivered
+        self.to = to
+        self.phone_number_id = phone_number_id
 
-    with open(document_filepath, "rb") as f:
-        files = [
-            ("files", (document_filepath, f, mime_type)),
-        ]
-        khoj_api = f"{KHOJ_INDEX_API_ENDPOINT}&phone_number={encoded_phone_number}&create_if_not_exists=true"
-        response = KHOJ_CLOUD_API_SESSION.post(khoj_api, files=files)
 
-    if response.status_code == 200:
-        return "Document uploaded successfully"
-    else:
-        response.raise_for_status()
+async def send_whatsapp_text(text: str, to: str, phone_number_id: str):
+    "Send text to a user, split into messages under WhatsApp's size limit"
+    await send_whatsapp_chunks(split_message(text), to, phone_number_id)
 
 
-def transcribe_audio_message(audio_url: str, uuid: str, logger: Logger) -> str:
-    "Transcribe audio message using OpenAI whisper"
+async def send_whatsapp_chunks(chunks: list[str], to: str, phone_number_id: str):
+    """
+    Send chunks of a reply to a user one after another, so they arrive in order.
+    Raises PartialDeliveryError with the unsent chunks if a chunk cannot be sent
+    """
+    for index, chunk in enumerate(chunks):
+        try:
+            await send_whatsapp_payload(make_whatsapp_payload(chunk, to), phone_number_id)
+        except Exception as e:
+            REPLY_DELIVERIES.labels("partial" if index else "failed").inc()
+            logger.error("Sent %d of %d chunks of the reply to %s: %r", index, len(chunks), to, e)
+            raise PartialDeliveryError(chunks[index:], index, to, phone_number_id) from e
+    REPLY_DELIVERIES.labels("complete").inc()
 
-    start_time = time.time()
 
-    try:
-        # Download audio file
-        audio_message_file = download_media(audio_url, f"/tmp/{uuid}_audio_{int(time.time() * 1000)}.ogg")
-    except Exception as e:
-        logger.error(f"Failed to download audio by {uuid} with error {e}", exc_info=True)
-        return None
+class MediaTooLargeError(ValueError):
+    pass
 
-    # Transcribe the audio message using WhisperAPI
-    logger.info(f"Transcribing audio file {audio_message_file}")
+
+async def download_media(url: str, client: httpx.AsyncClient = None, max_bytes: int = MEDIA_MAX_BYTES) -> IO[bytes]:
+    """
+    Stream media from url into a spooled in-memory file, aborting once it exceeds max_bytes.
+    Returns the file, rewound to the start. Close it when done
+    """
+    client = client or whatsapp_client()
+    media_file = tempfile.SpooledTemporaryFile(max_size=MEDIA_SPOOL_MAX_MEMORY)
     try:
-        # Read the audio message from MP3
-        with open(audio_message_file, "rb") as audio_file:
-            # Call the OpenAI API to transcribe the audio using Whisper API
-            transcribed = openai.audio.translations.create(
-                model="whisper-1",
-                file=audio_file,
-            )
-            user_message = transcribed.text
-    except Exception as e:
-        logger.error(f"Failed to transcribe audio by {uuid} with error {e}", exc_info=True)
-        return None
-    finally:
-        # Delete the audio MP3 file
-        os.remove(audio_message_file)
+        async with client.stream("GET", url) as response:
+            response.raise_for_status()
+            content_length = response.headers.get("content-length")
+            if content_length and int(content_length) > max_bytes:
+                raise MediaTooLargeError(f"Media is larger than {max_bytes} bytes")
 
-    logger.info(f"Transcribed audio message by {uuid} in {time.time() - start_time} seconds")
+            downloaded = 0
+            async for chunk in response.aiter_bytes():
+                downloaded += len(chunk)
+                if downloaded > max_bytes:
+                    raise MediaTooLargeError(f"Media is larger than {max_bytes} bytes")
+                media_file.write(chunk)
+    except Exception:
+        media_file.close()
+        raise
 
-    return user_message
+    media_file.seek(0)
+    return media_file
 
 
-def send_message_to_khoj_chat(user_message: str, user_number: str) -> str:
+async def upload_document_to_khoj(document_url, random_id, phone_id, mime_type, phone_number_id: str = None):
+    return await upload_documents_to_khoj([(document_url, mime_type)], random_id, phone_id, phone_number_id)
+
+
+async def upload_documents_to_khoj(
+    documents: list[tuple[str, str]], random_id, phone_id, phone_number_id: str = None
+) -> str:
+    """
+    Index documents, given as (url, mime type) pairs, in a single request to Khoj.
+    Documents are downloaded from, and indexed for, the tenant of the business number
+    """
+    async with upload_bulkhead.slot():
+        return await _upload_documents_to_khoj(documents, random_id, phone_id, phone_number_id)
+
+
+async def _upload_documents_to_khoj(
+    documents: list[tuple[str, str]], random_id, phone_id, phone_number_id: str = None
+) -> str:
+    timestamp = int(time.time() * 1000)
+    client = whatsapp_client(phone_number_id)
+
+    with observe_stage("media_download"):
+        downloads = await asyncio.gather(
+            *[download_media(url, client=client) for url, _ in documents], return_exceptions=True
+        )
+
+    with ExitStack() as stack:
+        for download in downloads:
+            if not isinstance(download, BaseException):
+                stack.enter_context(download)
+        for download in downloads:
+            if isinstance(download, BaseException):
+                raise download
+        media = [download for download in downloads if not isinstance(download, BaseException)]
+
+        files = []
+        for index, (download, (_, mime_type)) in enumerate(zip(media, documents)):
+            file_ending = mime_type.split("/")[1]
+            document_filename = f"{random_id}_document_{timestamp}_{index}.{file_ending}"
+            files.append(("files", (document_filename, download, mime_type)))
+
+        with observe_stage("khoj_index"):
+            async with khoj_backends.request(phone_id) as (backend, outcome):
+                khoj_api = make_khoj_url(KHOJ_INDEX_API_PATH, phone_id, backend.url, phone_number_id)
+                response = await khoj_client(phone_number_id).post(khoj_api, files=files, timeout=KHOJ_INDEX_TIMEOUT)
+                if response.status_code >= 500:
+                    outcome.failed()
+
+    response.raise_for_status()
+    return "Document uploaded successfully"
+
+
+async def transcribe_audio_message(
+    audio_url: str, uuid: str, logger: Logger, phone_number_id: str = None
+) -> Optional[str]:
     """
-    Send the user message to the backend LLM service and return the response
+    Transcribe audio message using OpenAI whisper.
+    Raises BulkheadFullError when too many transcriptions are waiting, and AudioTooLongError for over-long audio
     """
+
     start_time = time.time()
 
-    if user_message.startswith(tuple(UNIMPLEMENTED_COMMANDS.keys())):
-        return {
-            "response": "Sorry, that command is not yet implemented. Try another one! Let us know if you want this sooner by emailing team@khoj.dev"
-        }
+    # Wait for a transcription slot before downloading, so waiting requests do not hold audio in memory
+    async with transcription_bulkhead.slot():
+        try:
+            # Download audio file
+            with observe_stage("media_download"):
+                with await download_media(audio_url, client=whatsapp_client(phone_number_id)) as audio_file:
+                    audio = audio_file.read()
+        except Exception as e:
+            logger.error("Failed to download audio by %s with error %s", uuid, e, exc_info=True)
+            return None
+
+        # Check the duration before paying to upload and transcribe the audio
+        audio = await asyncio.to_thread(limit_audio_duration, audio, AUDIO_MAX_DURATION, AUDIO_TRIM_OVERLONG)
+
+        # Transcribe the audio message using WhisperAPI
+        logger.info("Transcribing audio message by %s", uuid)
+        try:
+            # Call the OpenAI API to transcribe the audio using Whisper API
+            with observe_stage("transcription"):
+                transcribed = await openai_client().audio.translations.create(
+                    model="whisper-1",
+                    file=(f"{uuid}_audio.ogg", audio, "audio/ogg"),
+                )
+            user_message = transcribed.text
+        except Exception as e:
+            logger.error("Failed to transcribe audio by %s with error %s", uuid, e, exc_info=True)
+            return None
+
+    logger.info("Transcribed audio message by %s in %.2f seconds", uuid, time.time() - start_time)
+
+    return user_message
+
 
+def make_khoj_chat_query(user_message: str) -> str:
+    "Map WhatsApp commands to their Khoj equivalent. Messages without a command use the default mode"
     cmd_options = COMMANDS.keys()
     if user_message.startswith(tuple(cmd_options)):
         for cmd in cmd_options:
             if user_message.startswith(cmd):
-                user_message = user_message.replace(cmd, COMMANDS[cmd])
-                break
-    else:
-        user_message = f"/default {user_message}"
+                return user_message.replace(cmd, COMMANDS[cmd])
+    return f"/default {user_message}"
 
+
+def make_khoj_url(path: str, user_number: str, base_url: str, phone_number_id: str = None) -> str:
+    "URL of a Khoj API for the user, as the Khoj client of the business number's tenant"
+    client_id = tenants.get(phone_number_id).khoj_client_id
     encoded_phone_number = urllib.parse.quote(user_number)
-    khoj_api = f"{KHOJ_CHAT_API_ENDPOINT}&phone_number={encoded_phone_number}&create_if_not_exists=true"
-    response = KHOJ_CLOUD_API_SESSION.post(
-        khoj_api,
-        json={
-            "q": user_message,
-            "stream": False,
-        },
+    return (
+        f"{base_url}{path}?client_id={client_id}&client=whatsapp"
+        f"&phone_number={encoded_phone_number}&create_if_not_exists=true"
     )
 
-    end_time = time.time()
-    response_time = end_time - start_time
-    formatted_response_time = "{:.2f}".format(response_time)
-    logger.info(f"Khoj chat response time: {formatted_response_time} seconds")
 
+def parse_khoj_chat_response(response: httpx.Response) -> dict:
+    "Parse a Khoj chat response. Failures get a reply for the user, with the reason for the failure under error"
     try:
         if response.status_code == 200:
             return response.json()
         elif response.status_code == 429:
             # Handle rate limiting specifically
             return {
-                "response": "We're so happy you're loving Khoj! If you'd like to chat more frequently, please subscribe: https://khoj.dev/pricing."
+                "response": "We're so happy you're loving Khoj! If you'd like to chat more frequently, please subscribe: https://khoj.dev/pricing.",
+                "error": "rate_limited",
             }
         else:
             # Attempt to parse error details from the response
@@ -170,32 +355,258 @@ def send_message_to_khoj_chat(user_message: str, user_number: str) -> str:
                 error_details = response.json()
             except ValueError:
                 # If response is not JSON, use the status text
-                error_details = response.text or response.reason
+                error_details = response.text or response.reason_phrase
 
             logger.error(
                 f"Failed to get response from Khoj. Status code: {response.status_code}, Error: {error_details}"
             )
-            return {"response": "Sorry, I'm having trouble understanding you. Could you please try again?"}
+            return {
+                "response": "Sorry, I'm having trouble understanding you. Could you please try again?",
+                "error": f"status_{response.status_code}",
+            }
     except Exception as e:
         logger.exception(f"An unexpected error occurred while processing the response from Khoj.\nError: {e}")
-        return {"response": "I encountered an unexpected issue. Could you please try again?"}
+        return {"response": "I encountered an unexpected issue. Could you please try again?", "error": "unexpected"}
+
+
+async def send_message_to_khoj_chat(user_message: str, user_number: str, phone_number_id: str = None) -> dict:
+    """
+    Send the user message to the backend LLM service and return the response.
+    Raises BulkheadFullError when too many chats are waiting
+    """
+    start_time = time.time()
+
+    if user_message.startswith(tuple(UNIMPLEMENTED_COMMANDS.keys())):
+        return {"response": KHOJ_UNIMPLEMENTED_COMMAND_MESSAGE}
+
+    try:
+        async with chat_bulkhead.slot(), khoj_backends.request(user_number) as (backend, outcome):
+            with observe_stage("khoj_chat"):
+                response = await khoj_client(phone_number_id).post(
+                    make_khoj_url(KHOJ_CHAT_API_PATH, user_number, backend.url, phone_number_id),
+                    json={
+                        "q": make_khoj_chat_query(user_message),
+                        "stream": False,
+                    },
+                    timeout=KHOJ_CHAT_TIMEOUT,
+                )
+            if response.status_code >= 500:
+                outcome.failed()
+    except BulkheadFullError:
+        raise
+    except (BackendBusyError, httpx.TimeoutException) as e:
+        logger.warning("Khoj is unavailable: %r", e)
+        return {"response": KHOJ_BUSY_MESSAGE, "error": "busy"}
+
+    end_time = time.time()
+    response_time = end_time - start_time
+    logger.info("Khoj chat response time: %.2f seconds", response_time)
 
+    return parse_khoj_chat_response(response)
 
-def upload_media_to_whatsapp(media_filepath: str, media_type: str, phone_id: str) -> str:
-    with open(media_filepath, "rb") as f:
-        files = {
-            "file": (media_filepath, f, media_type),
-            "type": (None, media_type),
-            "messaging_product": (None, "whatsapp"),
-        }
 
-        response = whatsapp_cloud_api_session.post(f"https://graph.facebook.com/v18.0/{phone_id}/media", files=files)
+async def stream_message_to_khoj_chat(
+    user_message: str, user_number: str, on_paragraph: Callable[[str], Awaitable[None]], phone_number_id: str = None
+) -> Optional[dict]:
+    """
+    Stream the response to the user message from the backend LLM service.
+    Each complete paragraph is passed to on_paragraph as soon as it arrives, without holding up the Khoj response.
+    Returns the response for non-text replies, like images or errors, that cannot be streamed.
+    A response that breaks off after some paragraphs is finished with an apology, instead of raising to retry it
+    """
+    start_time = time.time()
+
+    if user_message.startswith(tuple(UNIMPLEMENTED_COMMANDS.keys())):
+        return {"response": KHOJ_UNIMPLEMENTED_COMMAND_MESSAGE}
+
+    # Paragraphs are sent by a separate task, so pacing and retrying sends to WhatsApp
+    # do not hold a Khoj request slot, nor count towards Khoj latency
+    paragraphs_to_send: asyncio.Queue = asyncio.Queue()
+    sender = asyncio.create_task(send_queued_paragraphs(paragraphs_to_send, on_paragraph))
+    paragraphs = ParagraphBuffer(stop_marker=KHOJ_REFERENCES_MARKER)
+    chat_response = None
+    first_paragraph_time = None
+    try:
+        try:
+            async with chat_bulkhead.slot(), khoj_backends.request(user_number) as (backend, outcome):
+                async with khoj_client(phone_number_id).stream(
+                    "POST",
+                    make_khoj_url(KHOJ_CHAT_API_PATH, user_number, backend.url, phone_number_id),
+                    json={
+                        "q": make_khoj_chat_query(user_message),
+                        "stream": True,
+                    },
+                    timeout=KHOJ_CHAT_TIMEOUT,
+                ) as response:
+                    if response.status_code != 200 or "application/json" in response.headers.get("content-type", ""):
+                        await response.aread()
+                        if response.status_code >= 500:
+                            outcome.failed()
+                        chat_response = parse_khoj_chat_response(response)
+                    else:
+                        async for text in response.aiter_text():
+                            # Judge Khoj load by how long it takes to start answering, not by the answer's length
+                            outcome.first_byte()
+                            for paragraph in paragraphs.feed(text):
+                                first_paragraph_time = first_paragraph_time or time.time()
+                                paragraphs_to_send.put_nowait(paragraph)
+                            if paragraphs.stopped:
+                                break
+                        for paragraph in paragraphs.flush():
+                            first_paragraph_time = first_paragraph_time or time.time()
+                            paragraphs_to_send.put_nowait(paragraph)
+        except BulkheadFullError:
+            raise
+        except (BackendBusyError, httpx.HTTPError) as e:
+            if first_paragraph_time:
+                # Part of the reply is on its way to the user. Finish it with an apology,
+                # as retrying would send that part again and add another turn to the conversation
+                logger.warning("Khoj response broke off after some paragraphs: %r", e)
+                for paragraph in paragraphs.flush():
+                    paragraphs_to_send.put_nowait(paragraph)
+                paragraphs_to_send.put_nowait(KHOJ_INTERRUPTED_MESSAGE)
+            elif isinstance(e, (BackendBusyError, httpx.TimeoutException)):
+                logger.warning("Khoj is unavailable: %r", e)
+                chat_response = {"response": KHOJ_BUSY_MESSAGE, "error": "busy"}
+            else:
+                raise
+
+        # Khoj is done. Wait for the paragraphs it sent to be delivered
+        paragraphs_to_send.put_nowait(None)
+        await sender
+    finally:
+        sender.cancel()
+
+    if chat_response is not None:
+        return chat_response
+    if first_paragraph_time:
+        STAGE_LATENCY.labels("khoj_chat_first_paragraph").observe(first_paragraph_time - start_time)
+        logger.info("Khoj chat time to first paragraph: %.2f seconds", first_paragraph_time - start_time)
+    STAGE_LATENCY.labels("khoj_chat").observe(time.time() - start_time)
+    logger.info("Khoj chat response time: %.2f seconds", time.time() - start_time)
+    return None
+
 
-    if response.status_code == 200:
-        response_json = response.json()
-        if "id" in response_json:
-            return response_json["id"]
+async def send_queued_paragraphs(paragraphs: asyncio.Queue, on_paragraph: Callable[[str], Awaitable[None]]):
+    "Pass queued paragraphs to on_paragraph in order, until None is queued"
+    while (paragraph := await paragraphs.get()) is not None:
+        await on_paragraph(paragraph)
+
+
+# Markdown links and bare URLs, which should not be split across messages
+LINK_PATTERN = re.compile(r"\[[^\]\n]*\]\([^)\s]*\)|https?://\S+")
+CODE_FENCE = "```"
+# The fence and language tag that open a code block, without any code on the same line
+CODE_FENCE_OPENING = re.compile(r"```[\w#+.-]{0,20}")
+
+
+def split_message(text: str, limit: int = WHATSAPP_MAX_MESSAGE_LENGTH) -> list[str]:
+    """
+    Split text into chunks under the limit, preferring paragraph, line and word boundaries.
+    Links are not split. Code blocks split across chunks are closed, and reopened in the next chunk
+    """
+    chunks = []
+    text = text.strip()
+    while len(text) > limit:
+        # Leave room to close a code block at the end of the chunk
+        split_at = find_split(text, limit - len(CODE_FENCE) - 1)
+        chunk, text = text[:split_at].rstrip(), text[split_at:]
+        # Reopen with only the fence and language tag, as the fence line itself may be what was split.
+        # Reopening must still shorten the text left to split
+        reopen = CODE_FENCE_OPENING.match(get_open_code_fence(chunk) or "")
+        if reopen and len(reopen.group()) + 1 < split_at:
+            chunks.append(f"{chunk}\n{CODE_FENCE}")
+            text = f"{reopen.group()}\n{text.lstrip(chr(10))}"
         else:
-            raise ValueError("Response does not contain 'id'")
-    else:
-        response.raise_for_status()
+            chunks.append(chunk)
+            text = text.lstrip()
+    if text:
+        chunks.append(text)
+    return chunks
+
+
+def find_split(text: str, limit: int) -> int:
+    "Find where to split text within the limit. Prefers boundaries outside code blocks, then any that are not in a link"
+    window = text[:limit]
+    links = [match.span() for match in LINK_PATTERN.finditer(text, 0, min(len(text), 2 * limit))]
+    # Avoid tiny chunks, and make sure a reopened code block still leaves room for progress
+    min_split = limit // 4
+
+    def can_split(position: int, outside_code: bool) -> bool:
+        if position <= min_split or any(start < position < end for start, end in links):
+            return False
+        return not outside_code or get_open_code_fence(window[:position]) is None
+
+    for separator, outside_code in (("\n\n", True), ("\n", True), ("\n", False), (" ", False)):
+        position = window.rfind(separator)
+        while position != -1 and not can_split(position, outside_code):
+            position = window.rfind(separator, 0, position)
+        if position != -1:
+            return position
+
+    # No boundary to split at. Split before a link that crosses the limit, else at the limit
+    for start, end in links:
+        if min_split < start < limit < end:
+            return start
+    return limit
+
+
+def get_open_code_fence(text: str) -> Optional[str]:
+    "Get the opening line of the code block left open at the end of text, if any"
+    fences = [line.strip() for line in text.split("\n") if line.strip().startswith(CODE_FENCE)]
+    return fences[-1] if len(fences) % 2 == 1 else None
+
+
+class ParagraphBuffer:
+    "Accumulate streamed text and release it in complete paragraphs, each under the message size limit"
+
+    def __init__(self, limit: int = WHATSAPP_MAX_MESSAGE_LENGTH, stop_marker: str = None):
+        self.limit = limit
+        self.stop_marker = stop_marker
+        self.stopped = False
+        self._buffer = ""
+
+    def feed(self, text: str) -> list[str]:
+        if self.stopped:
+            return []
+        self._buffer += text
+
+        # Drop everything after the stop marker, like the references appended to Khoj chat responses
+        if self.stop_marker and self.stop_marker in self._buffer:
+            self._buffer = self._buffer[: self._buffer.index(self.stop_marker)]
+            self.stopped = True
+            return []
+
+        # Release text up to the last paragraph break, unless it would split a code block
+        split_at = self._buffer.rfind("\n\n")
+        while split_at > 0 and self._buffer[:split_at].count("```") % 2 == 1:
+            split_at = self._buffer.rfind("\n\n", 0, split_at)
+        if split_at <= 0:
+            # Release oversized paragraphs early, keeping the unfinished tail buffered
+            if len(self._buffer) <= self.limit:
+                return []
+            chunks = split_message(self._buffer, self.limit)
+            self._buffer = chunks.pop()
+            return chunks
+
+        ready, self._buffer = self._buffer[:split_at], self._buffer[split_at:].lstrip("\n")
+        return split_message(ready, self.limit)
+
+    def flush(self) -> list[str]:
+        ready, self._buffer = self._buffer, ""
+        return split_message(ready, self.limit)
+
+
+async def upload_media_to_whatsapp(media: bytes, filename: str, media_type: str, phone_id: str) -> str:
+    files = {"file": (filename, media, media_type)}
+    data = {"type": media_type, "messaging_product": "whatsapp"}
+
+    response = await whatsapp_client(phone_id).post(
+        f"{WHATSAPP_API_URL}/v18.0/{phone_id}/media", data=data, files=files
+    )
+
+    response.raise_for_status()
+    response_json = response.json()
+    if "id" not in response_json:
+        raise ValueError("Response does not contain 'id'")
+    return response_json["id"]
@@ -0,0 +1,94 @@
+# Standard Packages
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+from io import BytesIO
+import logging
+import time
+
+# Internal Packages
+from flint.clients import http_client
+from flint.constants import IMAGE_CONVERT_WORKERS, IMAGE_SIZE_BUDGET, MEDIA_CACHE_PATH, MEDIA_ID_TTL
+from flint.helpers import download_media, upload_bulkhead, upload_media_to_whatsapp
+from flint.metrics import observe_stage
+from flint.store import TTLStore
+
+
+logger = logging.getLogger(__name__)
+
+# JPEG qualities to try, in order, until the image fits the size budget
+JPEG_QUALITIES = (85, 75, 65, 50)
+# Shrink the image by this factor when even the lowest quality does not fit the size budget
+DOWNSCALE_RATIO = 0.75
+
+# Pillow releases the GIL while decoding and encoding, so a few threads convert images in parallel
+_image_executor = ThreadPoolExecutor(max_workers=IMAGE_CONVERT_WORKERS, thread_name_prefix="image")
+
+# WhatsApp media ids of uploaded images, by source URL and by content hash
+media_ids = TTLStore(MEDIA_CACHE_PATH, default_ttl=MEDIA_ID_TTL)
+
+
+def encode_image(data: bytes, size_budget: int = IMAGE_SIZE_BUDGET) -> bytes:
+    """
+    Encode an image as a JPEG of at most size_budget bytes.
+    Lowers the quality first, then the resolution, until the image fits
+    """
+    # Pillow is only needed to reply with images, so import it on first use
+    from PIL import Image
+
+    image: Image.Image = Image.open(BytesIO(data))
+    if image.format == "JPEG" and len(data) <= size_budget:
+        return data
+
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        # JPEG has no alpha channel, so put transparent images on a white background
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, "white")
+        background.paste(image, mask=image.getchannel("A"))
+        image = background
+    elif image.mode != "RGB":
+        image = image.convert("RGB")
+
+    while True:
+        for quality in JPEG_QUALITIES:
+            output = BytesIO()
+            image.save(output, "JPEG", quality=quality, optimize=True)
+            if output.tell() <= size_budget:
+                return output.getvalue()
+        if min(image.size) <= 64:
+            logger.warning("Could not fit image in %d bytes, sending %d bytes", size_budget, output.tell())
+            return output.getvalue()
+        image = image.resize(
+            (int(image.width * DOWNSCALE_RATIO), int(image.height * DOWNSCALE_RATIO)), Image.Resampling.LANCZOS
+        )
+
+
+async def upload_image_to_whatsapp(image_url: str, phone_number_id: str) -> str:
+    """
+    Upload the image at image_url to WhatsApp and return its media id.
+    Images already uploaded, from the same URL or with the same content, reuse their media id.
+    Raises BulkheadFullError when too many uploads are waiting
+    """
+    # Media ids are scoped to the business phone number that uploaded them
+    url_key = f"image-url:{phone_number_id}:{image_url}"
+    media_id = await asyncio.to_thread(media_ids.get, url_key)
+    if media_id:
+        return media_id
+
+    async with upload_bulkhead.slot():
+        with observe_stage("image_fetch"):
+            with await download_media(image_url, client=http_client()) as image_file:
+                data = image_file.read()
+
+        hash_key = f"image-sha256:{phone_number_id}:{hashlib.sha256(data).hexdigest()}"
+        media_id = await asyncio.to_thread(media_ids.get, hash_key)
+        if not media_id:
+            with observe_stage("image_convert"):
+                image = await asyncio.get_running_loop().run_in_executor(_image_executor, encode_image, data)
+            with observe_stage("media_upload"):
+                filename = f"{int(time.time() * 1000)}.jpg"
+                media_id = await upload_media_to_whatsapp(image, filename, "image/jpeg", phone_number_id)
+            await asyncio.to_thread(media_ids.set, hash_key, media_id)
+
+    await asyncio.to_thread(media_ids.set, url_key, media_id)
+    return media_id
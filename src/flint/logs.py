@@ -0,0 +1,74 @@
+# Standard Packages
+import copy
+import json
+import logging
+from logging.handlers import QueueHandler
+import random
+import time
+
+
+# Attributes of every log record, to tell them apart from attributes passed via extra
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+# Also skip the copy of the message with terminal colors that uvicorn passes via extra
+_SKIPPED_ATTRIBUTES = _RECORD_ATTRIBUTES | {"color_message"}
+
+
+class JsonFormatter(logging.Formatter):
+    "Format log records as compact, single line JSON objects"
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "process": record.process,
+            "message": record.getMessage(),
+        }
+        # Include attributes passed via extra, like the log category
+        entry.update({key: value for key, value in vars(record).items() if key not in _SKIPPED_ATTRIBUTES})
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep only a share of the log records in high volume categories.
+    Records are put in a category via extra={"category": ...}, else their logger name is their category.
+    Records in categories without a sample rate are always kept
+    """
+
+    def __init__(self, sample_rates: dict[str, float]):
+        super().__init__()
+        self.sample_rates = sample_rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = self.sample_rates.get(getattr(record, "category", record.name), 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+
+class LazyQueueHandler(QueueHandler):
+    """
+    Hand log records to a background listener thread, which formats and writes them.
+    Only the message is rendered in the logging thread, as its arguments may change after the call returns
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def parse_sample_rates(sample_rates: str) -> dict[str, float]:
+    "Parse comma separated CATEGORY=RATE pairs, like request_body=0.01,status=0.001"
+    rates = {}
+    for pair in filter(None, sample_rates.split(",")):
+        category, _, rate = pair.partition("=")
+        rates[category.strip()] = float(rate)
+    return rates
@@ -1,31 +1,49 @@
 # Standard Packages
+from contextlib import asynccontextmanager
 import logging
-import os
-import threading
 
 # External Packages
 from fastapi import FastAPI
-from rich.logging import RichHandler
 import uvicorn
 from fastapi import Request
-import schedule
 
 # Internal Packages
-from flint.configure import configure_routes
+from flint.clients import close_clients
+from flint.configure import DEBUG, configure_logging, configure_routes
+from flint.constants import EVENT_LOOP_LAG_INTERVAL, EVENT_LOOP_STALL_THRESHOLD, LOG_LEVEL
 
 # Setup Logger
-rich_handler = RichHandler(rich_tracebacks=True)
-rich_handler.setFormatter(fmt=logging.Formatter(fmt="%(message)s", datefmt="[%X]"))
-logging.basicConfig(handlers=[rich_handler], level=logging.DEBUG)
+configure_logging()
 
 logger = logging.getLogger()
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    from flint.helpers import khoj_backends
+    from flint.profiling import EventLoopLagMonitor
+    from flint.routers.api import start_queue_consumers, stop_queue_consumers
+
+    # Watch for work blocking the event loop
+    event_loop_monitor = EventLoopLagMonitor(EVENT_LOOP_LAG_INTERVAL, EVENT_LOOP_STALL_THRESHOLD)
+    event_loop_monitor.start()
+
+    # Drain the durable message queue and probe Khoj replicas in the background
+    start_queue_consumers()
+    khoj_backends.start_health_checks()
+    yield
+    # Stop consuming and release pooled connections on worker shutdown
+    await khoj_backends.stop_health_checks()
+    await event_loop_monitor.stop()
+    await stop_queue_consumers()
+    await close_clients()
+
+
 # Initialize the Application Server
-if os.getenv("DEBUG", False):
-    app = FastAPI()
+if DEBUG:
+    app = FastAPI(lifespan=lifespan)
 else:
-    app = FastAPI(docs_url=None, redoc_url=None)
+    app = FastAPI(docs_url=None, redoc_url=None, lifespan=lifespan)
 
 
 @app.middleware("http")
@@ -39,23 +57,16 @@ async def set_scheme(request: Request, call_next):
 
 def start_server(app: FastAPI, host="0.0.0.0", port=8488, socket=None):
     logger.info("🌖 flint is ready to use")
+    log_level = "debug" if DEBUG else LOG_LEVEL.lower()
     if socket:
-        uvicorn.run(app, proxy_headers=True, uds=socket, log_level="debug", use_colors=True, log_config=None)
+        uvicorn.run(app, proxy_headers=True, uds=socket, log_level=log_level, use_colors=bool(DEBUG), log_config=None)
     else:
-        uvicorn.run(app, host=host, port=port, log_level="debug", use_colors=True, log_config=None)
+        uvicorn.run(app, host=host, port=port, log_level=log_level, use_colors=bool(DEBUG), log_config=None)
     logger.info("🌒 Stopping flint")
 
 
-def poll_task_scheduler():
-    timer_thread = threading.Timer(interval=60.0, function=poll_task_scheduler)
-    timer_thread.daemon = True
-    timer_thread.start()
-    schedule.run_pending()
-
-
 def run(should_start_server=True):
     configure_routes(app)
-    poll_task_scheduler()
     if should_start_server:
         start_server(app)
 
@@ -0,0 +1,372 @@
+# Standard Packages
+import asyncio
+from dataclasses import dataclass
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import Awaitable, Callable, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Job:
+    id: int
+    sender: str
+    payload: dict
+    attempts: int
+    enqueued_at: float
+    work_class: str = ""
+
+
+class RetryLater(Exception):
+    "Raised by a handler to put its job back in the queue for delay seconds, without counting a failed attempt"
+
+    def __init__(self, delay: float, reason: str = ""):
+        super().__init__(reason)
+        self.delay = delay
+
+
+class MessageQueue:
+    """
+    Durable, SQLite backed message queue shared by all workers on the host.
+
+    Jobs are claimed with a visibility timeout and only deleted once acknowledged,
+    so work in flight survives worker restarts (at-least-once delivery).
+    Jobs from the same sender are claimed one at a time, in the order they were enqueued.
+    So each sender is an ordered lane of work, across all consumers and workers.
+    Across senders, jobs with a lower priority number are claimed first.
+    At most max_in_flight jobs are claimed at once across all workers, when set.
+    And at most class_budgets[work_class] jobs of a work class, when set.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        visibility_timeout: float = 60.0,
+        max_attempts: int = 5,
+        retry_backoff: float = 2.0,
+        max_retry_backoff: float = 300.0,
+        max_in_flight: int = 0,
+        class_budgets: dict[str, int] = None,
+    ):
+        self.path = path
+        self.max_in_flight = max_in_flight
+        self.class_budgets = {name: budget for name, budget in (class_budgets or {}).items() if budget > 0}
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.max_retry_backoff = max_retry_backoff
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=10.0, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                sender TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                enqueued_at REAL NOT NULL,
+                available_at REAL NOT NULL,
+                claimed_until REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                priority INTEGER NOT NULL DEFAULT 0,
+                work_class TEXT NOT NULL DEFAULT ''
+            );
+            CREATE INDEX IF NOT EXISTS jobs_sender ON jobs (sender, id);
+            CREATE INDEX IF NOT EXISTS jobs_claimed ON jobs (claimed_until);
+            CREATE TABLE IF NOT EXISTS dead_jobs (
+                id INTEGER PRIMARY KEY,
+                sender TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                enqueued_at REAL NOT NULL,
+                failed_at REAL NOT NULL,
+                attempts INTEGER NOT NULL,
+                error TEXT
+            );
+            """
+        )
+        self._migrate()
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_priority ON jobs (priority, id)")
+
+    def _migrate(self):
+        "Add the job priority columns to queues created before jobs had priorities"
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(jobs)")}
+            if "priority" not in columns:
+                self._db.execute("ALTER TABLE jobs ADD COLUMN priority INTEGER NOT NULL DEFAULT 0")
+            if "work_class" not in columns:
+                self._db.execute("ALTER TABLE jobs ADD COLUMN work_class TEXT NOT NULL DEFAULT ''")
+            self._db.execute("COMMIT")
+        except Exception:
+            self._db.execute("ROLLBACK")
+            raise
+
+    def put_many(self, jobs: list[tuple[str, dict, str, int]]) -> list[int]:
+        "Append (sender, payload, work class, priority) jobs to the queue. Returns their job ids"
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                job_ids = [
+                    self._db.execute(
+                        """
+                        INSERT INTO jobs (sender, payload, enqueued_at, available_at, work_class, priority)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                        """,
+                        (sender, json.dumps(payload), now, now, work_class, priority),
+                    ).lastrowid
+                    for sender, payload, work_class, priority in jobs
+                ]
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return job_ids
+
+    def claim(self) -> Optional[Job]:
+        """
+        Claim the most urgent, then oldest, available job whose sender has no earlier job pending.
+        Jobs are not claimed while too many jobs, or too many jobs of their work class, are in flight
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                full_classes = []
+                if self.max_in_flight > 0 or self.class_budgets:
+                    in_flight = dict(
+                        self._db.execute(
+                            "SELECT work_class, COUNT(*) FROM jobs WHERE claimed_until > ? GROUP BY work_class", (now,)
+                        ).fetchall()
+                    )
+                    if self.max_in_flight > 0 and sum(in_flight.values()) >= self.max_in_flight:
+                        self._db.execute("COMMIT")
+                        return None
+                    full_classes = [
+                        name for name, budget in self.class_budgets.items() if in_flight.get(name, 0) >= budget
+                    ]
+                row = self._db.execute(
+                    f"""
+                    SELECT id, sender, payload, attempts, enqueued_at, work_class FROM jobs AS j
+                    WHERE available_at <= ?
+                      AND (claimed_until IS NULL OR claimed_until <= ?)
+                      AND work_class NOT IN ({", ".join("?" * len(full_classes))})
+                      AND NOT EXISTS (SELECT 1 FROM jobs AS e WHERE e.sender = j.sender AND e.id < j.id)
+                    ORDER BY priority, id LIMIT 1
+                    """,
+                    (now, now, *full_classes),
+                ).fetchone()
+                if row:
+                    self._db.execute(
+                        "UPDATE jobs SET claimed_until = ?, attempts = attempts + 1 WHERE id = ?",
+                        (now + self.visibility_timeout, row[0]),
+                    )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        if not row:
+            return None
+        return Job(
+            id=row[0],
+            sender=row[1],
+            payload=json.loads(row[2]),
+            attempts=row[3] + 1,
+            enqueued_at=row[4],
+            work_class=row[5],
+        )
+
+    def next_from_sender(self, job: Job) -> Optional[Job]:
+        """
+        Get the job enqueued after the given claimed job by the same sender, without claiming it.
+        No other consumer can claim it while the given job is held, as jobs from a sender are claimed in order
+        """
+        with self._lock:
+            row = self._db.execute(
+                """
+                SELECT id, sender, payload, attempts, enqueued_at, work_class FROM jobs
+                WHERE sender = ? AND id > ? ORDER BY id LIMIT 1
+                """,
+                (job.sender, job.id),
+            ).fetchone()
+        if not row:
+            return None
+        return Job(
+            id=row[0], sender=row[1], payload=json.loads(row[2]), attempts=row[3], enqueued_at=row[4], work_class=row[5]
+        )
+
+    def merge(self, job: Job, others: list[Job], payload: dict):
+        "Replace the payload of a claimed job with one merging the other jobs, and remove the other jobs"
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute("UPDATE jobs SET payload = ? WHERE id = ?", (json.dumps(payload), job.id))
+                self._db.executemany("DELETE FROM jobs WHERE id = ?", [(other.id,) for other in others])
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        job.payload = payload
+
+    def update(self, job: Job, payload: dict):
+        "Replace the payload of a claimed job, like to record progress for its retry"
+        with self._lock:
+            self._db.execute("UPDATE jobs SET payload = ? WHERE id = ?", (json.dumps(payload), job.id))
+        job.payload = payload
+
+    def extend(self, job: Job):
+        "Extend the visibility timeout of a job that is still being processed"
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET claimed_until = ? WHERE id = ?", (time.time() + self.visibility_timeout, job.id)
+            )
+
+    def release(self, job: Job, delay: float = 0.0):
+        "Put a claimed job back in the queue for delay seconds, without counting the attempt"
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET claimed_until = NULL, available_at = ?, attempts = attempts - 1 WHERE id = ?",
+                (time.time() + delay, job.id),
+            )
+
+    def ack(self, job: Job):
+        "Remove a successfully processed job from the queue"
+        with self._lock:
+            self._db.execute("DELETE FROM jobs WHERE id = ?", (job.id,))
+
+    def nack(self, job: Job, error: str = None):
+        "Schedule a failed job for retry with jittered exponential backoff, or dead-letter it"
+        now = time.time()
+        with self._lock:
+            if job.attempts >= self.max_attempts:
+                self._db.execute("BEGIN IMMEDIATE")
+                try:
+                    self._db.execute(
+                        """
+                        INSERT OR REPLACE INTO dead_jobs (id, sender, payload, enqueued_at, failed_at, attempts, error)
+                        SELECT id, sender, payload, enqueued_at, ?, attempts, ? FROM jobs WHERE id = ?
+                        """,
+                        (now, error, job.id),
+                    )
+                    self._db.execute("DELETE FROM jobs WHERE id = ?", (job.id,))
+                    self._db.execute("COMMIT")
+                except Exception:
+                    self._db.execute("ROLLBACK")
+                    raise
+                logger.error("Job %d failed %d times. Moved to dead letters", job.id, job.attempts)
+                return
+
+            backoff = min(self.retry_backoff * 2 ** (job.attempts - 1), self.max_retry_backoff)
+            backoff *= random.uniform(0.5, 1.5)
+            self._db.execute(
+                "UPDATE jobs SET claimed_until = NULL, available_at = ? WHERE id = ?", (now + backoff, job.id)
+            )
+            logger.warning("Job %d failed on attempt %d. Retrying in %.1f seconds", job.id, job.attempts, backoff)
+
+    def stats(self) -> dict:
+        "Queue depth, in-flight and dead-lettered job counts, and the age of the oldest queued job"
+        now = time.time()
+        with self._lock:
+            depth, in_flight, oldest = self._db.execute(
+                "SELECT COUNT(*), COUNT(CASE WHEN claimed_until > ? THEN 1 END), MIN(enqueued_at) FROM jobs", (now,)
+            ).fetchone()
+            dead = self._db.execute("SELECT COUNT(*) FROM dead_jobs").fetchone()[0]
+            depth_by_class = dict(
+                self._db.execute("SELECT work_class, COUNT(*) FROM jobs GROUP BY work_class").fetchall()
+            )
+        return {
+            "depth": depth,
+            "depth_by_class": depth_by_class,
+            "in_flight": in_flight,
+            "dead": dead,
+            "oldest_age_seconds": round(now - oldest, 3) if oldest else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class QueueConsumers:
+    "Pool of async consumers draining a message queue within a worker's event loop"
+
+    def __init__(
+        self,
+        queue: MessageQueue,
+        handler: Callable[[Job], Awaitable[None]],
+        concurrency: int = 8,
+        poll_interval: float = 0.5,
+    ):
+        self.queue = queue
+        self.handler = handler
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self._tasks: list[asyncio.Task] = []
+        self._wakeup = asyncio.Event()
+
+    def notify(self):
+        "Wake idle consumers after jobs were enqueued by this worker"
+        self._wakeup.set()
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._consume()) for _ in range(self.concurrency)]
+        logger.info("Started %d queue consumers", self.concurrency)
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _consume(self):
+        while True:
+            try:
+                job = await asyncio.to_thread(self.queue.claim)
+            except Exception as e:
+                logger.error("Failed to claim job from queue: %s", e, exc_info=True)
+                job = None
+
+            if job is None:
+                # Sleep until the next poll, or until a job is enqueued by this worker
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._process(job)
+
+    async def _process(self, job: Job):
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        try:
+            await self.handler(job)
+        except asyncio.CancelledError:
+            # Leave the job claimed. It becomes visible to other consumers once its timeout expires
+            raise
+        except RetryLater as e:
+            logger.info("Job %d put back in the queue for %.1f seconds: %s", job.id, e.delay, e)
+            await asyncio.to_thread(self.queue.release, job, e.delay)
+        except Exception as e:
+            logger.error("Error processing job %d: %s", job.id, e, exc_info=True)
+            await asyncio.to_thread(self.queue.nack, job, repr(e))
+        else:
+            await asyncio.to_thread(self.queue.ack, job)
+        finally:
+            heartbeat.cancel()
+
+    async def _heartbeat(self, job: Job):
+        "Keep the job invisible to other consumers while it is being processed"
+        while True:
+            await asyncio.sleep(self.queue.visibility_timeout / 2)
+            await asyncio.to_thread(self.queue.extend, job)
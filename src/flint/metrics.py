@@ -0,0 +1,87 @@
+# Standard Packages
+from contextlib import contextmanager
+import os
+import time
+from typing import Callable
+
+# External Packages
+from prometheus_client import CollectorRegistry, Counter, Histogram, REGISTRY, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.multiprocess import MultiProcessCollector
+
+
+# Stage latencies span fast Graph API calls to slow LLM generations
+STAGE_LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, float("inf"))
+
+STAGE_LATENCY = Histogram(
+    "flint_stage_duration_seconds",
+    "Time spent in each stage of handling a message",
+    ["stage"],
+    buckets=STAGE_LATENCY_BUCKETS,
+)
+EVENT_LOOP_LAG = Histogram(
+    "flint_event_loop_lag_seconds",
+    "How late the event loop ran callbacks scheduled on it",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float("inf")),
+)
+MESSAGES = Counter(
+    "flint_messages_total",
+    "WhatsApp messages handled, by message type and outcome",
+    ["type", "outcome"],
+)
+REPLY_DELIVERIES = Counter(
+    "flint_reply_deliveries_total",
+    "Replies sent to users in one or more chunks, by whether all chunks were sent",
+    ["result"],
+)
+WHATSAPP_SENDS = Counter(
+    "flint_whatsapp_sends_total",
+    "Attempts to send a message to WhatsApp, by result",
+    ["result"],
+)
+
+
+@contextmanager
+def observe_stage(stage: str):
+    "Record the time spent in the enclosed block as the latency of stage"
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_LATENCY.labels(stage).observe(time.perf_counter() - start_time)
+
+
+class StatsCollector:
+    "Expose a dictionary of numeric stats, computed at scrape time, as gauges"
+
+    def __init__(self, prefix: str, get_stats: Callable[[], dict], description: str):
+        self.prefix = prefix
+        self.get_stats = get_stats
+        self.description = description
+
+    def collect(self):
+        for name, value in self.get_stats().items():
+            if isinstance(value, (int, float)):
+                yield GaugeMetricFamily(f"{self.prefix}_{name}", f"{self.description}: {name}", value=value)
+
+
+def render_metrics(collectors: list = None) -> bytes:
+    """
+    Render metrics in the Prometheus text format.
+    Metrics are aggregated across gunicorn workers when PROMETHEUS_MULTIPROC_DIR is set
+    """
+    registry = CollectorRegistry()
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        MultiProcessCollector(registry)
+    else:
+        registry.register(_DefaultCollector())
+    for collector in collectors or []:
+        registry.register(collector)
+    return generate_latest(registry)
+
+
+class _DefaultCollector:
+    "Metrics of this process, from the default registry"
+
+    def collect(self):
+        return REGISTRY.collect()
@@ -0,0 +1,175 @@
+# Standard Packages
+import asyncio
+from collections import Counter, OrderedDict
+from email.utils import parsedate_to_datetime
+import logging
+import random
+import time
+
+# External Packages
+import httpx
+
+# Internal Packages
+from flint.clients import tenants, whatsapp_client
+from flint.metrics import WHATSAPP_SENDS, observe_stage
+from flint.constants import (
+    WHATSAPP_RECIPIENT_SEND_RATE,
+    WHATSAPP_RECIPIENT_SEND_BURST,
+    WHATSAPP_SEND_MAX_ATTEMPTS,
+    WHATSAPP_SEND_RETRY_BACKOFF,
+    WHATSAPP_API_URL,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    "Pace events to a sustained rate per second, allowing bursts of up to burst events"
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    async def acquire(self) -> float:
+        "Wait for a token. Returns the seconds spent waiting"
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        # Reserve a token, going into debt if none are left. Callers wait for the debt to be repaid in order
+        self.tokens -= 1
+        wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+
+class OutboundScheduler:
+    """
+    Send WhatsApp message payloads through the Graph API, paced by a token bucket per business phone number
+    and per recipient. Each business number is paced at its tenant's send rate.
+    Sends rate limited (429) or failed by the server (5xx) are retried with jittered
+    exponential backoff, honoring the Retry-After header when present.
+    """
+
+    RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+    # Graph API rate limit error codes: app, account, throughput and pair (recipient) rate limits
+    RETRYABLE_ERROR_CODES = {4, 80007, 130429, 131056}
+
+    def __init__(
+        self,
+        recipient_rate: float = WHATSAPP_RECIPIENT_SEND_RATE,
+        recipient_burst: float = WHATSAPP_RECIPIENT_SEND_BURST,
+        max_attempts: int = WHATSAPP_SEND_MAX_ATTEMPTS,
+        retry_backoff: float = WHATSAPP_SEND_RETRY_BACKOFF,
+        max_retry_backoff: float = 60.0,
+        max_recipients: int = 10000,
+    ):
+        if max_attempts < 1:
+            raise ValueError(f"max_attempts must be at least 1, got {max_attempts}")
+        self.recipient_rate = recipient_rate
+        self.recipient_burst = recipient_burst
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.max_retry_backoff = max_retry_backoff
+        self.max_recipients = max_recipients
+
+        self._buckets: dict[str, TokenBucket] = {}
+        self._recipient_buckets: OrderedDict[tuple[str, str], TokenBucket] = OrderedDict()
+        self.metrics: Counter = Counter()
+        self.throttled_seconds = 0.0
+
+    def _bucket(self, phone_number_id: str) -> TokenBucket:
+        if phone_number_id not in self._buckets:
+            tenant = tenants.get(phone_number_id)
+            self._buckets[phone_number_id] = TokenBucket(tenant.send_rate, tenant.send_burst)
+        return self._buckets[phone_number_id]
+
+    def _recipient_bucket(self, phone_number_id: str, recipient: str) -> TokenBucket:
+        key = (phone_number_id, recipient)
+        if key in self._recipient_buckets:
+            self._recipient_buckets.move_to_end(key)
+        else:
+            self._recipient_buckets[key] = TokenBucket(self.recipient_rate, self.recipient_burst)
+            # Forget the least recently messaged recipients
+            while len(self._recipient_buckets) > self.max_recipients:
+                self._recipient_buckets.popitem(last=False)
+        return self._recipient_buckets[key]
+
+    def _is_retryable(self, response: httpx.Response) -> bool:
+        if response.status_code in self.RETRYABLE_STATUS_CODES:
+            return True
+        if response.status_code == 400:
+            try:
+                return response.json()["error"]["code"] in self.RETRYABLE_ERROR_CODES
+            except (ValueError, KeyError, TypeError):
+                return False
+        return False
+
+    def _backoff(self, attempt: int, response: httpx.Response = None) -> float:
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                return max(float(retry_after), 0.0)
+            except ValueError:
+                try:
+                    return max(parsedate_to_datetime(retry_after).timestamp() - time.time(), 0.0)
+                except (TypeError, ValueError):
+                    pass
+        backoff = min(self.retry_backoff * 2 ** (attempt - 1), self.max_retry_backoff)
+        return backoff * random.uniform(0.5, 1.5)
+
+    async def send(self, payload: dict, phone_number_id: str) -> httpx.Response:
+        with observe_stage("whatsapp_send"):
+            return await self._send(payload, phone_number_id)
+
+    async def _send(self, payload: dict, phone_number_id: str) -> httpx.Response:
+        url = f"{WHATSAPP_API_URL}/v17.0/{phone_number_id}/messages"
+        recipient = payload.get("to")
+
+        for attempt in range(1, self.max_attempts + 1):
+            # Pace sends per business number, and per recipient for messages addressed to a user
+            waited = await self._bucket(phone_number_id).acquire()
+            if recipient:
+                waited += await self._recipient_bucket(phone_number_id, recipient).acquire()
+            self.throttled_seconds += waited
+
+            response = None
+            try:
+                response = await whatsapp_client(phone_number_id).post(url, json=payload)
+            except httpx.TransportError as e:
+                if attempt == self.max_attempts:
+                    self.metrics["failed"] += 1
+                    WHATSAPP_SENDS.labels("failed").inc()
+                    raise
+                logger.warning("Failed to send WhatsApp message on attempt %d: %s", attempt, e)
+            else:
+                if not self._is_retryable(response) or attempt == self.max_attempts:
+                    if response.is_success:
+                        self.metrics["sent"] += 1
+                        WHATSAPP_SENDS.labels("sent").inc()
+                    else:
+                        self.metrics["failed"] += 1
+                        WHATSAPP_SENDS.labels("failed").inc()
+                    response.raise_for_status()
+                    return response
+                self.metrics[f"status_{response.status_code}"] += 1
+                logger.warning("WhatsApp message send got %d on attempt %d", response.status_code, attempt)
+
+            self.metrics["retried"] += 1
+            WHATSAPP_SENDS.labels("retried").inc()
+            await asyncio.sleep(self._backoff(attempt, response))
+        raise AssertionError("The last attempt returns or raises")
+
+    def stats(self) -> dict:
+        return {
+            **self.metrics,
+            "throttled_seconds": round(self.throttled_seconds, 3),
+            "tracked_recipients": len(self._recipient_buckets),
+        }
+
+
+whatsapp_outbound = OutboundScheduler()
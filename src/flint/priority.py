@@ -0,0 +1,59 @@
+# Standard Packages
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class WorkClass:
+    """
+    Class of queued work, by how costly and how interactive it is.
+    Work in lower priority classes is claimed first. At most budget jobs of a class are in flight at once, if set.
+    Work still queued deadline seconds after the user sent their message is shed
+    """
+
+    name: str
+    priority: int
+    deadline: float
+    budget: int = 0
+
+
+def parse_class_settings(settings: str) -> dict[str, float]:
+    "Parse comma separated CLASS=VALUE pairs, like text=300,document=900"
+    values = {}
+    for pair in filter(None, settings.split(",")):
+        name, _, value = pair.partition("=")
+        values[name.strip()] = float(value)
+    return values
+
+
+def make_work_classes(priorities: list[str], deadlines: str, budgets: str) -> dict[str, WorkClass]:
+    "Make work classes, from the most to the least urgent class names, and their deadline and budget settings"
+    deadline_by_class = parse_class_settings(deadlines)
+    budget_by_class = parse_class_settings(budgets)
+    return {
+        name: WorkClass(name, priority, deadline_by_class[name], int(budget_by_class.get(name, 0)))
+        for priority, name in enumerate(priorities)
+    }
+
+
+def classify_message(message: dict) -> str:
+    "Get the class of work a WhatsApp message needs"
+    if message["type"] == "text":
+        # Image generation waits on a slow model, then converts and uploads the image
+        text = message["text"]["body"]
+        return "image" if text.startswith("/dream") else "text"
+    if message["type"] in ("audio", "document"):
+        return message["type"]
+    # Other messages get a canned reply
+    return "text"
+
+
+def message_deadline(message: dict, work_class: WorkClass, received_at: float) -> float:
+    """
+    Get the time by which work on a message should start.
+    Counted from when the user sent the message, which can be long before Meta delivered it to us
+    """
+    try:
+        sent_at = float(message["timestamp"])
+    except (KeyError, TypeError, ValueError):
+        sent_at = received_at
+    return sent_at + work_class.deadline
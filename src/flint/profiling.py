@@ -0,0 +1,119 @@
+# Standard Packages
+import asyncio
+from collections import Counter
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from types import FrameType
+from typing import Optional
+
+# Internal Packages
+from flint.metrics import EVENT_LOOP_LAG
+
+
+logger = logging.getLogger(__name__)
+
+
+class EventLoopLagMonitor:
+    """
+    Measure how late the event loop runs a callback scheduled to run every interval seconds.
+    A watchdog thread logs the stack of the event loop thread once the loop has been stalled for threshold seconds,
+    to show what is blocking it, like a synchronous HTTP call, an image conversion or slow logging
+    """
+
+    def __init__(self, interval: float = 0.5, threshold: float = 1.0):
+        self.interval = interval
+        self.threshold = threshold
+        self.max_lag = 0.0
+        self.stalls = 0
+        self._last_tick = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopped = threading.Event()
+        self._watchdog: Optional[threading.Thread] = None
+
+    def start(self):
+        self._loop_thread_id = threading.get_ident()
+        self._last_tick = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._measure())
+        self._watchdog = threading.Thread(target=self._watch, name="event-loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self):
+        self._stopped.set()
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _measure(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            self._last_tick = now
+            self.max_lag = max(self.max_lag, lag)
+            EVENT_LOOP_LAG.observe(lag)
+
+    def _watch(self):
+        reported_tick = None
+        while not self._stopped.wait(self.threshold / 2):
+            last_tick = self._last_tick
+            stalled_for = time.monotonic() - last_tick - self.interval
+            # Log each stall once, while it is happening, so the stack shows what is blocking the loop
+            if stalled_for < self.threshold or last_tick == reported_tick:
+                continue
+            reported_tick = last_tick
+            self.stalls += 1
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else "Unavailable"
+            logger.warning(
+                "Event loop blocked for over %.2f seconds. Event loop thread stack:\n%s",
+                stalled_for,
+                stack,
+                extra={"category": "event_loop_lag"},
+            )
+
+    def stats(self) -> dict:
+        return {"max_lag_seconds": round(self.max_lag, 3), "stalls": self.stalls}
+
+
+def _frame_name(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def collapse_stack(frame: FrameType) -> str:
+    "Collapse a stack into frame names from the outermost to the innermost call, separated by semicolons"
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def sample_stacks(duration: float, interval: float = 0.005) -> Counter:
+    """
+    Sample the stacks of all other threads of this process every interval seconds, for duration seconds.
+    Returns how often each collapsed stack was seen, prefixed by the name of its thread
+    """
+    own_thread_id = threading.get_ident()
+    samples: Counter = Counter()
+    end_time = time.monotonic() + duration
+    while time.monotonic() < end_time:
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id != own_thread_id:
+                samples[f"{thread_names.get(thread_id, thread_id)};{collapse_stack(frame)}"] += 1
+        time.sleep(interval)
+    return samples
+
+
+def format_collapsed(samples: Counter) -> str:
+    "Format samples in the collapsed stack format of flamegraph.pl and speedscope: one 'stack count' per line"
+    return "".join(f"{stack} {count}\n" for stack, count in samples.most_common())
@@ -0,0 +1,30 @@
+# Standard Packages
+import json
+import logging
+import os
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class WebhookRecorder:
+    "Append webhook bodies, with the time they were received, to a JSONL file for replaying later"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        logger.info("Recording webhook bodies to %s", path)
+
+    def record(self, raw_body: bytes):
+        try:
+            body = json.loads(raw_body)
+        except ValueError:
+            logger.warning("Skipped recording webhook with a malformed JSON body")
+            return
+        line = json.dumps({"received_at": time.time(), "body": body}) + "\n"
+        # Append each record with a single write, so lines from concurrent workers do not interleave
+        with self._lock, open(self.path, "a") as f:
+            f.write(line)
@@ -0,0 +1,269 @@
+# Standard Packages
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+import logging
+import time
+from typing import AsyncIterator
+
+
+logger = logging.getLogger(__name__)
+
+
+class BackendBusyError(Exception):
+    "The backend cannot take more requests right now"
+
+
+class CircuitOpenError(BackendBusyError):
+    "The backend is failing, so requests to it are short-circuited"
+
+
+class BulkheadFullError(BackendBusyError):
+    "Too many callers are already waiting on a stage of work"
+
+
+class AdaptiveLimiter:
+    """
+    Limit concurrent requests to a backend, adapting the limit AIMD style from observed latency.
+    Latency is judged against the backend's own baseline, as response times vary a lot with the request.
+    The limit grows additively while the recent average latency stays within latency_tolerance times the
+    long term average, and shrinks multiplicatively when recent requests slow down past it, or fail.
+    """
+
+    def __init__(
+        self,
+        initial_limit: int,
+        min_limit: int,
+        max_limit: int,
+        latency_tolerance: float = 2.0,
+        backoff_ratio: float = 0.7,
+        acquire_timeout: float = None,
+        recent_window: int = 10,
+        baseline_window: int = 100,
+    ):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_tolerance = latency_tolerance
+        self.backoff_ratio = backoff_ratio
+        self.acquire_timeout = acquire_timeout
+        self.recent_window = recent_window
+        self.baseline_window = baseline_window
+        self.recent_latency: float = None
+        self.baseline_latency: float = None
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._condition:
+            try:
+                await asyncio.wait_for(
+                    self._condition.wait_for(lambda: self.in_flight < int(self.limit)), self.acquire_timeout
+                )
+            except asyncio.TimeoutError:
+                raise BackendBusyError(f"No request slot freed up within {self.acquire_timeout} seconds")
+            self.in_flight += 1
+
+    async def release(self, latency: float, ok: bool, adapt: bool = True):
+        async with self._condition:
+            self.in_flight -= 1
+            if adapt:
+                self._adapt(latency, ok)
+            self._condition.notify_all()
+
+    def _adapt(self, latency: float, ok: bool):
+        if ok:
+            self._observe_latency(latency)
+        if ok and self.recent_latency <= self.latency_tolerance * self.baseline_latency:
+            # Additive increase, by about one slot per limit's worth of fast requests
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        elif time.monotonic() - self._last_decrease > (self.recent_latency or latency):
+            # Multiplicative decrease, at most once per request time to not overreact to a burst
+            self.limit = max(self.min_limit, self.limit * self.backoff_ratio)
+            self._last_decrease = time.monotonic()
+            logger.warning(
+                "Reduced concurrency limit to %d. Latency: %.2fs, recent: %.2fs, baseline: %.2fs, ok: %s",
+                self.limit,
+                latency,
+                self.recent_latency or 0.0,
+                self.baseline_latency or 0.0,
+                ok,
+            )
+
+    def _observe_latency(self, latency: float):
+        "Update the moving averages of latency over recent requests and over the long term baseline"
+        if self.baseline_latency is None:
+            self.recent_latency = self.baseline_latency = latency
+            return
+        self.recent_latency += (latency - self.recent_latency) / self.recent_window
+        self.baseline_latency += (latency - self.baseline_latency) / self.baseline_window
+
+    def stats(self) -> dict:
+        return {
+            "concurrency_limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "recent_latency": round(self.recent_latency or 0.0, 3),
+            "baseline_latency": round(self.baseline_latency or 0.0, 3),
+        }
+
+
+class CircuitBreaker:
+    """
+    Fail fast once the error rate of recent requests to a backend crosses a threshold.
+    After a cooldown, a single trial request is let through to check if the backend recovered.
+    """
+
+    def __init__(self, error_threshold: float, min_requests: int, window: float, cooldown: float):
+        self.error_threshold = error_threshold
+        self.min_requests = min_requests
+        self.window = window
+        self.cooldown = cooldown
+        self.opened_at: float = None
+        self._trial_in_flight = False
+        self._outcomes: deque[tuple[float, bool]] = deque()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.cooldown:
+            return "open"
+        return "half-open"
+
+    @property
+    def accepting_requests(self) -> bool:
+        state = self.state
+        return state == "closed" or (state == "half-open" and not self._trial_in_flight)
+
+    def before_request(self):
+        state = self.state
+        if state == "open" or (state == "half-open" and self._trial_in_flight):
+            raise CircuitOpenError("Backend is failing, try again later")
+        if state == "half-open":
+            self._trial_in_flight = True
+
+    def cancel_request(self):
+        "Forget a request that was let through but never completed, like a cancelled trial request"
+        self._trial_in_flight = False
+
+    def record(self, ok: bool):
+        now = time.monotonic()
+        if self.opened_at is not None:
+            # Outcome of the trial request decides whether to close the circuit again
+            self._trial_in_flight = False
+            if ok:
+                logger.info("Circuit closed. Backend recovered")
+                self.opened_at = None
+                self._outcomes.clear()
+            else:
+                self.opened_at = now
+            return
+
+        self._outcomes.append((now, ok))
+        while self._outcomes and self._outcomes[0][0] < now - self.window:
+            self._outcomes.popleft()
+        failures = sum(1 for _, outcome in self._outcomes if not outcome)
+        if len(self._outcomes) >= self.min_requests and failures / len(self._outcomes) >= self.error_threshold:
+            logger.error("Circuit opened. %d of the last %d requests failed", failures, len(self._outcomes))
+            self.opened_at = now
+
+
+class RequestOutcome:
+    """
+    Handle to mark a guarded request as failed, for errors that are not raised as exceptions.
+    Streamed requests mark when the response started, so the time spent streaming it is not counted as latency
+    """
+
+    def __init__(self):
+        self.ok = True
+        self.first_byte_at: float = None
+
+    def failed(self):
+        self.ok = False
+
+    def first_byte(self):
+        self.first_byte_at = self.first_byte_at or time.monotonic()
+
+
+class GuardedBackend:
+    "Put a circuit breaker and an adaptive concurrency limiter in front of requests to a backend"
+
+    def __init__(self, name: str, limiter: AdaptiveLimiter, breaker: CircuitBreaker):
+        self.name = name
+        self.limiter = limiter
+        self.breaker = breaker
+
+    @asynccontextmanager
+    async def request(self) -> AsyncIterator[RequestOutcome]:
+        "Guard a request to the backend. Raises BackendBusyError when the backend should not be called"
+        self.breaker.before_request()
+        try:
+            await self.limiter.acquire()
+        except BaseException:
+            self.breaker.cancel_request()
+            raise
+
+        outcome = RequestOutcome()
+        start_time = time.monotonic()
+        cancelled = False
+        try:
+            yield outcome
+        except asyncio.CancelledError:
+            # Cancelled requests say nothing about the health of the backend
+            cancelled = True
+            raise
+        except Exception:
+            outcome.failed()
+            raise
+        finally:
+            if cancelled:
+                self.breaker.cancel_request()
+            else:
+                self.breaker.record(outcome.ok)
+            latency = (outcome.first_byte_at or time.monotonic()) - start_time
+            await self.limiter.release(latency, outcome.ok, adapt=not cancelled)
+
+    def stats(self) -> dict:
+        return {"circuit": self.breaker.state, **self.limiter.stats()}
+
+
+class Bulkhead:
+    """
+    Cap concurrent work in a stage, like transcription, so it cannot starve other stages.
+    A bounded number of callers wait for a slot, further callers are rejected with BulkheadFullError
+    """
+
+    def __init__(self, name: str, limit: int, max_waiting: int):
+        self.name = name
+        self.limit = limit
+        self.max_waiting = max_waiting
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._semaphore = asyncio.Semaphore(limit)
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        if self._semaphore.locked() and self.waiting >= self.max_waiting:
+            self.rejected += 1
+            raise BulkheadFullError(f"Too many {self.name} requests waiting")
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+        }
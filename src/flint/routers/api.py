@@ -1,28 +1,85 @@
 # Standard Packages
+import asyncio
+import hashlib
+import hmac
+import json
 import logging
 import os
-import requests
-from requests import Session
+import re
 import time
+import urllib.parse
+from typing import Callable, Optional
 import uuid
-from io import BytesIO
-from PIL import Image
 
 # External Packages
-from fastapi import APIRouter, status, Request, BackgroundTasks
-from fastapi.responses import Response
-from fastapi import Body
+try:
+    import orjson
+except ImportError:
+    orjson = None
+from fastapi import APIRouter, status, Request
+from fastapi.responses import PlainTextResponse, Response
+from prometheus_client import CONTENT_TYPE_LATEST
 
 # Internal Packages
+from flint.clients import whatsapp_client
 from flint.helpers import (
+    khoj_backends,
+    chat_bulkhead,
+    transcription_bulkhead,
+    upload_bulkhead,
     transcribe_audio_message,
     make_whatsapp_payload,
+    make_whatsapp_typing_payload,
+    send_whatsapp_payload,
+    send_whatsapp_chunks,
+    send_whatsapp_text,
+    PartialDeliveryError,
     send_message_to_khoj_chat,
+    stream_message_to_khoj_chat,
     make_whatsapp_image_payload,
-    upload_media_to_whatsapp,
     upload_document_to_khoj,
+    upload_documents_to_khoj,
 )
+from flint.images import upload_image_to_whatsapp
+from flint.message_queue import Job, MessageQueue, QueueConsumers, RetryLater
+from flint.metrics import MESSAGES, STAGE_LATENCY, StatsCollector, observe_stage, render_metrics
+from flint.outbound import whatsapp_outbound
+from flint.priority import classify_message, make_work_classes, message_deadline
+from flint.profiling import format_collapsed, sample_stacks
+from flint.record import WebhookRecorder
+from flint.resilience import BackendBusyError, BulkheadFullError
+from flint.store import TTLCache, TTLStore
 from flint.constants import (
+    DEDUP_PATH,
+    DEDUP_TTL,
+    MEDIA_CACHE_PATH,
+    TRANSCRIPT_TTL,
+    KHOJ_STREAM_RESPONSES,
+    COALESCE_WINDOW_SECONDS,
+    COALESCE_MAX_MESSAGES,
+    DOCUMENT_BATCH_WINDOW_SECONDS,
+    DOCUMENT_BATCH_MAX_COUNT,
+    DOCUMENT_BATCH_MAX_BYTES,
+    MEDIA_MAX_BYTES,
+    MEDIA_METADATA_CACHE_SIZE,
+    MEDIA_METADATA_TTL,
+    MEDIA_URL_EXPIRY_MARGIN,
+    WHATSAPP_API_URL,
+    WEBHOOK_RECORD_PATH,
+    QUEUE_PATH,
+    QUEUE_CONSUMERS,
+    QUEUE_POLL_INTERVAL,
+    QUEUE_VISIBILITY_TIMEOUT,
+    QUEUE_MAX_ATTEMPTS,
+    QUEUE_RETRY_BACKOFF,
+    QUEUE_MAX_IN_FLIGHT,
+    WORK_CLASS_PRIORITIES,
+    WORK_CLASS_DEADLINES,
+    WORK_CLASS_BUDGETS,
+    PROFILE_TOKEN,
+    PROFILE_MAX_SECONDS,
+    KHOJ_BUSY_MESSAGE,
+    KHOJ_EXPIRED_MESSAGE,
     KHOJ_INTRO_MESSAGE,
     KHOJ_FAILED_AUDIO_TRANSCRIPTION_MESSAGE,
     KHOJ_FAILED_DOCUMENT_UPLOAD_MESSAGE,
@@ -31,14 +88,40 @@ from flint.constants import (
 
 
 # Initialize Router
-whatsapp_cloud_api_session = Session()
-whatsapp_token = os.getenv("WHATSAPP_TOKEN")
-whatsapp_cloud_api_session.headers.update({"Authorization": f"Bearer {whatsapp_token}"})
 verify_token = os.getenv("WHATSAPP_VERIFY_TOKEN", "verify_token")
+# Secret of the Meta app, used to verify webhook payloads are signed by Meta
+app_secret = os.getenv("WHATSAPP_APP_SECRET")
 logger = logging.getLogger(__name__)
 api = APIRouter()
 
 SUPPORTED_FILE_TYPES = ["audio/ogg", "text/plain", "application/pdf"]
+# The messages key of a webhook with user messages. Status updates also have "field": "messages", as a value
+MESSAGES_KEY = re.compile(rb'"messages"\s*:')
+
+# Cheap, interactive messages are handled first. Costly messages cannot take up all the capacity
+work_classes = make_work_classes(WORK_CLASS_PRIORITIES, WORK_CLASS_DEADLINES, WORK_CLASS_BUDGETS)
+
+message_queue = MessageQueue(
+    QUEUE_PATH,
+    visibility_timeout=QUEUE_VISIBILITY_TIMEOUT,
+    max_attempts=QUEUE_MAX_ATTEMPTS,
+    retry_backoff=QUEUE_RETRY_BACKOFF,
+    max_in_flight=QUEUE_MAX_IN_FLIGHT,
+    class_budgets={name: work_class.budget for name, work_class in work_classes.items()},
+)
+queue_consumers: QueueConsumers = None
+
+# Record webhook bodies for load test replays, when enabled
+webhook_recorder = WebhookRecorder(WEBHOOK_RECORD_PATH) if WEBHOOK_RECORD_PATH else None
+
+# Ids of messages already received, to drop webhook redeliveries from Meta
+seen_messages = TTLStore(DEDUP_PATH, default_ttl=DEDUP_TTL)
+
+# Transcripts of voice notes by media id, so redelivered voice notes are not transcribed twice
+transcripts = TTLStore(MEDIA_CACHE_PATH, default_ttl=TRANSCRIPT_TTL)
+
+# Graph media metadata by media id, so retries and redeliveries skip the lookup
+media_metadata = TTLCache(maxsize=MEDIA_METADATA_CACHE_SIZE, default_ttl=MEDIA_METADATA_TTL)
 
 
 @api.get("/health")
@@ -46,19 +129,82 @@ async def health() -> Response:
     return Response(status_code=200)
 
 
+# Only one profile of a worker runs at a time
+profile_lock = asyncio.Lock()
+
+
+@api.get("/profile")
+async def profile(request: Request, seconds: float = 10.0, interval: float = 0.005):
+    """
+    Sample the stacks of the worker serving this request for a few seconds, while it keeps handling requests.
+    Returns collapsed stacks, for flamegraph.pl or speedscope. Requires the profile token as a bearer token
+    """
+    if not PROFILE_TOKEN:
+        return Response(status_code=404)
+    token = request.headers.get("Authorization", "").removeprefix("Bearer ")
+    if not hmac.compare_digest(token.encode(), PROFILE_TOKEN.encode()):
+        return Response(status_code=403)
+    if profile_lock.locked():
+        return Response("A profile is already running", status_code=409)
+
+    async with profile_lock:
+        duration = min(max(seconds, 0.1), PROFILE_MAX_SECONDS)
+        samples = await asyncio.to_thread(sample_stacks, duration, max(interval, 0.001))
+    return PlainTextResponse(format_collapsed(samples), headers={"X-Flint-Worker-Pid": str(os.getpid())})
+
+
+@api.get("/queue")
+async def queue_stats():
+    return await asyncio.to_thread(message_queue.stats)
+
+
+@api.get("/outbound")
+async def outbound_stats():
+    return whatsapp_outbound.stats()
+
+
+@api.get("/backends")
+async def backend_stats():
+    return {
+        khoj_backends.name: khoj_backends.stats(),
+        **{bulkhead.name: bulkhead.stats() for bulkhead in (chat_bulkhead, transcription_bulkhead, upload_bulkhead)},
+    }
+
+
+@api.get("/metrics")
+async def metrics():
+    queue_collector = StatsCollector("flint_queue", message_queue.stats, "Durable message queue")
+    content = await asyncio.to_thread(render_metrics, [queue_collector])
+    return Response(content=content, media_type=CONTENT_TYPE_LATEST)
+
+
 @api.get("/whatsapp_chat")
 async def whatsapp_chat(request: Request):
     return verify(request)
 
 
 @api.post("/whatsapp_chat", status_code=status.HTTP_200_OK)
-async def whatsapp_chat_post(
-    request: Request,
-    background_tasks: BackgroundTasks,
-    body=Body(...),
-):
-    background_tasks.add_task(handle_message, body)
-    return
+async def whatsapp_chat_post(request: Request):
+    # Read the raw body once. The signature is computed over these exact bytes
+    raw_body = await request.body()
+    if app_secret and not verify_signature(raw_body, request.headers.get("X-Hub-Signature-256")):
+        logger.warning("Dropped webhook with an invalid signature")
+        return Response(status_code=403)
+
+    if webhook_recorder:
+        await asyncio.to_thread(webhook_recorder.record, raw_body)
+
+    # Most webhooks are sent/delivered/read status updates. Acknowledge them without parsing or scheduling anything
+    if not MESSAGES_KEY.search(raw_body):
+        logger.debug("Acknowledged status update", extra={"category": "status"})
+        return Response(status_code=200)
+
+    try:
+        body = parse_json(raw_body)
+    except ValueError:
+        logger.warning("Dropped webhook with a malformed JSON body")
+        return Response(status_code=400)
+    return await handle_message(body)
 
 
 # Required webhook verification for WhatsApp
@@ -86,152 +232,518 @@ def verify(request):
         return Response(status_code=400)
 
 
-def verified_body(body):
-    entry = body.get("entry")
-    if not entry:
-        return False
-    changes = entry[0].get("changes")
-    if not changes:
+def verify_signature(raw_body: bytes, signature: Optional[str]) -> bool:
+    "Check the X-Hub-Signature-256 header is the HMAC-SHA256 of the raw body, keyed with the app secret"
+    if not signature or not signature.startswith("sha256="):
         return False
-    value = changes[0].get("value")
-    if not value:
-        return False
-    messages = value.get("messages")
-    if not messages:
-        return False
-    return True
+    expected = hmac.new(app_secret.encode(), raw_body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature.removeprefix("sha256="))
+
+
+def parse_json(raw_body: bytes):
+    "Parse JSON with orjson, when installed"
+    if orjson:
+        return orjson.loads(raw_body)
+    return json.loads(raw_body)
+
+
+def iter_messages(body):
+    "Yield the value and message of every message across all entries and changes of a webhook body"
+    for entry in body.get("entry") or []:
+        for change in entry.get("changes") or []:
+            value = change.get("value") or {}
+            for message in value.get("messages") or []:
+                yield value, message
+
+
+def verified_body(body):
+    return any(True for _ in iter_messages(body))
 
 
 # handle incoming webhook messages
 async def handle_message(body):
-    # Parse Request body in json format
-    logger.info(f"request body: {body}")
-
+    logger.debug("request body: %s", body, extra={"category": "request_body"})
     try:
         # info on WhatsApp text message payload:
         # https://developers.facebook.com/docs/whatsapp/cloud-api/webhooks/payload-examples#text-messages
-        if body.get("object"):
+        if isinstance(body, dict) and body.get("object"):
             if verified_body(body):
-                await handle_whatsapp_message(body)
+                await enqueue_whatsapp_messages(body)
             return Response(status_code=200)
         else:
             # if the request is not a WhatsApp API event, return an error
             return Response(status_code=404)
-    # catch all other errors and return an internal server error
+    # catch all other errors and return an internal server error, so the webhook is redelivered
     except Exception as e:
         logger.error(f"Error handling message: {e}", exc_info=True)
         return Response(status_code=500)
 
 
+# persist all WhatsApp messages batched in a webhook body to the message queue
+async def enqueue_whatsapp_messages(body):
+    messages = list(iter_messages(body))
+
+    # Drop messages redelivered by Meta before doing any work on them
+    message_ids = [message["id"] for _, message in messages]
+    is_new = await asyncio.to_thread(seen_messages.add_many, message_ids)
+    new_messages = [(value, message) for (value, message), new in zip(messages, is_new) if new]
+    for (_, message), new in zip(messages, is_new):
+        MESSAGES.labels(message["type"], "received" if new else "duplicate").inc()
+    if len(new_messages) < len(messages):
+        logger.info("Dropped %d duplicate messages", len(messages) - len(new_messages))
+    if not new_messages:
+        return
+
+    jobs = []
+    for value, message in new_messages:
+        work_class = work_classes[classify_message(message)]
+        payload = {"value": {"metadata": value.get("metadata")}, "message": message}
+        jobs.append((message["from"], payload, work_class.name, work_class.priority))
+    try:
+        await asyncio.to_thread(message_queue.put_many, jobs)
+    except Exception:
+        # Forget the messages, so they are accepted when Meta redelivers them
+        await asyncio.to_thread(seen_messages.delete_many, [message["id"] for _, message in new_messages])
+        raise
+    if queue_consumers:
+        queue_consumers.notify()
+
+
+# process a message from the queue. Messages from the same sender are dequeued in order
+async def handle_queued_message(job: Job):
+    if job.attempts == 1:
+        STAGE_LATENCY.labels("queue_wait").observe(time.time() - job.enqueued_at)
+
+    message = job.payload["message"]
+    if job.payload.get("pending_reply"):
+        await send_pending_reply(job)
+        return
+
+    # Drop work the user has likely given up waiting on, rather than spend capacity on it.
+    # Reactions need no reply, so there is no work to shed, nor a user to tell
+    work_class = work_classes[classify_message(message)]
+    if message["type"] != "reaction" and time.time() > message_deadline(message, work_class, job.enqueued_at):
+        await shed_expired_message(job)
+        return
+
+    if COALESCE_WINDOW_SECONDS > 0 and is_coalescible(message):
+        await coalesce_queued_messages(job, is_coalescible, COALESCE_WINDOW_SECONDS, COALESCE_MAX_MESSAGES)
+    elif DOCUMENT_BATCH_WINDOW_SECONDS > 0 and is_document(message):
+        await coalesce_queued_messages(job, is_document, DOCUMENT_BATCH_WINDOW_SECONDS, DOCUMENT_BATCH_MAX_COUNT)
+
+    messages = [message] + job.payload.get("coalesced", [])
+    try:
+        if len(messages) > 1 and is_document(message):
+            await handle_whatsapp_documents(job.payload["value"], messages)
+        elif len(messages) > 1:
+            await handle_coalesced_whatsapp_messages(job.payload["value"], messages)
+        else:
+            await handle_whatsapp_message(job.payload["value"], job.payload["message"])
+    except BulkheadFullError as e:
+        # Hold the messages back in the queue until the stage they wait on frees up, rather than turn them away
+        for message in messages:
+            MESSAGES.labels(message["type"], "deferred").inc()
+        raise RetryLater(QUEUE_RETRY_BACKOFF, str(e)) from e
+    except PartialDeliveryError as e:
+        # Keep the unsent part of the reply, so the retry sends it instead of generating a new reply
+        pending_reply = {"chunks": e.pending, "to": e.to, "phone_number_id": e.phone_number_id}
+        await asyncio.to_thread(message_queue.update, job, {**job.payload, "pending_reply": pending_reply})
+        for message in messages:
+            MESSAGES.labels(message["type"], "failed").inc()
+        raise
+    except Exception:
+        for message in messages:
+            MESSAGES.labels(message["type"], "failed").inc()
+        raise
+    for message in messages:
+        MESSAGES.labels(message["type"], "processed").inc()
+
+
+# send the rest of a reply that a previous attempt at the job could not send
+async def send_pending_reply(job: Job):
+    pending_reply = job.payload["pending_reply"]
+    messages = [job.payload["message"]] + job.payload.get("coalesced", [])
+    try:
+        await send_whatsapp_chunks(pending_reply["chunks"], pending_reply["to"], pending_reply["phone_number_id"])
+    except PartialDeliveryError as e:
+        pending_reply = {**pending_reply, "chunks": e.pending}
+        await asyncio.to_thread(message_queue.update, job, {**job.payload, "pending_reply": pending_reply})
+        raise
+    logger.info("Sent the remaining %d chunks of the reply to %s", len(pending_reply["chunks"]), pending_reply["to"])
+    for message in messages:
+        MESSAGES.labels(message["type"], "processed").inc()
+
+
+# let the user know their message expired in the queue before it could be handled
+async def shed_expired_message(job: Job):
+    message = job.payload["message"]
+    messages = [message] + job.payload.get("coalesced", [])
+    logger.warning("Shed %d expired %s messages from +%s", len(messages), message["type"], job.sender)
+    await response_to_user_whatsapp(
+        KHOJ_EXPIRED_MESSAGE, message["from"], job.payload["value"]["metadata"]["phone_number_id"], direct_message=True
+    )
+    for message in messages:
+        MESSAGES.labels(message["type"], "shed").inc()
+
+
+def is_coalescible(message) -> bool:
+    "Text and voice messages can be merged into a single query. Commands are always sent on their own"
+    if message["type"] == "text":
+        return not message["text"]["body"].startswith("/")
+    return message["type"] == "audio"
+
+
+def is_document(message) -> bool:
+    "Documents can be indexed in a single request"
+    return message["type"] == "document"
+
+
+async def coalesce_queued_messages(
+    job: Job, can_merge: Callable[[dict], bool], window_seconds: float, max_messages: int
+):
+    """
+    Wait for the sender to stop sending messages for the window,
+    then merge the consecutive messages they sent that can be merged into the job
+    """
+    merged = job.payload.get("coalesced", [])
+    while len(merged) + 1 < max_messages:
+        await asyncio.sleep(window_seconds)
+        next_jobs = []
+        next_job = await asyncio.to_thread(message_queue.next_from_sender, job)
+        while next_job and can_merge(next_job.payload["message"]):
+            next_jobs.append(next_job)
+            if len(merged) + len(next_jobs) + 1 >= max_messages:
+                break
+            next_job = await asyncio.to_thread(message_queue.next_from_sender, next_job)
+        if not next_jobs:
+            break
+
+        # Fold the jobs into this one, so a retry of this job also retries the merged messages
+        merged = merged + [merged_job.payload["message"] for merged_job in next_jobs]
+        await asyncio.to_thread(message_queue.merge, job, next_jobs, {**job.payload, "coalesced": merged})
+        logger.info("Coalesced %d more messages from +%s", len(next_jobs), job.sender)
+
+        # Stop waiting once a message that cannot be merged is queued behind this job
+        if next_job and not can_merge(next_job.payload["message"]):
+            break
+
+
+def start_queue_consumers():
+    global queue_consumers
+    queue_consumers = QueueConsumers(
+        message_queue, handle_queued_message, concurrency=QUEUE_CONSUMERS, poll_interval=QUEUE_POLL_INTERVAL
+    )
+    queue_consumers.start()
+
+
+async def stop_queue_consumers():
+    if queue_consumers:
+        await queue_consumers.stop()
+
+
+# handle consecutive text and voice messages from a sender as a single query
+async def handle_coalesced_whatsapp_messages(value, messages):
+    from_number = messages[0]["from"]
+    phone_number_id = value["metadata"]["phone_number_id"]
+    logger.info("%d coalesced messages received from +%s", len(messages), from_number)
+
+    if KHOJ_STREAM_RESPONSES:
+        try:
+            await send_whatsapp_payload(make_whatsapp_typing_payload(messages[-1]["id"]), phone_number_id)
+        except Exception as e:
+            logger.warning("Failed to send typing indicator to +%s: %s", from_number, e)
+
+    transcriptions = [asyncio.create_task(get_message_text(message, phone_number_id)) for message in messages]
+    try:
+        message_bodies = await asyncio.gather(*transcriptions)
+    finally:
+        # Stop the other transcriptions when one fails, so none holds a slot or runs alongside the retry of this job
+        for transcription in transcriptions:
+            transcription.cancel()
+        await asyncio.gather(*transcriptions, return_exceptions=True)
+    message_bodies = [message_body for message_body in message_bodies if message_body]
+    if not message_bodies:
+        await response_to_user_whatsapp(
+            KHOJ_FAILED_AUDIO_TRANSCRIPTION_MESSAGE, from_number, phone_number_id, direct_message=True
+        )
+        return
+    await response_to_user_whatsapp("\n".join(message_bodies), from_number, phone_number_id)
+
+
+# index documents sent by a user in quick succession with a single request to Khoj
+async def handle_whatsapp_documents(value, messages):
+    from_number = messages[0]["from"]
+    phone_number_id = value["metadata"]["phone_number_id"]
+    logger.info("%d batched documents received from +%s", len(messages), from_number)
+
+    # Look up all the documents at once. Skip unsupported or too large documents
+    lookups = await asyncio.gather(
+        *[
+            get_media_metadata(message["document"]["id"], message["document"].get("mime_type"), phone_number_id)
+            for message in messages
+        ],
+        return_exceptions=True,
+    )
+    documents = []
+    for lookup in lookups:
+        if isinstance(lookup, ValueError):
+            logger.warning("Skipped document: %s", lookup)
+        elif isinstance(lookup, BaseException):
+            raise lookup
+        else:
+            documents.append(lookup)
+
+    # Split the documents into uploads that fit the size limit
+    uploads: list[list[dict]] = []
+    upload_size = 0
+    for document in documents:
+        if not uploads or upload_size + int(document["file_size"]) > DOCUMENT_BATCH_MAX_BYTES:
+            uploads.append([])
+            upload_size = 0
+        uploads[-1].append(document)
+        upload_size += int(document["file_size"])
+
+    random_uuid = uuid.uuid4()
+    uploaded = 0
+    for upload in uploads:
+        try:
+            await upload_documents_to_khoj(
+                [(document["url"], document["mime_type"]) for document in upload],
+                random_uuid,
+                from_number,
+                phone_number_id,
+            )
+            uploaded += len(upload)
+        except BackendBusyError as e:
+            # Retry the batch later when the upload stage is full, unless part of it is already uploaded
+            if isinstance(e, BulkheadFullError) and uploaded == 0:
+                raise
+            logger.warning("Khoj is unavailable to upload documents: %r", e)
+            await response_to_user_whatsapp(KHOJ_BUSY_MESSAGE, from_number, phone_number_id, direct_message=True)
+            return
+        except Exception as e:
+            logger.error("Failed to upload %d documents: %s", len(upload), e, exc_info=True)
+
+    if uploaded == len(messages):
+        message_body = (
+            f"Thanks for sharing these {uploaded} documents with me! I've uploaded them to your Khoj account."
+        )
+    elif uploaded > 0:
+        message_body = (
+            f"I've uploaded {uploaded} of the {len(messages)} documents you shared to your Khoj account. "
+            f"Sorry, I wasn't able to process the other {len(messages) - uploaded}. "
+            "Could you please try sending them again?"
+        )
+    else:
+        message_body = KHOJ_FAILED_DOCUMENT_UPLOAD_MESSAGE
+    await response_to_user_whatsapp(message_body, from_number, phone_number_id, direct_message=True)
+
+
+# get the text of a text message, or the transcription of a voice message
+async def get_message_text(message, phone_number_id: str) -> Optional[str]:
+    if message["type"] == "text":
+        return message["text"]["body"]
+    try:
+        return await handle_audio_message(message["audio"]["id"], message["audio"].get("mime_type"), phone_number_id)
+    except BulkheadFullError:
+        raise
+    except (ValueError, BackendBusyError) as e:
+        logger.error("Failed to handle audio message: %s", e, exc_info=True)
+        return None
+
+
 # handle WhatsApp messages of different type
-async def handle_whatsapp_message(body):
-    value = body["entry"][0]["changes"][0]["value"]
-    from_number = value["messages"][0]["from"]
+async def handle_whatsapp_message(value, message):
+    from_number = message["from"]
+    phone_number_id = value["metadata"]["phone_number_id"]
 
     formatted_number = f"+{from_number}"
 
-    logger.info(f"{value['messages'][0]['type']} message received from {formatted_number}")
-    intro_message = value["messages"][0]["type"] == "request_welcome"
+    logger.info("%s message received from %s", message["type"], formatted_number)
+    intro_message = message["type"] == "request_welcome"
+
+    # Let the user know their message is being worked on while the response streams in
+    if KHOJ_STREAM_RESPONSES and message["type"] in ["text", "audio", "document"]:
+        try:
+            await send_whatsapp_payload(make_whatsapp_typing_payload(message["id"]), phone_number_id)
+        except Exception as e:
+            logger.warning("Failed to send typing indicator to %s: %s", formatted_number, e)
 
-    message = body["entry"][0]["changes"][0]["value"]["messages"][0]
     if message["type"] == "text":
-        logger.info("text message received")
         message_body = message["text"]["body"]
     elif message["type"] == "audio":
-        logger.info("audio message received")
         audio_id = message["audio"]["id"]
+        audio_mime_type = message["audio"].get("mime_type")
         try:
-            message_body = handle_audio_message(audio_id)
+            message_body = await handle_audio_message(audio_id, audio_mime_type, phone_number_id)
+        except BulkheadFullError:
+            raise
+        except BackendBusyError as e:
+            logger.warning("Too busy to transcribe audio message: %r", e)
+            await response_to_user_whatsapp(
+                KHOJ_BUSY_MESSAGE, from_number, phone_number_id, intro_message, direct_message=True
+            )
+            return
         except ValueError as e:
-            logger.error(f"Failed to handle audio message: {e}", exc_info=True)
+            logger.error("Failed to handle audio message: %s", e, exc_info=True)
+            message_body = None
+        if not message_body:
             await response_to_user_whatsapp(
-                KHOJ_FAILED_AUDIO_TRANSCRIPTION_MESSAGE, from_number, body, intro_message, direct_message=True
+                KHOJ_FAILED_AUDIO_TRANSCRIPTION_MESSAGE,
+                from_number,
+                phone_number_id,
+                intro_message,
+                direct_message=True,
             )
             return
     elif message["type"] == "document":
-        logger.info("document message received")
         document_id = message["document"]["id"]
+        document_mime_type = message["document"].get("mime_type")
         try:
-            success = handle_document_message(document_id, from_number)
+            success = await handle_document_message(document_id, from_number, document_mime_type, phone_number_id)
             if success:
                 message_body = "Thanks for sharing this document with me! I've uploaded it to your Khoj account."
             else:
                 message_body = KHOJ_FAILED_DOCUMENT_UPLOAD_MESSAGE
-            await response_to_user_whatsapp(message_body, from_number, body, intro_message, direct_message=True)
+            await response_to_user_whatsapp(
+                message_body, from_number, phone_number_id, intro_message, direct_message=True
+            )
+            return
+        except BulkheadFullError:
+            raise
+        except BackendBusyError as e:
+            logger.warning("Khoj is unavailable to upload document: %r", e)
+            await response_to_user_whatsapp(
+                KHOJ_BUSY_MESSAGE, from_number, phone_number_id, intro_message, direct_message=True
+            )
             return
         except ValueError as e:
             logger.error(f"Failed to handle document message: {e}", exc_info=True)
             await response_to_user_whatsapp(
-                KHOJ_FAILED_DOCUMENT_UPLOAD_MESSAGE, from_number, body, intro_message, direct_message=True
+                KHOJ_FAILED_DOCUMENT_UPLOAD_MESSAGE, from_number, phone_number_id, intro_message, direct_message=True
             )
             return
     elif message["type"] == "reaction":
-        logger.info(f"reaction message received: {message['reaction']['emoji']}")
+        logger.info("reaction message received: %s", message["reaction"]["emoji"])
         return
     else:
         logger.error(f"Unsupported message type: {message['type']}", exc_info=True)
         await response_to_user_whatsapp(
-            KHOJ_MEDIA_NOT_IMPLEMENTED_MESSAGE, from_number, body, intro_message, direct_message=True
+            KHOJ_MEDIA_NOT_IMPLEMENTED_MESSAGE, from_number, phone_number_id, intro_message, direct_message=True
         )
         return
-    await response_to_user_whatsapp(message_body, from_number, body, intro_message)
+    await response_to_user_whatsapp(message_body, from_number, phone_number_id, intro_message)
 
 
 # handle audio messages
-def handle_audio_message(audio_id):
+async def handle_audio_message(audio_id, mime_type=None, phone_number_id=None):
+    transcript_key = f"transcript:{audio_id}"
+    transcript = await asyncio.to_thread(transcripts.get, transcript_key)
+    if transcript:
+        logger.info("Reusing transcript of audio message %s", audio_id)
+        return transcript
+
     random_uuid = uuid.uuid4()
-    audio_url, mime_type = get_media_url(audio_id)
-    return transcribe_audio_message(audio_url, random_uuid, logger)
+    audio_url, mime_type = await get_media_url(audio_id, mime_type, phone_number_id)
+    transcript = await transcribe_audio_message(audio_url, random_uuid, logger, phone_number_id)
+    if transcript:
+        await asyncio.to_thread(transcripts.set, transcript_key, transcript)
+    return transcript
 
 
 # handle document messages
-def handle_document_message(document_id, phone_id):
+async def handle_document_message(document_id, phone_id, mime_type=None, phone_number_id=None):
     random_uuid = uuid.uuid4()
-    document_url, mime_type = get_media_url(document_id)
-    return upload_document_to_khoj(document_url, random_uuid, phone_id, mime_type)
+    document_url, mime_type = await get_media_url(document_id, mime_type, phone_number_id)
+    return await upload_document_to_khoj(document_url, random_uuid, phone_id, mime_type, phone_number_id)
 
 
-# get the media url from the media id
-def get_media_url(media_id):
-    url = f"https://graph.facebook.com/v16.0/{media_id}/"
-    response = whatsapp_cloud_api_session.get(url).json()
-    mime_type = response["mime_type"]
-    if mime_type not in SUPPORTED_FILE_TYPES:
+def check_media_type(mime_type: str):
+    # Webhooks can send mime types with parameters, like audio/ogg; codecs=opus
+    if mime_type.split(";")[0].strip() not in SUPPORTED_FILE_TYPES:
         logger.info(f"Unsupported file type: {mime_type}")
         raise ValueError(f"Unsupported file type: {mime_type}")
 
-    file_size = response["file_size"]
-    # If the media is larger than 10 MB, return None
-    if int(file_size) > 10 * 1024 * 1024:
-        logger.info(f"Media is larger than 10 MB, skipping")
-        raise ValueError(f"Media is larger than 10 MB")
-    return response["url"], response["mime_type"]
 
+def get_media_url_ttl(media_url: str) -> float:
+    "Time to cache metadata for, expiring it before Graph's signed download URL does. Its ext param is the expiry"
+    expiry = urllib.parse.parse_qs(urllib.parse.urlparse(media_url).query).get("ext")
+    if not expiry or not expiry[0].isdigit():
+        return MEDIA_METADATA_TTL
+    return min(MEDIA_METADATA_TTL, int(expiry[0]) - time.time() - MEDIA_URL_EXPIRY_MARGIN)
 
-async def response_to_user_whatsapp(message: str, from_number: str, body, intro_message=False, direct_message=False):
+
+# get the media url from the media id
+async def get_media_url(media_id, mime_type=None, phone_number_id=None):
+    metadata = await get_media_metadata(media_id, mime_type, phone_number_id)
+    return metadata["url"], metadata["mime_type"]
+
+
+# get the url, mime type and size of media from its id, with the credentials of the business number it was sent to
+async def get_media_metadata(media_id, mime_type=None, phone_number_id=None) -> dict:
+    # Reject unsupported media by the mime type in the webhook, before any request to Graph
+    if mime_type:
+        check_media_type(mime_type)
+
+    metadata = media_metadata.get(media_id)
+    if metadata is None:
+        url = f"{WHATSAPP_API_URL}/v16.0/{media_id}/"
+        with observe_stage("media_url"):
+            metadata = (await whatsapp_client(phone_number_id).get(url)).json()
+        if "url" in metadata:
+            media_metadata.set(media_id, metadata, ttl=get_media_url_ttl(metadata["url"]))
+    check_media_type(metadata["mime_type"])
+
+    file_size = metadata["file_size"]
+    # Skip media reported to be too large early. The download also enforces this limit
+    if int(file_size) > MEDIA_MAX_BYTES:
+        logger.info("Media is larger than %d bytes, skipping", MEDIA_MAX_BYTES)
+        raise ValueError(f"Media is larger than {MEDIA_MAX_BYTES} bytes")
+    return metadata
+
+
+async def response_to_user_whatsapp(
+    message: str, from_number: str, phone_number_id: str, intro_message=False, direct_message=False
+):
     # Initialize user message to the body of the request
     user_message = message
 
-    value = body["entry"][0]["changes"][0]["value"]
-    phone_number_id = value["metadata"]["phone_number_id"]
-    url = "https://graph.facebook.com/v17.0/" + phone_number_id + "/messages"
-
     # Send Intro Message
     if intro_message:
         data = make_whatsapp_payload(KHOJ_INTRO_MESSAGE, from_number)
-        response = whatsapp_cloud_api_session.post(url, json=data)
-        logger.info(f"Intro message sent to {from_number}")
-        response.raise_for_status()
+        await send_whatsapp_payload(data, phone_number_id)
+        logger.info("Intro message sent to %s", from_number)
 
     if direct_message:
         # We've constructed a templated response to the user. No need to route to the LLM.
-        data = make_whatsapp_payload(user_message, from_number)
-        response = whatsapp_cloud_api_session.post(url, json=data)
-        response.raise_for_status()
+        await send_whatsapp_text(user_message, from_number, phone_number_id)
         return
 
     # Get Response from Agent
-    chat_response = send_message_to_khoj_chat(user_message, from_number)
+    if KHOJ_STREAM_RESPONSES:
+        sent_paragraphs = 0
+        unsent_paragraphs: list[str] = []
+
+        async def send_paragraph(paragraph: str):
+            nonlocal sent_paragraphs
+            # Once a paragraph fails to send, hold back the rest of the reply to keep it in order
+            if not unsent_paragraphs:
+                try:
+                    await send_whatsapp_chunks([paragraph], from_number, phone_number_id)
+                    sent_paragraphs += 1
+                    return
+                except PartialDeliveryError:
+                    pass
+            unsent_paragraphs.append(paragraph)
+
+        chat_response = await stream_message_to_khoj_chat(user_message, from_number, send_paragraph, phone_number_id)
+        if unsent_paragraphs:
+            raise PartialDeliveryError(unsent_paragraphs, sent_paragraphs, from_number, phone_number_id)
+        if chat_response is None:
+            # The text response was already sent to the user as it streamed in
+            return
+    else:
+        chat_response = await send_message_to_khoj_chat(user_message, from_number, phone_number_id)
 
     if chat_response.get("response"):
         chat_response_text = chat_response.get("response")
@@ -239,28 +751,21 @@ async def response_to_user_whatsapp(message: str, from_number: str, body, intro_
             if chat_response_text.get("image"):
                 media_url = chat_response_text["image"]
                 if media_url:
-                    # Write the file to a tmp directory
-                    filepath = f"/tmp/{int(time.time() * 1000)}.png"
-                    response = requests.get(media_url)
-                    response.raise_for_status()
-
-                    # The incoming image is a link to a webp image. We need to convert it to a png image.
-                    image = Image.open(BytesIO(response.content))
-                    image.save(filepath, "PNG")
-
-                    media_id = upload_media_to_whatsapp(filepath, "image/png", phone_number_id)
+                    try:
+                        media_id = await upload_image_to_whatsapp(media_url, phone_number_id)
+                    except BulkheadFullError:
+                        raise
+                    except BackendBusyError as e:
+                        logger.warning("Too busy to upload image: %r", e)
+                        data = make_whatsapp_payload(KHOJ_BUSY_MESSAGE, from_number)
+                        await send_whatsapp_payload(data, phone_number_id)
+                        return
                     data = make_whatsapp_image_payload(media_id, from_number)
-                    response = whatsapp_cloud_api_session.post(url, json=data)
-                    response.raise_for_status()
-                    os.remove(filepath)
+                    await send_whatsapp_payload(data, phone_number_id)
         except AttributeError:
-            data = make_whatsapp_payload(chat_response_text, from_number)
-            response = whatsapp_cloud_api_session.post(url, json=data)
-            response.raise_for_status()
+            await send_whatsapp_text(chat_response_text, from_number, phone_number_id)
     elif chat_response.get("detail"):
         chat_response_text = chat_response["detail"]
-        data = make_whatsapp_payload(chat_response_text, from_number)
-        response = whatsapp_cloud_api_session.post(url, json=data)
-        response.raise_for_status()
+        await send_whatsapp_text(chat_response_text, from_number, phone_number_id)
     else:
         logger.error(f"Unsupported response type: {chat_response}", exc_info=True)
@@ -1,14 +1,15 @@
 # Standard Packages
 import base64
-import time
+import binascii
 from typing import Optional
 
 # External Packages
 from fastapi import APIRouter, Request, Body
-from fastapi.responses import Response
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
 from fastapi.params import Form
 
 # Internal Packages
+from flint.bench.evaluate import evaluate, parse_prompts
 from flint.helpers import send_message_to_khoj_chat
 
 
@@ -23,23 +24,27 @@ async def chat_dev(
     body=Body(...),
     phone_number: Optional[str] = Form(None),
 ) -> Response:
-    chat_response = send_message_to_khoj_chat(body, phone_number)
-
-    if chat_response.get("response"):
-        response = chat_response.get("response")
-        # Try parsing to see if the response is a JSON object
-        try:
-            if response.get("image"):
-                encoded_img = response["image"]
-                if encoded_img:
-                    # Write the file to a tmp directory
-                    filepath = f"/tmp/{int(time.time() * 1000)}.png"
-                    with open(filepath, "wb") as f:
-                        f.write(base64.b64decode(encoded_img))
-                chat_response_text = f"Image saved to {filepath}"
-        except AttributeError:
-            chat_response_text = chat_response["response"]
-    elif chat_response.get("detail"):
-        chat_response_text = chat_response["detail"]
-
-    return chat_response_text
+    chat_response = await send_message_to_khoj_chat(body, phone_number)
+
+    response = chat_response.get("response") or chat_response.get("detail")
+    if not isinstance(response, dict):
+        return response
+
+    # Return generated images in the response, rather than saving them on the server
+    image = response.get("image") or ""
+    if image.startswith(("http://", "https://")):
+        return PlainTextResponse(f"Image at {image}")
+    try:
+        return Response(content=base64.b64decode(image, validate=True), media_type="image/png")
+    except binascii.Error:
+        return JSONResponse(response)
+
+
+@dev.post("/evaluate")
+async def evaluate_dev(request: Request, parallelism: int = 8, phone_number: str = "10000000000"):
+    "Send the JSONL prompts in the request body to Khoj concurrently. Report latency, errors and response size"
+    try:
+        prompts = parse_prompts((await request.body()).decode().splitlines())
+    except (UnicodeDecodeError, ValueError) as e:
+        return JSONResponse({"detail": str(e)}, status_code=400)
+    return await evaluate(prompts, send_message_to_khoj_chat, max(1, parallelism), phone_number)
@@ -0,0 +1,150 @@
+# Standard Packages
+from collections import OrderedDict
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any
+
+
+logger = logging.getLogger(__name__)
+
+
+class TTLStore:
+    """
+    Key-value store with per-key expiry, backed by SQLite.
+
+    Safe to share between worker processes on the same host, unlike per-process dicts.
+    Lookups and inserts use the primary key index. Expired keys are evicted via the expiry index every so many writes.
+    """
+
+    def __init__(self, path: str, default_ttl: float, evict_every: int = 1000):
+        self.path = path
+        self.default_ttl = default_ttl
+        self.evict_every = evict_every
+        self._writes = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=10.0, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value TEXT, expires_at REAL NOT NULL);
+            CREATE INDEX IF NOT EXISTS entries_expires ON entries (expires_at);
+            """
+        )
+
+    def add_many(self, keys: list[str], ttl: float = None) -> list[bool]:
+        "Insert keys that are not already present. Returns, per key, whether it was newly added"
+        now = time.time()
+        expires_at = now + (ttl or self.default_ttl)
+        added = []
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                for key in keys:
+                    cursor = self._db.execute(
+                        """
+                        INSERT INTO entries (key, value, expires_at) VALUES (?, NULL, ?)
+                        ON CONFLICT (key) DO UPDATE SET value = NULL, expires_at = excluded.expires_at
+                        WHERE entries.expires_at <= ?
+                        """,
+                        (key, expires_at, now),
+                    )
+                    added.append(cursor.rowcount == 1)
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+            self._maybe_evict(len(keys))
+        return added
+
+    def add(self, key: str, ttl: float = None) -> bool:
+        "Insert key if it is not already present. Returns whether it was newly added"
+        return self.add_many([key], ttl)[0]
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value FROM entries WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+        if row is None or row[0] is None:
+            return default
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl: float = None):
+        expires_at = time.time() + (ttl or self.default_ttl)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires_at),
+            )
+            self._maybe_evict(1)
+
+    def delete_many(self, keys: list[str]):
+        with self._lock:
+            self._db.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key in keys])
+
+    def evict_expired(self) -> int:
+        with self._lock:
+            return self._evict()
+
+    def _maybe_evict(self, writes: int):
+        self._writes += writes
+        if self._writes >= self.evict_every:
+            self._writes = 0
+            self._evict()
+
+    def _evict(self) -> int:
+        evicted = self._db.execute("DELETE FROM entries WHERE expires_at <= ?", (time.time(),)).rowcount
+        if evicted:
+            logger.debug("Evicted %d expired entries from %s", evicted, self.path)
+        return evicted
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class TTLCache:
+    """
+    In-process LRU cache with per-key expiry.
+    For small, hot lookups that are cheap to redo in another worker, unlike the TTLStore
+    """
+
+    def __init__(self, maxsize: int, default_ttl: float):
+        self.maxsize = maxsize
+        self.default_ttl = default_ttl
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return default
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, ttl: float = None):
+        ttl = self.default_ttl if ttl is None else ttl
+        if ttl <= 0:
+            self._entries.pop(key, None)
+            return
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        # Forget the least recently used keys
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def delete(self, key: str):
+        self._entries.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,58 @@
+# Standard Packages
+from dataclasses import dataclass, fields
+import json
+import logging
+from typing import Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Tenant:
+    "A WhatsApp business number served by this deployment, with its own credentials and send budget"
+
+    phone_number_id: str
+    whatsapp_token: Optional[str]
+    khoj_client_id: Optional[str]
+    khoj_client_secret: Optional[str]
+    # Sustained messages per second, and burst, sent from the number
+    send_rate: float
+    send_burst: float
+
+
+class TenantRegistry:
+    "Look up the tenant of a business phone number id. Numbers without a tenant of their own use the default tenant"
+
+    def __init__(self, default: Tenant, tenants: list[Tenant] = None):
+        self.default = default
+        self.tenants = {tenant.phone_number_id: tenant for tenant in tenants or []}
+
+    def get(self, phone_number_id: Optional[str] = None) -> Tenant:
+        return self.tenants.get(phone_number_id, self.default)
+
+    @classmethod
+    def load(cls, path: Optional[str], default: Tenant) -> "TenantRegistry":
+        """
+        Load tenants from a JSON file mapping business phone number ids to their settings,
+        like {"1234": {"whatsapp_token": "...", "khoj_client_id": "...", "khoj_client_secret": "...", "send_rate": 10}}.
+        Settings a tenant leaves out are taken from the default tenant
+        """
+        if not path:
+            return cls(default)
+
+        with open(path) as f:
+            settings_by_number = json.load(f)
+
+        known_settings = {field.name for field in fields(Tenant)} - {"phone_number_id"}
+        tenants = []
+        for phone_number_id, settings in settings_by_number.items():
+            unknown_settings = set(settings) - known_settings
+            if unknown_settings:
+                raise ValueError(
+                    f"Unknown settings for tenant {phone_number_id}: {', '.join(sorted(unknown_settings))}"
+                )
+            defaults = {name: getattr(default, name) for name in known_settings}
+            tenants.append(Tenant(phone_number_id=phone_number_id, **{**defaults, **settings}))
+        logger.info("Loaded %d tenants from %s", len(tenants), path)
+        return cls(default, tenants)
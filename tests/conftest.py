@@ -0,0 +1,28 @@
+# Standard Packages
+import os
+import tempfile
+
+# External Packages
+import httpx
+import pytest
+
+
+# Keep the queue, dedup and media cache databases created on import out of the user's data directory
+os.environ.setdefault("FLINT_DATA_DIR", tempfile.mkdtemp(prefix="flint-test-"))
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def mock_khoj(monkeypatch):
+    "Send Khoj chat requests to the stand-in Khoj app of the load test mocks. Returns the mock's state"
+    from flint import helpers
+    from flint.bench.mocks import EndpointProfile, create_mock_app
+
+    app = create_mock_app({"khoj_chat": EndpointProfile(median=0.01)})
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app))
+    monkeypatch.setattr(helpers, "khoj_client", lambda phone_number_id=None: client)
+    return app.state.mock
@@ -0,0 +1,85 @@
+# Standard Packages
+import struct
+
+# External Packages
+import pytest
+
+# Internal Packages
+from flint.audio import (
+    OGG_PAGE_HEADER,
+    AudioTooLongError,
+    iter_pages,
+    limit_audio_duration,
+    probe_ogg,
+    trim_ogg,
+)
+
+
+def make_page(body: bytes, granule_position: int, sequence: int) -> bytes:
+    "Make an Ogg page. The CRC is left empty, as Flint does not check it"
+    segments = [255] * (len(body) // 255) + [len(body) % 255]
+    header = OGG_PAGE_HEADER.pack(b"OggS", 0, 0, granule_position, 1, sequence, 0, len(segments))
+    return header + bytes(segments) + body
+
+
+def make_opus(seconds: list[float], pre_skip: int = 312) -> bytes:
+    "Ogg Opus stream with an audio page ending at each of the given times"
+    head = b"OpusHead" + struct.pack("<BBHIhB", 1, 1, pre_skip, 16000, 0, 0)
+    pages = [make_page(head, 0, 0), make_page(b"OpusTags" + bytes(8), 0, 1)]
+    for sequence, end in enumerate(seconds, start=2):
+        pages.append(make_page(bytes(300), pre_skip + int(end * 48000), sequence))
+    return b"".join(pages)
+
+
+def make_vorbis(seconds: list[float], rate: int = 44100) -> bytes:
+    "Ogg Vorbis stream with an audio page ending at each of the given times"
+    head = b"\x01vorbis" + struct.pack("<IBIiii", 0, 1, rate, 0, 0, 0) + b"\xb8\x01"
+    pages = [make_page(head, 0, 0), make_page(b"\x03vorbis" + bytes(8), -1, 1)]
+    for sequence, end in enumerate(seconds, start=2):
+        pages.append(make_page(bytes(100), int(end * rate), sequence))
+    return b"".join(pages)
+
+
+def test_probe_opus_duration_excludes_pre_skip():
+    info = probe_ogg(make_opus([10, 20, 30.5]))
+    assert (info.granule_rate, info.pre_skip) == (48000, 312)
+    assert info.duration == pytest.approx(30.5)
+
+
+def test_probe_vorbis_duration_uses_sample_rate():
+    info = probe_ogg(make_vorbis([5, 12.5], rate=22050))
+    assert (info.granule_rate, info.pre_skip) == (22050, 0)
+    assert info.duration == pytest.approx(12.5)
+
+
+def test_probe_skips_truncated_last_page():
+    data = make_opus([10, 20, 30])
+    info = probe_ogg(data[:-50])
+    assert info.duration == pytest.approx(20)
+
+
+def test_probe_rejects_non_ogg_audio():
+    assert probe_ogg(b"") is None
+    assert probe_ogg(b"ID3\x04" + bytes(200)) is None
+    assert probe_ogg(make_opus([10])[:20]) is None
+    # Ogg container around a codec we do not know
+    assert probe_ogg(make_page(b"\x80theora" + bytes(40), 0, 0)) is None
+
+
+def test_trim_keeps_whole_pages_within_limit():
+    data = make_opus([10, 20, 30, 40])
+    trimmed = trim_ogg(data, probe_ogg(data), max_duration=25)
+    assert data.startswith(trimmed)
+    assert len(list(iter_pages(trimmed))) == 4
+    assert probe_ogg(trimmed).duration == pytest.approx(20)
+
+
+def test_limit_audio_duration():
+    data = make_vorbis([30, 60, 90])
+    assert limit_audio_duration(data, max_duration=90, trim=False) is data
+    assert probe_ogg(limit_audio_duration(data, max_duration=75, trim=True)).duration == pytest.approx(60)
+    with pytest.raises(AudioTooLongError):
+        limit_audio_duration(data, max_duration=75, trim=False)
+
+    # Audio we cannot measure is passed through
+    assert limit_audio_duration(b"RIFF" + bytes(100), max_duration=1, trim=False) == b"RIFF" + bytes(100)
@@ -0,0 +1,18 @@
+# Internal Packages
+from flint.balancer import BackendPool
+from flint.helpers import make_khoj_replica
+
+
+def test_stats_do_not_expose_replica_urls():
+    pool = BackendPool(
+        "khoj", [make_khoj_replica("http://khoj-0.internal:42110"), make_khoj_replica("http://10.0.0.2")]
+    )
+    stats = pool.stats()
+    assert [replica["replica"] for replica in stats] == [0, 1]
+    assert all(replica["healthy"] for replica in stats)
+    assert "internal" not in repr(stats) and "10.0.0.2" not in repr(stats)
+
+
+def test_sticky_routing_sends_same_key_to_same_replica():
+    pool = BackendPool("khoj", [make_khoj_replica(f"http://khoj-{i}") for i in range(3)], sticky=True)
+    assert len({pool.pick("15550001111").url for _ in range(5)}) == 1
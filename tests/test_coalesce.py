@@ -0,0 +1,132 @@
+# Standard Packages
+import asyncio
+
+# External Packages
+import pytest
+
+# Internal Packages
+from flint.message_queue import Job, MessageQueue
+from flint.resilience import BulkheadFullError
+from flint.routers import api
+from flint.routers.api import coalesce_queued_messages, is_coalescible
+
+
+SENDER = "15550001111"
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    queue = MessageQueue(str(tmp_path / "queue.db"))
+    monkeypatch.setattr(api, "message_queue", queue)
+    yield queue
+    queue.close()
+
+
+def put_texts(queue: MessageQueue, *texts: str):
+    jobs = []
+    for text in texts:
+        message = {"from": SENDER, "id": f"wamid.{text}", "type": "text", "text": {"body": text}}
+        jobs.append((SENDER, {"value": {"metadata": {"phone_number_id": "1234"}}, "message": message}, "text", 0))
+    queue.put_many(jobs)
+
+
+def job_texts(job: Job) -> list[str]:
+    messages = [job.payload["message"]] + job.payload.get("coalesced", [])
+    return [message["text"]["body"] for message in messages]
+
+
+async def coalesce(job: Job, window_seconds: float = 0, max_messages: int = 10):
+    await coalesce_queued_messages(job, is_coalescible, window_seconds, max_messages)
+
+
+@pytest.mark.anyio
+async def test_text_messages_are_merged_into_claimed_job(queue):
+    put_texts(queue, "Hi", "how are", "you?")
+    job = queue.claim()
+    await coalesce(job)
+
+    assert job_texts(job) == ["Hi", "how are", "you?"]
+    # The merged jobs are removed from the queue, so they are not handled again
+    assert queue.claim() is None
+    queue.ack(job)
+    assert queue.stats()["depth"] == 0
+
+
+@pytest.mark.anyio
+async def test_messages_sent_during_window_are_merged(queue):
+    put_texts(queue, "Hi")
+    job = queue.claim()
+
+    async def send_later():
+        await asyncio.sleep(0.01)
+        put_texts(queue, "there")
+
+    await asyncio.gather(coalesce(job, window_seconds=0.05), send_later())
+    assert job_texts(job) == ["Hi", "there"]
+
+
+@pytest.mark.anyio
+async def test_command_ends_the_merged_messages(queue):
+    put_texts(queue, "Hi", "draw a cat", "/dream a cat", "thanks")
+    job = queue.claim()
+    await coalesce(job)
+
+    assert job_texts(job) == ["Hi", "draw a cat"]
+    queue.ack(job)
+    assert job_texts(queue.claim()) == ["/dream a cat"]
+
+
+@pytest.mark.anyio
+async def test_merged_messages_are_capped(queue):
+    put_texts(queue, "1", "2", "3", "4", "5")
+    job = queue.claim()
+    await coalesce(job, max_messages=3)
+
+    assert job_texts(job) == ["1", "2", "3"]
+    queue.ack(job)
+    assert job_texts(queue.claim()) == ["4"]
+
+
+@pytest.mark.anyio
+async def test_retried_job_keeps_its_merged_messages(queue):
+    put_texts(queue, "1", "2")
+    job = queue.claim()
+    await coalesce(job, max_messages=3)
+    queue.release(job)
+
+    put_texts(queue, "3", "4")
+    retried = queue.claim()
+    assert retried.id == job.id
+    assert job_texts(retried) == ["1", "2"]
+
+    # Messages merged by the earlier attempt count towards the cap
+    await coalesce(retried, max_messages=3)
+    assert job_texts(retried) == ["1", "2", "3"]
+
+
+def make_voice_note(media_id: str) -> dict:
+    return {"from": SENDER, "id": f"wamid.{media_id}", "type": "audio", "audio": {"id": media_id}}
+
+
+@pytest.mark.anyio
+async def test_full_transcription_stage_cancels_other_transcriptions(monkeypatch):
+    running = set()
+
+    async def handle_audio_message(audio_id, mime_type=None, phone_number_id=None):
+        if audio_id == "full":
+            await asyncio.sleep(0.01)
+            raise BulkheadFullError("transcription")
+        running.add(audio_id)
+        try:
+            await asyncio.sleep(10)
+        finally:
+            running.discard(audio_id)
+
+    monkeypatch.setattr(api, "KHOJ_STREAM_RESPONSES", False)
+    monkeypatch.setattr(api, "handle_audio_message", handle_audio_message)
+    messages = [make_voice_note("a"), make_voice_note("full"), make_voice_note("b")]
+
+    with pytest.raises(BulkheadFullError):
+        await api.handle_coalesced_whatsapp_messages({"metadata": {"phone_number_id": "1234"}}, messages)
+    # No transcription is left running alongside the retry of the job
+    assert running == set()
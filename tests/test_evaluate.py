@@ -0,0 +1,85 @@
+# External Packages
+import pytest
+
+# Internal Packages
+from flint.bench.evaluate import EvalResult, check_evaluation, evaluate, parse_prompts, summarize_command
+from flint.helpers import send_message_to_khoj_chat
+
+
+def test_parse_prompts():
+    lines = [
+        '{"prompt": "What is the weather in Paris?", "command": "/online"}',
+        "",
+        '{"prompt": "/dream a lighthouse", "command": "/dream"}',
+        '{"prompt": "Summarize my notes"}',
+    ]
+    assert parse_prompts(lines) == [
+        "/online What is the weather in Paris?",
+        "/dream a lighthouse",
+        "Summarize my notes",
+    ]
+
+
+@pytest.mark.parametrize("line", ["not json", '{"command": "/online"}', "[1, 2]"])
+def test_parse_prompts_rejects_invalid_lines(line):
+    with pytest.raises(ValueError, match="line 2"):
+        parse_prompts(['{"prompt": "Hi"}', line])
+
+
+def test_summarize_command_excludes_failures_from_latency():
+    results = [EvalResult("/default", latency, 100 * latency) for latency in range(1, 11)] + [
+        EvalResult("/default", 0.01, 0, error="busy"),
+        EvalResult("/default", 0.02, 0, error="busy"),
+    ]
+    summary = summarize_command(results)
+    assert summary["count"] == 12
+    assert summary["error_rate"] == round(2 / 12, 3)
+    assert summary["errors"] == {"busy": 2}
+    assert summary["latency_seconds"]["mean"] == 5.5
+    assert summary["latency_seconds"]["p50"] >= 5
+    assert summary["response_chars"]["max"] == 1000
+
+
+def test_summarize_command_without_results():
+    summary = summarize_command([])
+    assert summary["error_rate"] == 0.0
+    assert summary["latency_seconds"]["mean"] is None
+    assert summary["response_chars"]["max"] is None
+
+
+def test_check_evaluation_reports_exceeded_budgets():
+    report = {
+        **summarize_command([EvalResult("/online", 12.0, 500), EvalResult("/default", 2.0, 500)]),
+        "commands": {
+            "/default": summarize_command([EvalResult("/default", 2.0, 500)]),
+            "/online": summarize_command([EvalResult("/online", 12.0, 500), EvalResult("/online", 0.1, 0, "busy")]),
+        },
+    }
+    assert check_evaluation(report, max_p95=None, max_error_rate=None) == []
+    assert check_evaluation(report, max_p95=20, max_error_rate=0.5) == []
+
+    failures = check_evaluation(report, max_p95=10, max_error_rate=0.25)
+    assert len(failures) == 3
+    assert any(failure.startswith("p95 latency of all commands") for failure in failures)
+    assert any(failure.startswith("p95 latency of /online") for failure in failures)
+    assert any(failure.startswith("Error rate of /online") for failure in failures)
+
+
+@pytest.mark.chatquality
+@pytest.mark.anyio
+async def test_evaluate_against_mock_khoj(mock_khoj):
+    prompts = parse_prompts(
+        [
+            '{"prompt": "What is the weather in Paris?", "command": "/online"}',
+            '{"prompt": "a lighthouse at dusk", "command": "/dream"}',
+            '{"prompt": "Summarize my notes"}',
+        ]
+        * 4
+    )
+    report = await evaluate(prompts, send_message_to_khoj_chat, parallelism=4)
+
+    assert report["prompts"] == 12
+    assert set(report["commands"]) == {"/default", "/dream", "/online"}
+    assert report["error_rate"] == 0.0
+    assert report["commands"]["/online"]["response_chars"]["p50"] > 0
+    assert check_evaluation(report, max_p95=5, max_error_rate=0) == []
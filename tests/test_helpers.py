@@ -0,0 +1,170 @@
+# Standard Packages
+import asyncio
+
+# External Packages
+import httpx
+import pytest
+
+# Internal Packages
+from flint import helpers
+from flint.constants import KHOJ_INTERRUPTED_MESSAGE, WHATSAPP_MAX_MESSAGE_LENGTH
+from flint.helpers import ParagraphBuffer, find_split, get_open_code_fence, split_message
+
+
+@pytest.mark.anyio
+async def test_streamed_paragraphs_do_not_hold_khoj_slot(mock_khoj):
+    chats_in_flight = []
+
+    async def on_paragraph(paragraph: str):
+        # Pace sends, like the outbound scheduler does
+        await asyncio.sleep(0.01)
+        chats_in_flight.append(helpers.chat_bulkhead.in_flight)
+
+    mock_khoj.response_chars = 10000
+    assert await helpers.stream_message_to_khoj_chat("Hi", "15550001111", on_paragraph) is None
+    assert len(chats_in_flight) > 1
+    assert chats_in_flight[-1] == 0
+
+
+class BrokenStream(httpx.AsyncByteStream):
+    "A response body that breaks off with a read error after the given chunks"
+
+    def __init__(self, *chunks: bytes):
+        self.chunks = chunks
+
+    async def __aiter__(self):
+        for chunk in self.chunks:
+            yield chunk
+        raise httpx.ReadError("Connection reset")
+
+
+def use_khoj_stream(monkeypatch, stream: httpx.AsyncByteStream):
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, headers={"content-type": "text/plain"}, stream=stream)
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(helpers, "khoj_client", lambda phone_number_id=None: client)
+
+
+@pytest.mark.anyio
+async def test_broken_stream_finishes_sent_reply_with_apology(monkeypatch):
+    use_khoj_stream(monkeypatch, BrokenStream(b"First paragraph.\n\nSecond", b" paragraph, cut"))
+    paragraphs = []
+
+    async def on_paragraph(paragraph: str):
+        paragraphs.append(paragraph)
+
+    assert await helpers.stream_message_to_khoj_chat("Hi", "15550001111", on_paragraph) is None
+    assert paragraphs == ["First paragraph.", "Second paragraph, cut", KHOJ_INTERRUPTED_MESSAGE]
+
+
+@pytest.mark.anyio
+async def test_broken_stream_is_retried_before_any_paragraph(monkeypatch):
+    use_khoj_stream(monkeypatch, BrokenStream(b"Unfinished first paragraph"))
+    paragraphs = []
+
+    async def on_paragraph(paragraph: str):
+        paragraphs.append(paragraph)
+
+    with pytest.raises(httpx.ReadError):
+        await helpers.stream_message_to_khoj_chat("Hi", "15550001111", on_paragraph)
+    assert paragraphs == []
+
+
+def test_split_message_keeps_short_text_whole():
+    assert split_message("  Hello there  ", limit=100) == ["Hello there"]
+    assert split_message("", limit=100) == []
+    assert split_message("   \n\n ", limit=100) == []
+
+
+def test_split_message_prefers_paragraph_boundaries():
+    first, second = "First paragraph " * 3, "Second paragraph " * 3
+    text = f"{first.strip()}\n\n{second.strip()}"
+    assert split_message(text, limit=80) == [first.strip(), second.strip()]
+
+
+def test_split_message_chunks_stay_within_limit():
+    text = " ".join(f"word{i}" for i in range(500))
+    chunks = split_message(text, limit=100)
+    assert all(len(chunk) <= 100 for chunk in chunks)
+    assert " ".join(chunks) == text
+
+
+def test_split_message_splits_oversized_word_at_limit():
+    chunks = split_message("a" * 250, limit=100)
+    assert [len(chunk) for chunk in chunks] == [96, 96, 58]
+    assert "".join(chunks) == "a" * 250
+
+
+def test_split_message_does_not_split_links():
+    link = "[the docs](https://docs.khoj.dev/get-started/setup)"
+    text = f"{'See ' * 10}{link} {'and more ' * 10}"
+    chunks = split_message(text, limit=70)
+    assert any(link in chunk for chunk in chunks)
+    assert all(len(chunk) <= 70 for chunk in chunks)
+
+    # A bare URL crossing the limit is moved to the next chunk whole
+    url = "https://example.com/" + "a" * 40
+    text = f"{'x ' * 20}{url}"
+    assert find_split(text, 60) == text.index(url) - 1
+    assert split_message(text, limit=70)[-1] == url
+
+
+def test_split_message_reopens_code_blocks_with_language():
+    code = "\n".join(f"print({i})" for i in range(30))
+    chunks = split_message(f"Run this:\n```python\n{code}\n```", limit=100)
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 100 for chunk in chunks)
+    assert all(chunk.count("```") == 2 for chunk in chunks[1:])
+    assert all(chunk.startswith("```python\n") for chunk in chunks[1:])
+    assert all(chunk.endswith("```") for chunk in chunks)
+
+
+def test_split_message_handles_fence_line_over_limit():
+    text = "Here is the query:\n\n```" + "SELECT id FROM t WHERE x = 1 AND " * 150 + "```"
+    chunks = split_message(text)
+    assert len(chunks) > 1
+    assert all(len(chunk) <= WHATSAPP_MAX_MESSAGE_LENGTH for chunk in chunks)
+    # The block is reopened with just its fence, not the whole fence line
+    assert all(chunk.startswith("```SELECT\n") for chunk in chunks[2:])
+
+
+def test_get_open_code_fence():
+    assert get_open_code_fence("text") is None
+    assert get_open_code_fence("```js\nlet a = 1") == "```js"
+    assert get_open_code_fence("```js\nlet a = 1\n```\ndone") is None
+
+
+def test_paragraph_buffer_releases_complete_paragraphs():
+    buffer = ParagraphBuffer(limit=100)
+    assert buffer.feed("First para") == []
+    assert buffer.feed("graph.\n\nSecond") == ["First paragraph."]
+    assert buffer.feed(" paragraph.") == []
+    assert buffer.flush() == ["Second paragraph."]
+    assert buffer.flush() == []
+
+
+def test_paragraph_buffer_keeps_code_blocks_together():
+    buffer = ParagraphBuffer(limit=100)
+    assert buffer.feed("Code:\n\n```python\na = 1\n\nb = 2") == ["Code:"]
+    assert buffer.feed("\n```\n\nDone") == ["```python\na = 1\n\nb = 2\n```"]
+    assert buffer.flush() == ["Done"]
+
+
+def test_paragraph_buffer_handles_fence_line_over_limit():
+    buffer = ParagraphBuffer(limit=100)
+    chunks = buffer.feed("Query:\n\n```" + "SELECT id FROM t AND " * 20)
+    chunks += buffer.feed("x```") + buffer.flush()
+    assert chunks[0] == "Query:"
+    assert len(chunks) > 2
+    assert all(len(chunk) <= 100 for chunk in chunks)
+
+
+def test_paragraph_buffer_stops_at_marker_split_across_chunks():
+    buffer = ParagraphBuffer(limit=100, stop_marker="### compiled references:")
+    assert buffer.feed("The answer.\n\nMore ### compiled") == ["The answer."]
+    assert buffer.feed(" refer") == []
+    assert buffer.feed("ences: [1] notes.org") == []
+    assert buffer.stopped
+    assert buffer.feed("\n\nIgnored") == []
+    assert buffer.flush() == ["More"]
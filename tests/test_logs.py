@@ -0,0 +1,35 @@
+# Standard Packages
+import json
+import logging
+
+# Internal Packages
+from flint.logs import JsonFormatter, LazyQueueHandler, SamplingFilter, parse_sample_rates
+
+
+def make_record(message: str, *args, **extra) -> logging.LogRecord:
+    record = logging.LogRecord("flint.test", logging.INFO, __file__, 1, message, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_json_formatter_includes_extras_but_not_colored_message():
+    record = make_record("%s connected", "client", category="status", color_message="\x1b[1m%s\x1b[0m connected")
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["message"] == "client connected"
+    assert entry["category"] == "status"
+    assert entry["level"] == "INFO"
+    assert "color_message" not in entry
+
+
+def test_lazy_queue_handler_renders_message_before_arguments_change():
+    payload = {"text": "before"}
+    record = LazyQueueHandler(None).prepare(make_record("payload: %s", payload))
+    payload["text"] = "after"
+    assert (record.msg, record.args) == ("payload: {'text': 'before'}", None)
+
+
+def test_sampling_filter_keeps_share_of_categories():
+    sampler = SamplingFilter(parse_sample_rates("status=0, request_body=1"))
+    assert not sampler.filter(make_record("delivered", category="status"))
+    assert sampler.filter(make_record("body", category="request_body"))
+    assert sampler.filter(make_record("other"))
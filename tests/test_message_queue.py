@@ -0,0 +1,174 @@
+# External Packages
+from freezegun import freeze_time
+import pytest
+
+# Internal Packages
+from flint.message_queue import Job, MessageQueue, QueueConsumers, RetryLater
+
+
+@pytest.fixture
+def make_queue(tmp_path):
+    queues = []
+
+    def make(**kwargs) -> MessageQueue:
+        queues.append(MessageQueue(str(tmp_path / f"queue-{len(queues)}.db"), **kwargs))
+        return queues[-1]
+
+    yield make
+    for queue in queues:
+        queue.close()
+
+
+@pytest.fixture
+def queue(make_queue):
+    return make_queue(visibility_timeout=60, retry_backoff=2, max_attempts=3)
+
+
+def put(queue: MessageQueue, sender: str, text: str, work_class: str = "text", priority: int = 0) -> int:
+    return queue.put_many([(sender, {"text": text}, work_class, priority)])[0]
+
+
+def claim_text(queue: MessageQueue) -> str:
+    job = queue.claim()
+    return job.payload["text"] if job else None
+
+
+def test_jobs_from_a_sender_are_claimed_in_order(queue):
+    put(queue, "alice", "a1")
+    put(queue, "alice", "a2")
+    put(queue, "bob", "b1")
+
+    first = queue.claim()
+    assert first.payload == {"text": "a1"}
+    # The next job from alice waits until her first job is done
+    assert claim_text(queue) == "b1"
+    assert queue.claim() is None
+
+    queue.ack(first)
+    assert claim_text(queue) == "a2"
+
+
+def test_more_urgent_jobs_are_claimed_first(queue):
+    put(queue, "alice", "document", "document", priority=3)
+    put(queue, "bob", "text", "text", priority=0)
+    assert [claim_text(queue), claim_text(queue)] == ["text", "document"]
+
+
+def test_job_is_claimed_again_after_visibility_timeout(queue):
+    with freeze_time("2026-01-01") as frozen:
+        put(queue, "alice", "a1")
+        job = queue.claim()
+        assert queue.claim() is None
+
+        # A live consumer extends its claim
+        frozen.tick(50)
+        queue.extend(job)
+        frozen.tick(50)
+        assert queue.claim() is None
+
+        # A crashed consumer's job becomes visible again
+        frozen.tick(11)
+        reclaimed = queue.claim()
+        assert (reclaimed.id, reclaimed.attempts) == (job.id, 2)
+
+
+def test_failed_job_is_retried_with_backoff(queue):
+    with freeze_time("2026-01-01") as frozen:
+        put(queue, "alice", "a1")
+        queue.nack(queue.claim(), "error")
+
+        # First retry waits 2 seconds, with up to 50% jitter
+        frozen.tick(0.9)
+        assert queue.claim() is None
+        frozen.tick(2.2)
+        job = queue.claim()
+        assert job.attempts == 2
+
+        # Second retry waits twice as long
+        queue.nack(job, "error")
+        frozen.tick(1.9)
+        assert queue.claim() is None
+        frozen.tick(4.2)
+        assert queue.claim().attempts == 3
+
+
+def test_job_is_dead_lettered_after_max_attempts(queue):
+    with freeze_time("2026-01-01") as frozen:
+        put(queue, "alice", "a1")
+        put(queue, "alice", "a2")
+        for _ in range(3):
+            job = queue.claim()
+            assert job.payload == {"text": "a1"}
+            queue.nack(job, "error")
+            frozen.tick(60)
+
+        stats = queue.stats()
+        assert (stats["depth"], stats["dead"]) == (1, 1)
+        # The sender's next job is no longer held up
+        assert claim_text(queue) == "a2"
+
+
+def test_claims_are_capped_by_max_in_flight(make_queue):
+    queue = make_queue(max_in_flight=1)
+    put(queue, "alice", "a1")
+    put(queue, "bob", "b1")
+
+    job = queue.claim()
+    assert queue.claim() is None
+    queue.ack(job)
+    assert claim_text(queue) == "b1"
+
+
+def test_claims_are_capped_by_class_budget(make_queue):
+    queue = make_queue(class_budgets={"image": 1, "text": 0})
+    put(queue, "alice", "dream 1", "image", priority=1)
+    put(queue, "bob", "dream 2", "image", priority=1)
+    put(queue, "carol", "hi", "text", priority=0)
+    put(queue, "dave", "hello", "text", priority=0)
+
+    assert [claim_text(queue), claim_text(queue)] == ["hi", "hello"]
+    image_job = queue.claim()
+    assert image_job.payload == {"text": "dream 1"}
+    # The image budget is used up, while text has no budget
+    put(queue, "erin", "hey", "text", priority=0)
+    assert claim_text(queue) == "hey"
+    assert queue.claim() is None
+
+    queue.ack(image_job)
+    assert claim_text(queue) == "dream 2"
+    assert queue.stats()["depth_by_class"] == {"image": 1, "text": 3}
+
+
+def test_merge_combines_queued_jobs_from_sender(queue):
+    put(queue, "alice", "a1")
+    put(queue, "alice", "a2")
+    put(queue, "alice", "a3")
+
+    job = queue.claim()
+    next_job = queue.next_from_sender(job)
+    assert next_job.payload == {"text": "a2"}
+
+    queue.merge(job, [next_job], {"text": "a1\na2"})
+    assert job.payload == {"text": "a1\na2"}
+    assert queue.next_from_sender(job).payload == {"text": "a3"}
+    assert queue.stats()["depth"] == 2
+
+    queue.ack(job)
+    assert claim_text(queue) == "a3"
+
+
+@pytest.mark.anyio
+async def test_retry_later_releases_job_without_counting_attempt(queue):
+    put(queue, "alice", "hi")
+    handled: list[Job] = []
+
+    async def handler(job: Job):
+        handled.append(job)
+        raise RetryLater(0, "stage is full")
+
+    consumers = QueueConsumers(queue, handler)
+    await consumers._process(queue.claim())
+
+    job = queue.claim()
+    assert job.payload == {"text": "hi"}
+    assert job.attempts == handled[0].attempts == 1
@@ -0,0 +1,53 @@
+# External Packages
+import httpx
+import pytest
+
+# Internal Packages
+from flint import outbound
+from flint.outbound import OutboundScheduler
+
+
+@pytest.fixture
+def graph_responses(monkeypatch) -> list[httpx.Response]:
+    "Responses the stand-in Graph API sends, in order"
+    responses: list[httpx.Response] = []
+    client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: responses.pop(0)))
+    monkeypatch.setattr(outbound, "whatsapp_client", lambda phone_number_id=None: client)
+    return responses
+
+
+def test_scheduler_needs_an_attempt():
+    with pytest.raises(ValueError):
+        OutboundScheduler(max_attempts=0)
+
+
+@pytest.mark.anyio
+async def test_send_retries_throttled_messages(graph_responses):
+    graph_responses += [
+        httpx.Response(429, headers={"Retry-After": "0"}),
+        httpx.Response(400, json={"error": {"code": 130429}}),
+        httpx.Response(200, json={"messages": [{"id": "wamid.1"}]}),
+    ]
+    scheduler = OutboundScheduler(max_attempts=3, retry_backoff=0)
+    response = await scheduler.send({"to": "15550001111"}, "1234")
+    assert response.json() == {"messages": [{"id": "wamid.1"}]}
+    assert scheduler.stats()["retried"] == 2
+    assert scheduler.stats()["sent"] == 1
+
+
+@pytest.mark.anyio
+async def test_send_gives_up_after_max_attempts(graph_responses):
+    graph_responses += [httpx.Response(503), httpx.Response(503)]
+    scheduler = OutboundScheduler(max_attempts=2, retry_backoff=0)
+    with pytest.raises(httpx.HTTPStatusError):
+        await scheduler.send({"to": "15550001111"}, "1234")
+    assert scheduler.stats()["failed"] == 1
+
+
+@pytest.mark.anyio
+async def test_send_does_not_retry_permanent_errors(graph_responses):
+    graph_responses += [httpx.Response(400, json={"error": {"code": 131030}})]
+    scheduler = OutboundScheduler(max_attempts=3, retry_backoff=0)
+    with pytest.raises(httpx.HTTPStatusError):
+        await scheduler.send({"to": "15550001111"}, "1234")
+    assert "retried" not in scheduler.stats()
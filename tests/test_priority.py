@@ -0,0 +1,63 @@
+# Standard Packages
+import time
+
+# External Packages
+import pytest
+
+# Internal Packages
+from flint.message_queue import Job
+from flint.priority import WorkClass, classify_message, make_work_classes, message_deadline
+from flint.routers import api
+
+
+def make_message(type: str, sent_at: float, **content) -> dict:
+    return {"from": "15550001111", "id": f"wamid.{type}", "timestamp": str(int(sent_at)), "type": type, **content}
+
+
+def make_job(message: dict) -> Job:
+    value = {"metadata": {"phone_number_id": "1234"}, "contacts": [{"profile": {"name": "Test"}}]}
+    return Job(1, message["from"], {"message": message, "value": value}, 1, time.time(), classify_message(message))
+
+
+def test_classify_message():
+    assert classify_message({"type": "text", "text": {"body": "Hi"}}) == "text"
+    assert classify_message({"type": "text", "text": {"body": "/dream a cat"}}) == "image"
+    assert classify_message({"type": "audio", "audio": {}}) == "audio"
+    assert classify_message({"type": "document", "document": {}}) == "document"
+
+
+def test_make_work_classes():
+    work_classes = make_work_classes(["text", "image"], "text=300,image=600", "image=4")
+    assert work_classes["text"] == WorkClass("text", 0, 300, 0)
+    assert work_classes["image"] == WorkClass("image", 1, 600, 4)
+
+
+def test_message_deadline_counts_from_when_message_was_sent():
+    work_class = WorkClass("text", 0, 300)
+    assert message_deadline({"timestamp": "1000"}, work_class, received_at=2000) == 1300
+    assert message_deadline({}, work_class, received_at=2000) == 2300
+
+
+@pytest.fixture
+def replies(monkeypatch) -> list:
+    sent = []
+
+    async def record_reply(message, to, *args, **kwargs):
+        sent.append(message)
+
+    monkeypatch.setattr(api, "response_to_user_whatsapp", record_reply)
+    return sent
+
+
+@pytest.mark.anyio
+async def test_expired_message_is_shed(replies):
+    message = make_message("text", time.time() - 3600, text={"body": "Hi"})
+    await api.handle_queued_message(make_job(message))
+    assert replies == [api.KHOJ_EXPIRED_MESSAGE]
+
+
+@pytest.mark.anyio
+async def test_expired_reaction_gets_no_reply(replies):
+    message = make_message("reaction", time.time() - 3600, reaction={"message_id": "wamid.text", "emoji": "👍"})
+    await api.handle_queued_message(make_job(message))
+    assert replies == []
@@ -0,0 +1,75 @@
+# Standard Packages
+import asyncio
+
+# External Packages
+import pytest
+
+# Internal Packages
+from flint.resilience import (
+    AdaptiveLimiter,
+    BackendBusyError,
+    Bulkhead,
+    BulkheadFullError,
+    CircuitBreaker,
+    GuardedBackend,
+)
+
+
+@pytest.mark.anyio
+async def test_bulkhead_rejects_callers_once_waiting_limit_is_reached():
+    bulkhead = Bulkhead("upload", limit=1, max_waiting=1)
+    release = asyncio.Event()
+
+    async def work():
+        async with bulkhead.slot():
+            await release.wait()
+
+    tasks = [asyncio.create_task(work()) for _ in range(2)]
+    await asyncio.sleep(0)
+    assert bulkhead.stats() == {"limit": 1, "in_flight": 1, "waiting": 1, "rejected": 0}
+
+    with pytest.raises(BulkheadFullError):
+        async with bulkhead.slot():
+            pass
+    assert issubclass(BulkheadFullError, BackendBusyError)
+    assert bulkhead.rejected == 1
+
+    release.set()
+    await asyncio.gather(*tasks)
+    assert bulkhead.stats()["in_flight"] == 0
+
+
+def test_limiter_is_not_reduced_by_long_but_usual_latency():
+    limiter = AdaptiveLimiter(initial_limit=16, min_limit=2, max_limit=128, latency_tolerance=2)
+    for latency in [20, 40, 25, 35, 30] * 20:
+        limiter._adapt(latency, ok=True)
+    assert limiter.limit > 16
+
+
+def test_limiter_is_reduced_when_latency_rises_over_baseline():
+    limiter = AdaptiveLimiter(initial_limit=16, min_limit=2, max_limit=128, latency_tolerance=2)
+    for _ in range(50):
+        limiter._adapt(2.0, ok=True)
+    limit = limiter.limit
+    for _ in range(20):
+        limiter._adapt(20.0, ok=True)
+    assert limiter.limit < limit
+    assert limiter.stats()["recent_latency"] > 2 * limiter.stats()["baseline_latency"]
+
+
+def test_limiter_is_reduced_on_failure():
+    limiter = AdaptiveLimiter(initial_limit=10, min_limit=2, max_limit=128)
+    limiter._adapt(0.1, ok=False)
+    assert limiter.limit == 7
+
+
+@pytest.mark.anyio
+async def test_guarded_backend_measures_latency_to_first_byte():
+    limiter = AdaptiveLimiter(initial_limit=4, min_limit=1, max_limit=8)
+    backend = GuardedBackend("khoj", limiter, CircuitBreaker(0.5, min_requests=5, window=60, cooldown=10))
+    async with backend.request() as outcome:
+        outcome.first_byte()
+        # Streaming the rest of the response does not count
+        await asyncio.sleep(0.1)
+    assert limiter.baseline_latency < 0.05
+    assert backend.stats()["in_flight"] == 0
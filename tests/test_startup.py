@@ -0,0 +1,26 @@
+# Standard Packages
+from pathlib import Path
+
+# Internal Packages
+import flint
+from flint.bench.startup import check_startup, measure_startup
+
+
+def test_worker_startup_does_not_import_lazy_modules(monkeypatch):
+    # Import the app in the probe from the same source tree as the tests, even when flint is not installed
+    monkeypatch.chdir(Path(flint.__file__).parents[1])
+    report = measure_startup(runs=1)
+    assert report["lazy_modules_loaded"] == []
+    assert check_startup(report, max_seconds=None, max_rss_mb=None) == []
+
+
+def test_check_startup_reports_exceeded_budgets():
+    report = {
+        "import_seconds": {"min": 0.5, "median": 0.6, "max": 0.9},
+        "max_rss_mb": 80.0,
+        "lazy_modules_loaded": ["PIL.Image"],
+    }
+    assert check_startup(report, max_seconds=1, max_rss_mb=100) == [
+        "Modules that should load lazily were imported: PIL.Image"
+    ]
+    assert len(check_startup({**report, "lazy_modules_loaded": []}, max_seconds=0.5, max_rss_mb=64)) == 2
@@ -0,0 +1,55 @@
+# External Packages
+from freezegun import freeze_time
+import pytest
+
+# Internal Packages
+from flint.store import TTLCache, TTLStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    ttl_store = TTLStore(str(tmp_path / "store.db"), default_ttl=60)
+    yield ttl_store
+    ttl_store.close()
+
+
+def test_add_many_only_adds_new_keys(store):
+    assert store.add_many(["a", "b"]) == [True, True]
+    assert store.add_many(["b", "c", "c"]) == [False, True, False]
+
+
+def test_add_many_re_adds_expired_keys(store):
+    with freeze_time("2026-01-01") as frozen:
+        assert store.add_many(["a"]) == [True]
+        store.add_many(["b"], ttl=120)
+        frozen.tick(61)
+        assert store.add_many(["a", "b"]) == [True, False]
+
+
+def test_values_expire(store):
+    with freeze_time("2026-01-01") as frozen:
+        store.set("media", {"url": "https://example.com"}, ttl=10)
+        assert store.get("media") == {"url": "https://example.com"}
+        frozen.tick(11)
+        assert store.get("media", "missing") == "missing"
+        assert store.evict_expired() == 1
+
+
+def test_delete_many_forgets_keys(store):
+    store.add_many(["a", "b"])
+    store.delete_many(["a"])
+    assert store.add_many(["a", "b"]) == [True, False]
+
+
+def test_cache_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2, default_ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == (1, None, 3)
+
+
+def test_eviction_uses_expiry_index(store):
+    plan = store._db.execute("EXPLAIN QUERY PLAN DELETE FROM entries WHERE expires_at <= ?", (0,)).fetchall()
+    assert "entries_expires" in repr(plan)
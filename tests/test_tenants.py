@@ -0,0 +1,86 @@
+# Standard Packages
+import json
+
+# External Packages
+import pytest
+
+# Internal Packages
+from flint import clients, outbound
+from flint.outbound import OutboundScheduler
+from flint.tenants import Tenant, TenantRegistry
+
+
+DEFAULT = Tenant(
+    phone_number_id="default",
+    whatsapp_token="default-token",
+    khoj_client_id="default-client",
+    khoj_client_secret="default-secret",
+    send_rate=20,
+    send_burst=20,
+)
+
+
+def write_tenants(tmp_path, settings_by_number: dict) -> str:
+    path = tmp_path / "tenants.json"
+    path.write_text(json.dumps(settings_by_number))
+    return str(path)
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch) -> TenantRegistry:
+    "Serve two business numbers with their own credentials and send rates, with fresh shared clients"
+    path = write_tenants(
+        tmp_path,
+        {
+            "1111": {"whatsapp_token": "token-1", "khoj_client_secret": "secret-1", "send_rate": 5, "send_burst": 5},
+            "2222": {"whatsapp_token": "token-2", "khoj_client_secret": "secret-2", "send_rate": 50},
+        },
+    )
+    registry = TenantRegistry.load(path, default=DEFAULT)
+    monkeypatch.setattr(clients, "tenants", registry)
+    monkeypatch.setattr(outbound, "tenants", registry)
+    monkeypatch.setattr(clients, "_http_clients", {})
+    return registry
+
+
+def test_registry_without_file_has_only_the_default_tenant():
+    registry = TenantRegistry.load(None, default=DEFAULT)
+    assert registry.get("1111") is DEFAULT
+    assert registry.get() is DEFAULT
+
+
+def test_unknown_tenant_settings_are_rejected(tmp_path):
+    path = write_tenants(tmp_path, {"1111": {"whatsapp_token": "token-1", "send_rte": 5}})
+    with pytest.raises(ValueError, match="send_rte"):
+        TenantRegistry.load(path, default=DEFAULT)
+
+
+def test_missing_tenant_settings_fall_back_to_default(registry):
+    tenant = registry.get("2222")
+    assert tenant.phone_number_id == "2222"
+    assert (tenant.whatsapp_token, tenant.send_rate) == ("token-2", 50)
+    assert (tenant.khoj_client_id, tenant.send_burst) == (DEFAULT.khoj_client_id, DEFAULT.send_burst)
+    # Numbers without a tenant of their own use the default tenant
+    assert registry.get("3333") is DEFAULT
+
+
+def test_tenants_get_their_own_clients(registry):
+    first, second = clients.whatsapp_client("1111"), clients.whatsapp_client("2222")
+    assert first is not second
+    assert first is clients.whatsapp_client("1111")
+    assert first.headers["Authorization"] == "Bearer token-1"
+    assert second.headers["Authorization"] == "Bearer token-2"
+    assert clients.whatsapp_client("3333").headers["Authorization"] == "Bearer default-token"
+
+    assert clients.khoj_client("1111") is not clients.khoj_client("2222")
+    assert clients.khoj_client("1111").headers["Authorization"] == "Bearer secret-1"
+    assert clients.khoj_client("2222").headers["Authorization"] == "Bearer secret-2"
+
+
+def test_tenants_get_their_own_send_buckets(registry):
+    scheduler = OutboundScheduler()
+    first, second = scheduler._bucket("1111"), scheduler._bucket("2222")
+    assert first is not second
+    assert (first.rate, first.burst) == (5, 5)
+    assert (second.rate, second.burst) == (50, DEFAULT.send_burst)
+    assert scheduler._bucket("3333").rate == DEFAULT.send_rate
@@ -0,0 +1,130 @@
+# Standard Packages
+import hashlib
+import hmac
+import json
+import uuid
+
+# External Packages
+import httpx
+import pytest
+
+# Internal Packages
+from flint.main import app
+from flint.record import WebhookRecorder
+from flint.routers import api
+
+
+APP_SECRET = "test-app-secret"
+
+STATUS_UPDATE = {
+    "object": "whatsapp_business_account",
+    "entry": [
+        {
+            "id": "1234",
+            "changes": [
+                {
+                    "value": {
+                        "messaging_product": "whatsapp",
+                        "metadata": {"phone_number_id": "1234"},
+                        "statuses": [{"id": "wamid.1", "status": "delivered", "recipient_id": "15550001111"}],
+                    },
+                    "field": "messages",
+                }
+            ],
+        }
+    ],
+}
+
+
+def make_text_webhook(text: str) -> dict:
+    message = {"from": "15550001111", "id": f"wamid.{uuid.uuid4()}", "timestamp": "1700000000", "type": "text"}
+    value = {"metadata": {"phone_number_id": "1234"}, "messages": [{**message, "text": {"body": text}}]}
+    return {"object": "whatsapp_business_account", "entry": [{"changes": [{"value": value, "field": "messages"}]}]}
+
+
+def sign(body: bytes, secret: str = APP_SECRET) -> str:
+    return "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+@pytest.fixture
+async def client(monkeypatch):
+    monkeypatch.setattr(api, "app_secret", APP_SECRET)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://flint") as client:
+        yield client
+
+
+async def post_webhook(client: httpx.AsyncClient, body: bytes, signature: str = None) -> httpx.Response:
+    headers = {"Content-Type": "application/json"}
+    if signature:
+        headers["X-Hub-Signature-256"] = signature
+    return await client.post("/api/whatsapp_chat", content=body, headers=headers)
+
+
+@pytest.mark.anyio
+async def test_signed_status_update_is_acknowledged(client):
+    body = json.dumps(STATUS_UPDATE).encode()
+    response = await post_webhook(client, body, sign(body))
+    assert response.status_code == 200
+
+
+@pytest.mark.anyio
+async def test_status_update_is_not_parsed(client, monkeypatch):
+    def fail(raw_body):
+        raise AssertionError("Webhook body was parsed")
+
+    monkeypatch.setattr(api, "parse_json", fail)
+    body = json.dumps(STATUS_UPDATE).encode()
+    response = await post_webhook(client, body, sign(body))
+    assert response.status_code == 200
+
+    # Messages are still parsed, whatever the spacing of the JSON
+    for separators in ((", ", ": "), (",", ":")):
+        body = json.dumps(make_text_webhook("Hi"), separators=separators).encode()
+        with pytest.raises(AssertionError, match="parsed"):
+            await post_webhook(client, body, sign(body))
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize(
+    "signature",
+    [None, "", "md5=abc", "sha256=" + "0" * 64, sign(b"{}"), sign(json.dumps(STATUS_UPDATE).encode(), "other")],
+)
+async def test_missing_or_bad_signature_is_rejected(client, signature):
+    response = await post_webhook(client, json.dumps(STATUS_UPDATE).encode(), signature)
+    assert response.status_code == 403
+
+
+@pytest.mark.anyio
+async def test_signature_is_not_checked_without_app_secret(client, monkeypatch):
+    monkeypatch.setattr(api, "app_secret", None)
+    response = await post_webhook(client, json.dumps(STATUS_UPDATE).encode())
+    assert response.status_code == 200
+
+
+@pytest.mark.anyio
+async def test_malformed_json_is_rejected(client):
+    body = b'{"object": "whatsapp_business_account", "messages": ['
+    response = await post_webhook(client, body, sign(body))
+    assert response.status_code == 400
+
+
+@pytest.mark.anyio
+async def test_message_is_queued_once(client):
+    body = json.dumps(make_text_webhook("Hi")).encode()
+    depth = api.message_queue.stats()["depth_by_class"].get("text", 0)
+
+    for _ in range(2):
+        response = await post_webhook(client, body, sign(body))
+        assert response.status_code == 200
+    assert api.message_queue.stats()["depth_by_class"]["text"] == depth + 1
+
+
+def test_recorder_appends_webhook_bodies(tmp_path):
+    recorder = WebhookRecorder(str(tmp_path / "webhooks" / "recorded.jsonl"))
+    recorder.record(json.dumps(STATUS_UPDATE).encode())
+    recorder.record(b"not json")
+    recorder.record(b"{}")
+
+    with open(recorder.path) as f:
+        entries = [json.loads(line) for line in f]
+    assert [entry["body"] for entry in entries] == [STATUS_UPDATE, {}]